@@ -6,7 +6,9 @@
 
 import asyncio
 import base64
+import collections
 import errno
+import hashlib
 from lockfile import LockFile
 import logging
 try:
@@ -28,6 +30,7 @@ import tempfile
 import textwrap
 import time
 import enum
+import itertools
 
 from functools import partial
 
@@ -418,21 +421,44 @@ class FailoverService(ConfigService):
         # Journal thread will see that this is special value and will clear journal.
         sql_queue.put(None)
 
-        self.send_small_file(FREENAS_DATABASE, FREENAS_DATABASE + '.sync')
+        # Database file alone may not contain the latest changes which are still in the WAL
+        with tempfile.NamedTemporaryFile() as f:
+            os.chmod(f.name, os.stat(FREENAS_DATABASE).st_mode)
+            self.middleware.call_sync('datastore.backup', f.name)
+            self.send_small_file(f.name, FREENAS_DATABASE + '.sync')
         self.middleware.call_sync('failover.call_remote', 'failover.receive_database')
 
     @private
     def receive_database(self):
-        os.rename(FREENAS_DATABASE + '.sync', FREENAS_DATABASE)
-        self.middleware.call_sync('datastore.setup')
+        self.middleware.call_sync('datastore.replace', FREENAS_DATABASE + '.sync')
 
     @private
     def send_small_file(self, path, dest=None):
+        """
+        Send file `path` to `dest` (defaults to `path`) on the other controller unless it already has identical file.
+        """
         if dest is None:
             dest = path
         if not os.path.exists(path):
             return
-        mode = os.stat(path).st_mode
+        local = self.file_checksum(path)
+        try:
+            remote = self.middleware.call_sync('failover.call_remote', 'failover.file_checksum', [dest])
+        except CallError as e:
+            if e.errno == CallError.ENOMETHOD:
+                # Other controller runs an older version (i.e. during an upgrade) that has neither
+                # `failover.file_checksum` nor `failover.receive_file`
+                self._send_small_file_legacy(path, dest, local['mode'])
+                return
+            raise
+
+        if remote == local:
+            return
+
+        token = self.middleware.call_sync('failover.call_remote', 'auth.generate_token')
+        self.middleware.call_sync('failover.sendfile', token, path, dest, 'failover.receive_file', [dest, local])
+
+    def _send_small_file_legacy(self, path, dest, mode):
         with open(path, 'rb') as f:
             first = True
             while True:
@@ -444,6 +470,58 @@ class FailoverService(ConfigService):
                 ])
                 first = False
 
+    @private
+    def file_checksum(self, path):
+        """
+        SHA-256 checksum and mode of file `path` or `None` if it does not exist.
+        """
+        try:
+            with open(path, 'rb') as f:
+                sha256 = hashlib.sha256()
+                for chunk in iter(partial(f.read, 1024 * 1024), b''):
+                    sha256.update(chunk)
+                mode = os.fstat(f.fileno()).st_mode
+        except FileNotFoundError:
+            return None
+
+        return {'checksum': sha256.hexdigest(), 'mode': mode}
+
+    @private
+    @accepts(
+        Str('path'),
+        Dict(
+            'options',
+            Str('checksum', required=True),
+            Int('mode', required=True),
+        ),
+    )
+    @job(pipes=['input'])
+    def receive_file(self, job, path, options):
+        """
+        Receive file sent by `failover.send_small_file`. It is written to a temporary file that replaces `path` only
+        if its checksum matches.
+        """
+        dirname = os.path.dirname(path)
+        os.makedirs(dirname, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=dirname, prefix=f'.{os.path.basename(path)}.', delete=False) as f:
+            try:
+                sha256 = hashlib.sha256()
+                for chunk in iter(partial(job.pipes.input.r.read, 1024 * 1024), b''):
+                    sha256.update(chunk)
+                    f.write(chunk)
+
+                if sha256.hexdigest() != options['checksum']:
+                    raise CallError(f'Checksum mismatch for received file {path}')
+
+                f.flush()
+                os.fsync(f.fileno())
+                os.fchmod(f.fileno(), options['mode'])
+            except Exception:
+                os.unlink(f.name)
+                raise
+
+        os.rename(f.name, path)
+
     @no_auth_required
     @throttle(seconds=2, condition=throttle_condition)
     @accepts()
@@ -1175,56 +1253,172 @@ sql_queue = queue.Queue()
 
 
 class Journal:
-    path = '/data/ha-journal'
+    """
+    Queries that were not yet replicated to the other controller.
 
-    def __init__(self):
-        self.journal = []
+    Journal is stored in an append-only log of pickled `(seq, item)` records. `checkpoint_path` holds the sequence
+    number of the last record that was replicated so flushing the journal does not require rewriting the log. The log
+    is truncated once everything is replicated and compacted when it consists mostly of replicated records.
+    """
+
+    path = '/data/ha-journal'
+    compact_threshold = 10000
+
+    def __init__(self, path=None):
+        if path is not None:
+            self.path = path
+        self.checkpoint_path = f'{self.path}.checkpoint'
+
+        self.journal = collections.deque()
+        self.seq = 0
+        # Number of records in the log and sequence number of the last one
+        self.log_records = 0
+        self.log_seq = 0
+        self.rewrite_log = False
         if os.path.exists(self.path):
             try:
-                with open(self.path, 'rb') as f:
-                    self.journal = pickle.load(f)
+                self._read()
             except Exception:
                 logger.warning('Failed to read journal', exc_info=True)
+                self.journal.clear()
+                self.rewrite_log = True
 
-        self.persisted_journal = self.journal.copy()
+        self.persisted_state = self._state()
 
     def __bool__(self):
         return bool(self.journal)
 
     def __iter__(self):
-        for query, params in self.journal:
+        for seq, (query, params) in self.journal:
             yield query, params
 
     def __len__(self):
         return len(self.journal)
 
     def peek(self):
-        return self.journal[0]
+        return self.journal[0][1]
+
+    def peek_many(self, count):
+        """
+        Return first items of the journal containing `count` queries in total (at least one item is returned).
+        """
+        items = []
+        queries = 0
+        for seq, item in self.journal:
+            query, params = item
+            queries += len(query) if isinstance(query, list) else 1
+            if items and queries > count:
+                break
+
+            items.append(item)
+
+        return items
 
-    def shift(self):
-        self.journal = self.journal[1:]
+    def shift(self, count=1):
+        for i in range(count):
+            self.journal.popleft()
 
     def append(self, item):
-        self.journal.append(item)
+        self.seq += 1
+        self.journal.append((self.seq, item))
 
     def clear(self):
-        self.journal = []
+        self.journal.clear()
 
     def write(self):
-        if self.persisted_journal != self.journal:
+        if self.persisted_state != self._state() or self.rewrite_log:
             self._write()
-            self.persisted_journal = self.journal.copy()
+            self.persisted_state = self._state()
+
+    def _state(self):
+        if not self.journal:
+            return None
+
+        return self.journal[0][0], self.journal[-1][0]
+
+    def _read(self):
+        checkpoint = 0
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                checkpoint = int(f.read().strip())
+
+        with open(self.path, 'rb') as f:
+            while True:
+                try:
+                    record = pickle.load(f)
+                except EOFError:
+                    break
+                except Exception:
+                    # Last record was not completely written
+                    logger.warning('Journal is truncated after record %d', self.log_seq, exc_info=True)
+                    self.rewrite_log = True
+                    break
+
+                if isinstance(record, list):
+                    # Journal written by the previous version is a single pickled list
+                    for item in record:
+                        self.append(tuple(item))
+                    self.rewrite_log = True
+                    return
+
+                seq, item = record
+                self.log_records += 1
+                self.log_seq = seq
+                if seq > checkpoint:
+                    self.journal.append((seq, item))
+
+        # Sequence numbers up to the checkpoint must not be reused even if the log is empty
+        self.seq = max(self.seq, self.log_seq, checkpoint)
 
     def _write(self):
-        tmp_file = f'{self.path}.tmp'
+        if not self.journal:
+            # Everything was replicated
+            with open(self.path, 'wb'):
+                pass
+            self._write_checkpoint(self.seq)
+            self.log_records = 0
+            self.log_seq = self.seq
+            self.rewrite_log = False
+            return
+
+        if self.rewrite_log or (
+            self.log_records > self.compact_threshold and self.log_records > 2 * len(self.journal)
+        ):
+            tmp_file = f'{self.path}.tmp'
+            with open(tmp_file, 'wb') as f:
+                for record in self.journal:
+                    pickle.dump(record, f)
+            self._write_checkpoint(self.journal[0][0] - 1)
+            os.rename(tmp_file, self.path)
+            self.log_records = len(self.journal)
+            self.log_seq = self.journal[-1][0]
+            self.rewrite_log = False
+            return
+
+        # Checkpoint is written first so records that were already replicated are never replayed again
+        self._write_checkpoint(self.journal[0][0] - 1)
 
-        with open(tmp_file, 'wb') as f:
-            pickle.dump(self.journal, f)
+        new_records = min(len(self.journal), self.journal[-1][0] - self.log_seq)
+        if new_records > 0:
+            with open(self.path, 'ab') as f:
+                for record in itertools.islice(self.journal, len(self.journal) - new_records, None):
+                    pickle.dump(record, f)
+            self.log_records += new_records
+            self.log_seq = self.journal[-1][0]
 
-        os.rename(tmp_file, self.path)
+    def _write_checkpoint(self, seq):
+        tmp_file = f'{self.checkpoint_path}.tmp'
+
+        with open(tmp_file, 'w') as f:
+            f.write(str(seq))
+
+        os.rename(tmp_file, self.checkpoint_path)
 
 
 class JournalSync:
+    # Maximum number of queries replayed on the other node in a single call (and transaction)
+    batch_size = 1000
+
     def __init__(self, middleware, sql_queue, journal):
         self.middleware = middleware
         self.sql_queue = sql_queue
@@ -1234,6 +1428,8 @@ class JournalSync:
         self._update_failover_status()
 
         self.last_query_failed = False  # this only affects logging
+        # Other controller runs an older version (i.e. during an upgrade) that does not have `datastore.sql_many`
+        self.legacy_peer = False
 
     def process(self):
         if self.failover_status != 'MASTER':
@@ -1277,16 +1473,27 @@ class JournalSync:
 
     def _flush_journal(self):
         while self.journal:
-            query, params = self.journal.peek()
+            # Queries are replayed one by one on a legacy peer, only send one journal entry at a time so that
+            # a failure does not replay the entries that were already applied again
+            items = self.journal.peek_many(1 if self.legacy_peer else self.batch_size)
+
+            queries = []
+            for query, params in items:
+                if isinstance(query, list):
+                    queries.extend(query)
+                else:
+                    queries.append((query, params))
 
             try:
-                self.middleware.call_sync('failover.call_remote', 'datastore.sql', [query, params])
+                self._replay(queries)
             except Exception as e:
                 if isinstance(e, CallError) and e.errno in [errno.ECONNREFUSED, errno.ECONNRESET]:
                     logger.trace('Skipping journal sync, node down')
+                    # Other controller might come back upgraded
+                    self.legacy_peer = False
                 else:
                     if not self.last_query_failed:
-                        logger.exception('Failed to run query %s: %r', query, e)
+                        logger.exception('Failed to run queries %s: %r', [query for query, params in queries], e)
                         self.last_query_failed = True
 
                     self.middleware.call_sync('alert.oneshot_create', 'FailoverSyncFailed', None)
@@ -1297,10 +1504,26 @@ class JournalSync:
 
                 self.middleware.call_sync('alert.oneshot_delete', 'FailoverSyncFailed', None)
 
-                self.journal.shift()
+                self.journal.shift(len(items))
+                # Persist the progress so a large backlog is not replayed again if we are interrupted
+                self.journal.write()
 
         return True
 
+    def _replay(self, queries):
+        if not self.legacy_peer:
+            try:
+                self.middleware.call_sync('failover.call_remote', 'datastore.sql_many', [queries])
+                return
+            except CallError as e:
+                if e.errno != CallError.ENOMETHOD:
+                    raise
+
+            self.legacy_peer = True
+
+        for query, params in queries:
+            self.middleware.call_sync('failover.call_remote', 'datastore.sql', [query, params])
+
     def _consume_queue_nonblocking(self):
         while True:
             try:
@@ -1325,8 +1548,16 @@ class JournalSync:
         self.failover_status = self.middleware.call_sync('failover.status')
 
 
-def hook_datastore_execute_write(middleware, sql, params):
-    sql_queue.put((sql, params))
+def hook_datastore_execute_write(middleware, sql, params, replicate=True):
+    if replicate:
+        sql_queue.put((sql, params))
+
+
+def hook_datastore_execute_write_many(middleware, queries, replicate=True):
+    # Journal replayed from the other controller must not be journaled again
+    if replicate:
+        # A single journal entry, the whole transaction is replayed at once
+        sql_queue.put((queries, None))
 
 
 async def journal_ha(middleware):
@@ -1713,6 +1944,7 @@ async def setup(middleware):
     middleware.event_subscribe('system', _event_system_ready)
     middleware.register_hook('core.on_connect', ha_permission, sync=True)
     middleware.register_hook('datastore.post_execute_write', hook_datastore_execute_write, inline=True)
+    middleware.register_hook('datastore.post_execute_write_many', hook_datastore_execute_write_many, inline=True)
     middleware.register_hook('pool.post_change_passphrase', hook_pool_change_passphrase, sync=False)
     middleware.register_hook('interface.pre_sync', interface_pre_sync_hook, sync=True)
     middleware.register_hook('interface.post_sync', hook_setup_ha, sync=True)
@@ -5,7 +5,7 @@
 # without the express permission of iXsystems.
 from middlewared.client import Client, ClientException, CallTimeout
 from middlewared.schema import accepts, Any, Bool, Dict, Int, List, Str
-from middlewared.service import CallError, Service, job, private
+from middlewared.service import CallError, Service, private
 from middlewared.utils import start_daemon_thread
 from middlewared.utils.osc import set_thread_name
 
@@ -18,10 +18,30 @@ import requests
 import socket
 import threading
 import time
+import uuid
 
 logger = logging.getLogger('failover.remote')
 
 
+def multipart_stream(boundary, data, f):
+    """
+    Generate `multipart/form-data` body with `data` and `file` parts as expected by `/_upload/` endpoint reading the
+    contents of the file from `f`.
+    """
+    yield (
+        f'--{boundary}\r\n'
+        'Content-Disposition: form-data; name="data"\r\n'
+        '\r\n'
+        f'{data}\r\n'
+        f'--{boundary}\r\n'
+        'Content-Disposition: form-data; name="file"; filename="file"\r\n'
+        'Content-Type: application/octet-stream\r\n'
+        '\r\n'
+    ).encode()
+    yield from iter(partial(f.read, 1024 * 1024), b'')
+    yield f'\r\n--{boundary}--\r\n'.encode()
+
+
 class RemoteClient(object):
 
     def __init__(self):
@@ -142,37 +162,34 @@ class RemoteClient(object):
             except Exception:
                 logger.warning('Failed to run callback for %s', name, exc_info=True)
 
-    def sendfile(self, token, local_path, remote_path):
-        r = requests.post(
-            f'http://{self.remote_ip}:6000/_upload/',
-            files=[
-                ('data', json.dumps({
-                    'method': 'filesystem.put',
-                    'params': [remote_path],
-                })),
-                ('file', open(local_path, 'rb')),
-            ],
-            headers={
-                'Authorization': f'Token {token}',
-            },
-        )
+    def sendfile(self, token, local_path, remote_path, method='filesystem.put', params=None):
+        """
+        Stream `local_path` to the other node, it is received by `method` job (`filesystem.put` by default) that reads
+        the contents from its input pipe.
+        """
+        boundary = uuid.uuid4().hex
+        data = json.dumps({
+            'method': method,
+            'params': params if params is not None else [remote_path],
+        })
+        with open(local_path, 'rb') as f:
+            # `requests` would build the whole multipart body in memory, send it in chunks instead
+            r = requests.post(
+                f'http://{self.remote_ip}:6000/_upload/',
+                data=multipart_stream(boundary, data, f),
+                headers={
+                    'Authorization': f'Token {token}',
+                    'Content-Type': f'multipart/form-data; boundary={boundary}',
+                },
+            )
+        if r.status_code != 200:
+            raise CallError(f'Failed to send {local_path} to Standby Controller: {r.text}.')
+
         job_id = r.json()['job_id']
-        # TODO: use event subscription in the client instead of polling
-        while True:
-            rjob = self.client.call('core.get_jobs', [('id', '=', job_id)])
-            if rjob:
-                rjob = rjob[0]
-                if rjob['state'] == 'FAILED':
-                    raise CallError(
-                        f'Failed to send {local_path} to Standby Controller: {job["error"]}.'
-                    )
-                elif rjob['state'] == 'ABORTED':
-                    raise CallError(
-                        f'Failed to send {local_path} to Standby Controller, job aborted by user.'
-                    )
-                elif rjob['state'] == 'SUCCESS':
-                    break
-            time.sleep(0.5)
+        try:
+            self.call('core.job_wait', job_id, job=True)
+        except CallError as e:
+            raise CallError(f'Failed to send {local_path} to Standby Controller: {e.errmsg}.')
 
 
 class FailoverService(Service):
@@ -215,8 +232,8 @@ class FailoverService(Service):
             raise CallError('Call timeout', errno.ETIMEDOUT)
 
     @private
-    def sendfile(self, token, src, dst):
-        self.CLIENT.sendfile(token, src, dst)
+    def sendfile(self, token, src, dst, method='filesystem.put', params=None):
+        self.CLIENT.sendfile(token, src, dst, method, params)
 
     @private
     async def ensure_remote_client(self):
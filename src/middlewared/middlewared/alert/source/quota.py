@@ -35,7 +35,7 @@ class QuotaAlertSource(ThreadedAlertSource):
     def check_sync(self):
         alerts = []
 
-        datasets = self.middleware.call_sync("zfs.dataset.query_for_quota_alert")
+        datasets = self.middleware.call_sync("alert.cached_call", "zfs.dataset.query_for_quota_alert")
 
         for d in datasets:
             d["name"] = d["name"]["rawvalue"]
@@ -15,7 +15,7 @@ class ScrubPausedAlertSource(ThreadedAlertSource):
 
     async def check(self):
         alerts = []
-        for pool in await self.middleware.call("pool.query"):
+        for pool in await self.middleware.call("alert.cached_call", "pool.query"):
             if pool["scan"] is not None:
                 if pool["scan"]["pause"] is not None:
                     if pool["scan"]["pause"] < datetime.now() - timedelta(hours=8):
@@ -16,7 +16,7 @@ class VolumeStatusAlertSource(AlertSource):
             return
 
         alerts = []
-        for pool in await self.middleware.call("pool.query"):
+        for pool in await self.middleware.call("alert.cached_call", "pool.query"):
             if not pool["is_decrypted"]:
                 continue
 
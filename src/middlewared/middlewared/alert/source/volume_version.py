@@ -33,7 +33,7 @@ class VolumeVersionAlertSource(ThreadedAlertSource):
 
     def check_sync(self):
         alerts = []
-        for pool in self.middleware.call_sync("pool.query"):
+        for pool in self.middleware.call_sync("alert.cached_call", "pool.query"):
             if not self.middleware.call_sync('pool.is_upgraded', pool["id"]):
                 alerts.append(Alert(
                     VolumeVersionAlertClass,
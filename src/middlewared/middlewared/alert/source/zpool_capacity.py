@@ -32,7 +32,7 @@ class ZpoolCapacityAlertSource(ThreadedAlertSource):
         alerts = []
         pools = [
             pool["name"]
-            for pool in self.middleware.call_sync("pool.query")
+            for pool in self.middleware.call_sync("alert.cached_call", "pool.query")
         ] + [self.middleware.call_sync("boot.pool_name")]
         for pool in pools:
             proc = subprocess.Popen([
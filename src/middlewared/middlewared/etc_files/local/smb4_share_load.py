@@ -1,21 +1,20 @@
 import logging
 
-from middlewared.utils import run
-from middlewared.plugins.smb import SMBCmd, SMBPath
+from middlewared.plugins.smb import SMBPath
 
 logger = logging.getLogger(__name__)
 
 
 async def reload_registry_shares(middleware):
-    drop = await run([SMBCmd.NET.value, 'conf', 'drop'], check=False)
-    if drop.returncode != 0:
-        middleware.logger.debug('failed to drop existing share config: %s',
-                                drop.stderr.decode())
-    load = await run([SMBCmd.NET.value, 'conf', 'import',
-                     SMBPath.SHARECONF.platform()], check=False)
-    if load.returncode != 0:
-        middleware.logger.debug('failed to load share config: %s',
-                                load.stderr.decode())
+    try:
+        diff = await middleware.call('sharing.smb.sync_registry', SMBPath.SHARECONF.platform())
+    except Exception:
+        middleware.logger.debug('failed to load share config', exc_info=True)
+        return
+
+    if diff['removed'] or diff['changed']:
+        middleware.logger.debug('Synced share config: removed %r, changed %r',
+                                diff['removed'], diff['changed'])
 
 
 async def render(service, middleware):
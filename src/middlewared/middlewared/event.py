@@ -40,6 +40,13 @@ class EventSource(object):
     def send_event(self, etype, **kwargs):
         self.app.send_event(self.name, etype, **kwargs)
 
+    def send_event_data(self, data):
+        """
+        Send event that was already serialized with `middlewared.main.event_message` (e.g. the same event shared by
+        many subscribers).
+        """
+        self.app._send_event(data)
+
     def process(self):
         try:
             self.run()
@@ -10,12 +10,14 @@ from .service_exception import adapt_exception, CallError, CallException, Valida
 from .utils import osc, start_daemon_thread, sw_version, LoadPluginsMixin
 from .utils.debug import get_frame_details, get_threads_stacks
 from .utils.lock import SoftHardSemaphore, SoftHardSemaphoreLimit
+from .utils.procpool import ProcessPool
 from .utils.io_thread_pool_executor import IoThreadPoolExecutor
 from .utils.profile import profile_wrap
 from .utils.run_in_thread import RunInThreadMixin
+from .utils.send_queue import SendQueue
 from .utils.service.call import ServiceCallMixin
 from .webui_auth import WebUIAuth
-from .worker import main_worker, worker_init
+from .worker import cleanup_results, load_result, main_worker, worker_init, ResultFile
 from aiohttp import web
 from aiohttp.web_exceptions import HTTPPermanentRedirect
 from aiohttp.web_middlewares import normalize_path_middleware
@@ -27,7 +29,6 @@ import asyncio
 import binascii
 from collections import namedtuple
 import concurrent.futures
-import concurrent.futures.process
 import concurrent.futures.thread
 import errno
 import fcntl
@@ -58,6 +59,35 @@ if osc.IS_LINUX:
     from systemd.daemon import notify as systemd_notify
 
 
+def event_message(name, event_type, kwargs):
+    event = {
+        'msg': event_type.lower(),
+        'collection': name,
+    }
+    kwargs = kwargs.copy()
+    if 'id' in kwargs:
+        event['id'] = kwargs.pop('id')
+    if event_type in ('ADDED', 'CHANGED'):
+        if 'fields' in kwargs:
+            event['fields'] = kwargs.pop('fields')
+    if event_type == 'CHANGED':
+        if 'cleared' in kwargs:
+            event['cleared'] = kwargs.pop('cleared')
+    if kwargs:
+        event['extra'] = kwargs
+    return event
+
+
+def event_coalesce_key(event):
+    # A newer `CHANGED` event for the same object supersedes a pending one unless it only carries the difference
+    if event['msg'] == 'changed' and 'id' in event and 'cleared' not in event:
+        try:
+            hash(event['id'])
+        except TypeError:
+            return None
+        return event['collection'], event['id']
+
+
 class Application(object):
 
     def __init__(self, middleware, loop, request, response):
@@ -87,12 +117,21 @@ class Application(object):
         self.__event_sources = {}
         self.__subscribed = {}
 
+        self._send_queue = SendQueue(self.loop, self.response.send_str)
+
     def register_callback(self, name, method):
         assert name in ('on_message', 'on_close')
         self.__callbacks[name].append(method)
 
     def _send(self, data):
-        asyncio.run_coroutine_threadsafe(self.response.send_str(json.dumps(data)), loop=self.loop)
+        self._send_queue.put(json.dumps(data))
+
+    def _send_event(self, data, coalesce_key=None):
+        """
+        Queue already serialized event `data`. Unlike other messages, events can be coalesced or dropped if the
+        client does not keep up with them.
+        """
+        self._send_queue.put_event(data, coalesce_key)
 
     def _tb_error(self, exc_info):
         klass, exc, trace = exc_info
@@ -215,10 +254,12 @@ class Application(object):
                 'event_source': es,
                 'name': name,
             }
+            self.middleware.subscribe_wsclient(self, name)
             # Start it after setting __event_sources or it can have a race condition
             start_daemon_thread(target=es.process)
         else:
             self.__subscribed[ident] = name
+            self.middleware.subscribe_wsclient(self, name)
 
         self._send({
             'msg': 'ready',
@@ -227,34 +268,26 @@ class Application(object):
 
     async def unsubscribe(self, ident):
         if ident in self.__subscribed:
-            self.__subscribed.pop(ident)
+            name = self.__subscribed.pop(ident)
+            if name not in self.__subscribed.values():
+                self.middleware.unsubscribe_wsclient(self, name)
         elif ident in self.__event_sources:
             event_source = self.__event_sources[ident]['event_source']
             await self.middleware.run_in_thread(event_source.cancel)
-            self.__event_sources.pop(ident)
+            self.middleware.unsubscribe_wsclient(self, self.__event_sources.pop(ident)['name'])
 
     def send_event(self, name, event_type, **kwargs):
+        """
+        Send event to this client only. Events sent with `Middleware.send_event` are serialized once and queued
+        directly to all subscribed clients.
+        """
         if (
             not any(i == name or i == '*' for i in self.__subscribed.values()) and
             not any(i['name'] == name for i in self.__event_sources.values())
         ):
             return
-        event = {
-            'msg': event_type.lower(),
-            'collection': name,
-        }
-        kwargs = kwargs.copy()
-        if 'id' in kwargs:
-            event['id'] = kwargs.pop('id')
-        if event_type in ('ADDED', 'CHANGED'):
-            if 'fields' in kwargs:
-                event['fields'] = kwargs.pop('fields')
-        if event_type == 'CHANGED':
-            if 'cleared' in kwargs:
-                event['cleared'] = kwargs.pop('cleared')
-        if kwargs:
-            event['extra'] = kwargs
-        self._send(event)
+        event = event_message(name, event_type, kwargs)
+        self._send_event(json.dumps(event), event_coalesce_key(event))
 
     def on_open(self):
         self.middleware.register_wsclient(self)
@@ -272,6 +305,7 @@ class Application(object):
             asyncio.ensure_future(self.middleware.run_in_thread(event_source.cancel))
 
         self.middleware.unregister_wsclient(self)
+        self._send_queue.close()
 
     async def on_message(self, message):
         # Run callbacks registered in plugins for on_message
@@ -805,11 +839,14 @@ class Middleware(LoadPluginsMixin, RunInThreadMixin, ServiceCallMixin):
             initializer=lambda: osc.set_thread_name('threadpool_ws'),
             max_workers=10,
         )
+        cleanup_results()
         self.__init_procpool()
         self.__wsclients = {}
         self.__events = Events()
         self.__event_sources = {}
         self.__event_subs = defaultdict(list)
+        # event name (or `*`) -> websocket clients subscribed to it
+        self.__event_subscribers = {}
         self.__hooks = defaultdict(list)
         self.__server_threads = []
         self.__init_services()
@@ -1021,6 +1058,19 @@ class Middleware(LoadPluginsMixin, RunInThreadMixin, ServiceCallMixin):
 
     def unregister_wsclient(self, client):
         self.__wsclients.pop(client.session_id)
+        for name in list(self.__event_subscribers):
+            self.unsubscribe_wsclient(client, name)
+
+    def subscribe_wsclient(self, client, name):
+        # Sets are never modified in place so `send_event` can iterate over them from any thread
+        self.__event_subscribers[name] = self.__event_subscribers.get(name, frozenset()) | {client}
+
+    def unsubscribe_wsclient(self, client, name):
+        clients = self.__event_subscribers.get(name, frozenset()) - {client}
+        if clients:
+            self.__event_subscribers[name] = clients
+        else:
+            self.__event_subscribers.pop(name, None)
 
     def register_hook(self, name, method, sync=True, inline=False):
         """
@@ -1114,22 +1164,14 @@ class Middleware(LoadPluginsMixin, RunInThreadMixin, ServiceCallMixin):
         return await self.run_in_executor(self.__ws_threadpool, method, *args, **kwargs)
 
     def __init_procpool(self):
-        self.__procpool = concurrent.futures.ProcessPoolExecutor(
-            max_workers=5,
+        self.__procpool = ProcessPool(
             initializer=functools.partial(
                 worker_init, self.overlay_dirs, self.debug_level, self.log_handler
             ),
         )
 
     async def run_in_proc(self, method, *args, **kwargs):
-        retries = 2
-        for i in range(retries):
-            try:
-                return await self.run_in_executor(self.__procpool, method, *args, **kwargs)
-            except concurrent.futures.process.BrokenProcessPool:
-                if i == retries - 1:
-                    raise
-                self.__init_procpool()
+        return await self.__procpool.run(method, *args, **kwargs)
 
     def pipe(self):
         return Pipe(self)
@@ -1175,13 +1217,16 @@ class Middleware(LoadPluginsMixin, RunInThreadMixin, ServiceCallMixin):
         return PreparedCall(args=args, executor=executor)
 
     async def _call(
-        self, name, serviceobj, methodobj, params, **kwargs,
+        self, name, serviceobj, methodobj, params, trusted=False, **kwargs,
     ):
         prepared_call = self._call_prepare(name, serviceobj, methodobj, params, **kwargs)
 
         if prepared_call.job:
             return prepared_call.job
 
+        if trusted:
+            methodobj = self._trusted_method(methodobj)
+
         if asyncio.iscoroutinefunction(methodobj):
             self.logger.trace('Calling %r in current IO loop', name)
             return await methodobj(*prepared_call.args)
@@ -1198,7 +1243,20 @@ class Middleware(LoadPluginsMixin, RunInThreadMixin, ServiceCallMixin):
         return await self.run_in_executor(prepared_call.executor, methodobj, *prepared_call.args)
 
     async def _call_worker(self, name, *args, job=None):
-        return await self.run_in_proc(main_worker, name, args, job)
+        serviceobj = self.get_service(name.rsplit('.', 1)[0])
+        result = await self.__procpool.call(
+            name, main_worker, name, args, job,
+            max_concurrency=serviceobj._config.process_pool_max_concurrency,
+        )
+        if isinstance(result, ResultFile):
+            result = await self.run_in_thread(load_result, result)
+        return result
+
+    def get_procpool_stats(self):
+        return self.__procpool.stats()
+
+    def get_procpool_workers_stats(self):
+        return self.__procpool.workers_stats
 
     def dump_args(self, args, method=None, method_name=None):
         if method is None:
@@ -1220,7 +1278,22 @@ class Middleware(LoadPluginsMixin, RunInThreadMixin, ServiceCallMixin):
 
         return [method.accepts[i].dump(arg) for i, arg in enumerate(args) if i < len(method.accepts)]
 
-    async def call(self, name, *params, pipes=None, job_on_progress_cb=None, app=None, profile=False):
+    def _trusted_method(self, methodobj):
+        """
+        Get a variant of `methodobj` that cleans its arguments (e.g. populating default values) but does not
+        validate them again, if it has one.
+        """
+        trusted = getattr(methodobj, 'trusted', None)
+        if trusted is None or getattr(trusted, 'nf', None) is not getattr(methodobj, '__func__', None):
+            return methodobj
+
+        return types.MethodType(trusted, methodobj.__self__)
+
+    async def call(self, name, *params, pipes=None, job_on_progress_cb=None, app=None, profile=False, trusted=False):
+        """
+        `trusted` should only be set by internal callers passing arguments that are already known to be valid
+        (e.g. built by middleware itself) so that they are not validated again.
+        """
         serviceobj, methodobj = self._method_lookup(name)
 
         if profile:
@@ -1228,7 +1301,7 @@ class Middleware(LoadPluginsMixin, RunInThreadMixin, ServiceCallMixin):
 
         return await self._call(
             name, serviceobj, methodobj, params,
-            app=app, io_thread=True, job_on_progress_cb=job_on_progress_cb, pipes=pipes,
+            app=app, io_thread=True, job_on_progress_cb=job_on_progress_cb, pipes=pipes, trusted=trusted,
         )
 
     def call_sync(self, name, *params, job_on_progress_cb=None):
@@ -1323,11 +1396,16 @@ class Middleware(LoadPluginsMixin, RunInThreadMixin, ServiceCallMixin):
 
         self.logger.trace(f'Sending event {name!r}:{event_type!r}:{kwargs!r}')
 
-        for session_id, wsclient in list(self.__wsclients.items()):
-            try:
-                wsclient.send_event(name, event_type, **kwargs)
-            except Exception:
-                self.logger.warn('Failed to send event {} to {}'.format(name, session_id), exc_info=True)
+        wsclients = self.__event_subscribers.get(name, frozenset()) | self.__event_subscribers.get('*', frozenset())
+        if wsclients:
+            event = event_message(name, event_type, kwargs)
+            data = json.dumps(event)
+            coalesce_key = event_coalesce_key(event)
+            for wsclient in wsclients:
+                try:
+                    wsclient._send_event(data, coalesce_key)
+                except Exception:
+                    self.logger.warn('Failed to send event {} to {}'.format(name, wsclient.session_id), exc_info=True)
 
         # Send event also for internally subscribed plugins
         for handler in self.__event_subs.get(name, []):
@@ -1463,7 +1541,7 @@ class Middleware(LoadPluginsMixin, RunInThreadMixin, ServiceCallMixin):
         asyncio.ensure_future(self.jobs.run())
 
         # Start up middleware worker process pool
-        self.__procpool._start_queue_management_thread()
+        self.__procpool.start()
 
         runner = web.AppRunner(app, handle_signals=False, access_log=None)
         await runner.setup()
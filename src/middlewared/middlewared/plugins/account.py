@@ -1,6 +1,7 @@
 from middlewared.schema import accepts, Any, Bool, Dict, Int, List, Patch, Str
 from middlewared.service import (
-    CallError, CRUDService, ValidationErrors, item_method, no_auth_required, pass_app, private, filterable
+    batch_extend, CallError, CRUDService, ValidationErrors, item_method, no_auth_required, pass_app, private,
+    filterable
 )
 import middlewared.sqlalchemy as sa
 from middlewared.utils import run, filter_list
@@ -8,6 +9,7 @@ from middlewared.utils.osc import IS_FREEBSD
 from middlewared.validators import Email
 from middlewared.plugins.smb import SMBBuiltin
 
+from collections import defaultdict
 import asyncio
 import binascii
 import crypt
@@ -98,25 +100,36 @@ class UserService(CRUDService):
         datastore_prefix = 'bsdusr_'
 
     @private
-    async def user_extend(self, user):
+    @batch_extend
+    async def user_extend(self, users):
+        # Get group membership
+        groups = defaultdict(list)
+        for gm in await self.middleware.call(
+            'datastore.query', 'account.bsdgroupmembership', [],
+            {'prefix': 'bsdgrpmember_', 'relationships': False},
+        ):
+            groups[gm['user_id']].append(gm['group_id'])
 
-        # Normalize email, empty is really null
-        if user['email'] == '':
-            user['email'] = None
+        for user in users:
+            # Normalize email, empty is really null
+            if user['email'] == '':
+                user['email'] = None
 
-        # Get group membership
-        user['groups'] = [gm['group']['id'] for gm in await self.middleware.call('datastore.query', 'account.bsdgroupmembership', [('user', '=', user['id'])], {'prefix': 'bsdgrpmember_'})]
+            user['groups'] = groups[user['id']]
 
-        # Get authorized keys
-        keysfile = f'{user["home"]}/.ssh/authorized_keys'
-        user['sshpubkey'] = None
-        if os.path.exists(keysfile):
-            try:
-                with open(keysfile, 'r') as f:
-                    user['sshpubkey'] = f.read()
-            except Exception:
-                pass
-        return user
+        await self.middleware.run_in_thread(self._read_authorized_keys, users)
+        return users
+
+    def _read_authorized_keys(self, users):
+        for user in users:
+            keysfile = f'{user["home"]}/.ssh/authorized_keys'
+            user['sshpubkey'] = None
+            if os.path.exists(keysfile):
+                try:
+                    with open(keysfile, 'r') as f:
+                        user['sshpubkey'] = f.read()
+                except Exception:
+                    pass
 
     @private
     async def user_compress(self, user):
@@ -892,11 +905,26 @@ class GroupService(CRUDService):
         datastore_extend = 'group.group_extend'
 
     @private
-    async def group_extend(self, group):
+    @batch_extend
+    async def group_extend(self, groups):
         # Get group membership
-        group['users'] = [gm['user']['id'] for gm in await self.middleware.call('datastore.query', 'account.bsdgroupmembership', [('group', '=', group['id'])], {'prefix': 'bsdgrpmember_'})]
-        group['users'] += [gmu['id'] for gmu in await self.middleware.call('datastore.query', 'account.bsdusers', [('bsdusr_group_id', '=', group['id'])])]
-        return group
+        members = defaultdict(list)
+        for gm in await self.middleware.call(
+            'datastore.query', 'account.bsdgroupmembership', [],
+            {'prefix': 'bsdgrpmember_', 'relationships': False},
+        ):
+            members[gm['group_id']].append(gm['user_id'])
+
+        primary_members = defaultdict(list)
+        for user in await self.middleware.call(
+            'datastore.query', 'account.bsdusers', [],
+            {'prefix': 'bsdusr_', 'relationships': False, 'select': ['id', 'group_id']},
+        ):
+            primary_members[user['group_id']].append(user['id'])
+
+        for group in groups:
+            group['users'] = members[group['id']] + primary_members[group['id']]
+        return groups
 
     @private
     async def group_compress(self, group):
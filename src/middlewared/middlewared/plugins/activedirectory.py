@@ -267,6 +267,7 @@ class ActiveDirectoryService(ConfigService):
         service = "activedirectory"
         datastore = 'directoryservice.activedirectory'
         datastore_extend = "activedirectory.ad_extend"
+        datastore_config_cache = False
         datastore_prefix = "ad_"
 
     @private
@@ -8,7 +8,7 @@ from middlewared.schema import (accepts, Bool, Dict, Dir, Int, List, Str,
                                 Patch, UnixPerm)
 from middlewared.validators import IpAddress, Range
 from middlewared.service import (SystemServiceService, ValidationErrors,
-                                 CRUDService, private)
+                                 batch_extend, CRUDService, private)
 from middlewared.service_exception import CallError
 import middlewared.sqlalchemy as sa
 from middlewared.utils.path import is_child
@@ -207,7 +207,7 @@ class SharingAFPService(CRUDService):
         data['id'] = await self.middleware.call(
             'datastore.insert', self._config.datastore, data,
             {'prefix': self._config.datastore_prefix})
-        await self.extend(data)
+        await self.extend([data])
 
         await self._service_change('afp', 'reload')
 
@@ -256,7 +256,7 @@ class SharingAFPService(CRUDService):
         await self.middleware.call(
             'datastore.update', self._config.datastore, id, new,
             {'prefix': self._config.datastore_prefix})
-        await self.extend(new)
+        await self.extend([new])
 
         await self._service_change('afp', 'reload')
 
@@ -342,15 +342,17 @@ class SharingAFPService(CRUDService):
         return name
 
     @private
-    async def extend(self, data):
-        data['allow'] = data['allow'].split()
-        data['deny'] = data['deny'].split()
-        data['ro'] = data['ro'].split()
-        data['rw'] = data['rw'].split()
-        data['hostsallow'] = data['hostsallow'].split()
-        data['hostsdeny'] = data['hostsdeny'].split()
-
-        return data
+    @batch_extend
+    async def extend(self, shares):
+        for data in shares:
+            data['allow'] = data['allow'].split()
+            data['deny'] = data['deny'].split()
+            data['ro'] = data['ro'].split()
+            data['rw'] = data['rw'].split()
+            data['hostsallow'] = data['hostsallow'].split()
+            data['hostsdeny'] = data['hostsdeny'].split()
+
+        return shares
 
     @private
     async def compress(self, data):
@@ -1,7 +1,9 @@
-from collections import defaultdict, namedtuple
+import asyncio
+from collections import defaultdict, deque, namedtuple
 import copy
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 import errno
+import math
 import os
 import textwrap
 import time
@@ -33,7 +35,7 @@ from middlewared.service import (
 from middlewared.service_exception import CallError
 import middlewared.sqlalchemy as sa
 from middlewared.validators import validate_attributes
-from middlewared.utils import bisect, load_modules, load_classes
+from middlewared.utils import load_modules, load_classes
 
 POLICIES = ["IMMEDIATELY", "HOURLY", "DAILY", "NEVER"]
 DEFAULT_POLICY = "IMMEDIATELY"
@@ -41,9 +43,41 @@ DEFAULT_POLICY = "IMMEDIATELY"
 ALERT_SOURCES = {}
 ALERT_SERVICES_FACTORIES = {}
 
+# How many alert sources can run at the same time
+ALERT_SOURCES_CONCURRENCY = 8
+
+# How outdated `last_occurrence` of periodically checked alerts stored in the database can be
+ALERT_LAST_OCCURRENCE_FLUSH_INTERVAL = timedelta(hours=1)
+
 AlertSourceLock = namedtuple("AlertSourceLock", ["source_name", "expires_at"])
 
 
+class AlertSourceStats:
+    """
+    Run durations and timeouts of a single alert source
+    """
+
+    def __init__(self, size=100):
+        self.durations = deque(maxlen=size)
+        self.runs = 0
+        self.timeouts = 0
+
+    def add(self, duration, timed_out=False):
+        self.durations.append(duration)
+        self.runs += 1
+        if timed_out:
+            self.timeouts += 1
+
+    def to_dict(self):
+        durations = sorted(self.durations)
+        return {
+            "runs": self.runs,
+            "timeouts": self.timeouts,
+            "last_duration": self.durations[-1] if self.durations else None,
+            "p95_duration": durations[math.ceil(len(durations) * 0.95) - 1] if durations else None,
+        }
+
+
 class AlertModel(sa.Model):
     __tablename__ = 'system_alert'
 
@@ -104,6 +138,81 @@ class TestAlertClass(AlertClass):
     exclude_from_list = True
 
 
+class AlertStore:
+    """
+    Alerts indexed by `(node, source, klass, key)`, by `uuid`, by `source` and by `(node, klass)`. Iteration order
+    is the insertion order.
+    """
+
+    def __init__(self):
+        self.alerts = {}
+        self.by_uuid = {}
+        self.by_source = defaultdict(dict)
+        self.by_klass = defaultdict(dict)
+
+    @staticmethod
+    def alert_key(alert):
+        return alert.node, alert.source, alert.klass, alert.key
+
+    def __iter__(self):
+        return iter(list(self.alerts.values()))
+
+    def __len__(self):
+        return len(self.alerts)
+
+    def get(self, alert):
+        """
+        Returns stored alert with the same node, source, class and key as `alert`
+        """
+        return self.alerts.get(self.alert_key(alert))
+
+    def get_by_uuid(self, uuid):
+        return self.by_uuid.get(uuid)
+
+    def get_by_source(self, source, node=None):
+        return [alert for alert in self.by_source.get(source, {}).values() if node is None or alert.node == node]
+
+    def get_by_klass(self, node, klass):
+        return list(self.by_klass.get((node, klass), {}).values())
+
+    def add(self, alert):
+        """
+        Add `alert` replacing the alert with the same key or uuid (if any)
+        """
+        for existing in (self.alerts.get(self.alert_key(alert)), self.by_uuid.get(alert.uuid)):
+            if existing is not None:
+                self.remove(existing)
+
+        key = self.alert_key(alert)
+        self.alerts[key] = alert
+        self.by_uuid[alert.uuid] = alert
+        self.by_source[alert.source][key] = alert
+        self.by_klass[(alert.node, alert.klass)][key] = alert
+
+    def remove(self, alert):
+        key = self.alert_key(alert)
+        if self.alerts.get(key) is not alert:
+            return
+
+        del self.alerts[key]
+        if self.by_uuid.get(alert.uuid) is alert:
+            del self.by_uuid[alert.uuid]
+        for index, index_key in ((self.by_source, alert.source), (self.by_klass, (alert.node, alert.klass))):
+            index[index_key].pop(key, None)
+            if not index[index_key]:
+                del index[index_key]
+
+    def replace_source(self, source, alerts):
+        """
+        Replace all the alerts of `source` with `alerts`
+        """
+        for alert in list(self.by_source.get(source, {}).values()):
+            self.remove(alert)
+
+        for alert in alerts:
+            self.add(alert)
+
+
 class AlertPolicy:
     def __init__(self, key=lambda now: now):
         self.key = key
@@ -169,6 +278,11 @@ class AlertService(Service):
 
         self.blocked_failover_alerts_until = 0
 
+        # Results of `alert.cached_call` for the alert sources run in progress
+        self.run_cache = None
+
+        self.source_stats = defaultdict(AlertSourceStats)
+
     @private
     async def load(self):
         is_freenas = await self.middleware.call("system.is_freenas")
@@ -200,15 +314,25 @@ class AlertService(Service):
             if await self.middleware.call("failover.node") == "B":
                 self.node = "B"
 
-        self.alerts = []
+        self.alerts = AlertStore()
+        # Alerts as they are stored in the database: `uuid` -> `(id, data)`
+        self.flushed_alerts = {}
+        # Database rows that should be deleted on next flush
+        self.flushed_stale_ids = []
         if load:
             for alert in await self.middleware.call("datastore.query", "system.alert"):
-                del alert["id"]
+                id = alert.pop("id")
 
+                if alert["uuid"] in self.flushed_alerts:
+                    self.flushed_stale_ids.append(id)
+                    continue
+
+                data = alert.copy()
                 try:
                     alert["klass"] = AlertClass.class_by_name[alert["klass"]]
                 except KeyError:
                     self.logger.info("Alert class %r is no longer present", alert["klass"])
+                    self.flushed_stale_ids.append(id)
                     continue
 
                 alert["_uuid"] = alert.pop("uuid")
@@ -218,8 +342,8 @@ class AlertService(Service):
 
                 alert = Alert(**alert)
 
-                if not any(a.uuid == alert.uuid for a in self.alerts):
-                    self.alerts.append(alert)
+                self.alerts.add(alert)
+                self.flushed_alerts[alert.uuid] = (id, data)
 
         self.alert_source_last_run = defaultdict(lambda: datetime.min)
 
@@ -326,10 +450,7 @@ class AlertService(Service):
         return nodes
 
     def __alert_by_uuid(self, uuid):
-        try:
-            return [a for a in self.alerts if a.uuid == uuid][0]
-        except IndexError:
-            return None
+        return self.alerts.get_by_uuid(uuid)
 
     @accepts(Str("uuid"))
     async def dismiss(self, uuid):
@@ -342,8 +463,7 @@ class AlertService(Service):
             return
 
         if issubclass(alert.klass, DismissableAlertClass):
-            related_alerts, unrelated_alerts = bisect(lambda a: (a.node, a.klass) == (alert.node, alert.klass),
-                                                      self.alerts)
+            related_alerts = self.alerts.get_by_klass(alert.node, alert.klass)
             left_alerts = await alert.klass(self.middleware).dismiss(related_alerts, alert)
             for deleted_alert in related_alerts:
                 if deleted_alert not in left_alerts:
@@ -391,7 +511,11 @@ class AlertService(Service):
             return
 
         valid_alerts = copy.deepcopy(self.alerts)
-        await self.__run_alerts()
+        self.run_cache = {}
+        try:
+            await self.__run_alerts()
+        finally:
+            self.run_cache = None
 
         self.__expire_alerts()
 
@@ -558,6 +682,7 @@ class AlertService(Service):
             if source_lock.expires_at <= time.monotonic():
                 await self.unblock_source(k)
 
+        alert_sources = []
         for alert_source in ALERT_SOURCES.values():
             if product_type not in alert_source.products:
                 continue
@@ -569,80 +694,151 @@ class AlertService(Service):
                 continue
 
             self.alert_source_last_run[alert_source.name] = datetime.utcnow()
+            alert_sources.append(alert_source)
 
-            alerts_a = [alert
-                        for alert in self.alerts
-                        if alert.node == master_node and alert.source == alert_source.name]
-            locked = False
+        locked = set()
+        for alert_source in alert_sources:
             if self.blocked_sources[alert_source.name]:
                 self.logger.debug("Not running alert source %r because it is blocked", alert_source.name)
-                locked = True
+                locked.add(alert_source.name)
             else:
                 self.logger.trace("Running alert source: %r", alert_source.name)
 
-                try:
-                    alerts_a = await self.__run_source(alert_source.name)
-                except UnavailableException:
-                    pass
+        local_names = [alert_source.name for alert_source in alert_sources if alert_source.name not in locked]
+        remote_names = []
+        if run_on_backup_node:
+            remote_names = [alert_source.name for alert_source in alert_sources
+                            if alert_source.run_on_backup_node and alert_source.name not in locked]
+
+        # Sources on this node and all the sources on the backup node (in a single call) run concurrently
+        results_a, results_b = await asyncio.gather(
+            self.__run_sources(local_names),
+            self.__run_remote_sources(remote_names),
+        )
+
+        for alert_source in alert_sources:
+            alerts_a = results_a.get(alert_source.name)
+            if alerts_a is None:
+                alerts_a = self.alerts.get_by_source(alert_source.name, master_node)
             for alert in alerts_a:
                 alert.node = master_node
 
             alerts_b = []
             if run_on_backup_node and alert_source.run_on_backup_node:
+                alerts_b = results_b.get(alert_source.name)
+                if alerts_b is None:
+                    alerts_b = self.alerts.get_by_source(alert_source.name, backup_node)
+
+            for alert in alerts_b:
+                alert.node = backup_node
+
+            for alert in alerts_a + alerts_b:
+                self.__handle_alert(alert)
+
+            self.alerts.replace_source(alert_source.name, alerts_a + alerts_b)
+
+    async def __run_sources(self, source_names):
+        """
+        Run alert sources concurrently. Returns alerts for every source that was available.
+        """
+        semaphore = asyncio.Semaphore(ALERT_SOURCES_CONCURRENCY)
+        results = {}
+
+        async def run(source_name):
+            async with semaphore:
+                try:
+                    results[source_name] = await self.__run_source(source_name)
+                except UnavailableException:
+                    pass
+
+        await asyncio.gather(*[run(source_name) for source_name in source_names])
+        return results
+
+    async def __run_remote_sources(self, source_names):
+        """
+        Run alert sources on the backup node using a single call. Returns alerts for every source that was
+        available.
+        """
+        if not source_names:
+            return {}
+
+        timeout = (
+            max(ALERT_SOURCES[source_name].timeout for source_name in source_names) *
+            math.ceil(len(source_names) / ALERT_SOURCES_CONCURRENCY)
+        )
+        try:
+            try:
+                results = await self.middleware.call("failover.call_remote", "alert.run_sources", [source_names],
+                                                     {"timeout": timeout})
+            except CallError as e:
+                if e.errno == CallError.ENOMETHOD:
+                    # Backup node runs an older version (i.e. during an upgrade) that only has `alert.run_source`
+                    return await self.__run_remote_sources_one_by_one(source_names)
+                elif e.errno in [errno.ECONNABORTED, errno.ECONNREFUSED, errno.ECONNRESET, errno.EHOSTDOWN,
+                                 errno.ETIMEDOUT, CallError.EALERTCHECKERUNAVAILABLE]:
+                    return {}
+                else:
+                    raise
+        except ReserveFDException:
+            self.logger.debug('Failed to reserve a privileged port')
+            return {}
+        except Exception:
+            return {
+                source_name: self.__remote_source_failed(source_name)
+                for source_name in source_names
+            }
+
+        return {
+            source_name: self.__remote_alerts(alerts)
+            for source_name, alerts in results.items()
+        }
+
+    async def __run_remote_sources_one_by_one(self, source_names):
+        semaphore = asyncio.Semaphore(ALERT_SOURCES_CONCURRENCY)
+        results = {}
+
+        async def run(source_name):
+            async with semaphore:
                 try:
-                    alerts_b = [alert
-                                for alert in self.alerts
-                                if alert.node == backup_node and alert.source == alert_source.name]
                     try:
-                        if not locked:
-                            alerts_b = await self.middleware.call("failover.call_remote", "alert.run_source",
-                                                                  [alert_source.name])
-
-                            alerts_b = [Alert(**dict({k: v for k, v in alert.items()
-                                                      if k in ["args", "datetime", "last_occurrence", "dismissed",
-                                                               "mail"]},
-                                                     klass=AlertClass.class_by_name[alert["klass"]],
-                                                     _source=alert["source"],
-                                                     _key=alert["key"]))
-                                        for alert in alerts_b]
+                        alerts = await self.middleware.call("failover.call_remote", "alert.run_source", [source_name],
+                                                            {"timeout": ALERT_SOURCES[source_name].timeout})
                     except CallError as e:
                         if e.errno in [errno.ECONNABORTED, errno.ECONNREFUSED, errno.ECONNRESET, errno.EHOSTDOWN,
                                        errno.ETIMEDOUT, CallError.EALERTCHECKERUNAVAILABLE]:
-                            pass
+                            return
                         else:
                             raise
                 except ReserveFDException:
                     self.logger.debug('Failed to reserve a privileged port')
                 except Exception:
-                    alerts_b = [
-                        Alert(AlertSourceRunFailedOnBackupNodeAlertClass,
-                              args={
-                                  "source_name": alert_source.name,
-                                  "traceback": traceback.format_exc(),
-                              },
-                              _source=alert_source.name)
-                    ]
+                    results[source_name] = self.__remote_source_failed(source_name)
+                else:
+                    results[source_name] = self.__remote_alerts(alerts)
 
-            for alert in alerts_b:
-                alert.node = backup_node
+        await asyncio.gather(*[run(source_name) for source_name in source_names])
+        return results
 
-            for alert in alerts_a + alerts_b:
-                self.__handle_alert(alert)
+    def __remote_source_failed(self, source_name):
+        return [
+            Alert(AlertSourceRunFailedOnBackupNodeAlertClass,
+                  args={
+                      "source_name": source_name,
+                      "traceback": traceback.format_exc(),
+                  },
+                  _source=source_name)
+        ]
 
-            self.alerts = (
-                [a for a in self.alerts if a.source != alert_source.name] +
-                alerts_a +
-                alerts_b
-            )
+    def __remote_alerts(self, alerts):
+        return [Alert(**dict({k: v for k, v in alert.items()
+                              if k in ["args", "datetime", "last_occurrence", "dismissed", "mail"]},
+                             klass=AlertClass.class_by_name[alert["klass"]],
+                             _source=alert["source"],
+                             _key=alert["key"]))
+                for alert in alerts]
 
     def __handle_alert(self, alert):
-        try:
-            existing_alert = [
-                a for a in self.alerts
-                if (a.node, a.source, a.klass, a.key) == (alert.node, alert.source, alert.klass, alert.key)
-            ][0]
-        except IndexError:
-            existing_alert = None
+        existing_alert = self.alerts.get(alert)
 
         if existing_alert is None:
             alert.uuid = self.__uuid()
@@ -661,7 +857,9 @@ class AlertService(Service):
             alert.dismissed = existing_alert.dismissed
 
     def __expire_alerts(self):
-        self.alerts = list(filter(lambda alert: not self.__should_expire_alert(alert), self.alerts))
+        for alert in self.alerts:
+            if self.__should_expire_alert(alert):
+                self.alerts.remove(alert)
 
     def __should_expire_alert(self, alert):
         if issubclass(alert.klass, OneShotAlertClass):
@@ -678,6 +876,43 @@ class AlertService(Service):
         except UnavailableException:
             raise CallError("This alert checker is unavailable", CallError.EALERTCHECKERUNAVAILABLE)
 
+    @private
+    async def cached_call(self, method, *params):
+        """
+        Alert sources that run in the same cycle and need the same data (e.g. `pool.query`) should retrieve it
+        using this method so that `method` is only called once per cycle. Every caller gets its own copy of the
+        result.
+        """
+        if self.run_cache is None:
+            return await self.middleware.call(method, *params)
+
+        key = (method, repr(params))
+        if key not in self.run_cache:
+            self.run_cache[key] = asyncio.ensure_future(self.middleware.call(method, *params))
+
+        return copy.deepcopy(await asyncio.shield(self.run_cache[key]))
+
+    @private
+    async def run_sources(self, source_names):
+        """
+        Run alert sources concurrently. Sources that are unavailable are omitted from the result.
+        """
+        return {
+            source_name: [dict(alert.__dict__, klass=alert.klass.name) for alert in alerts]
+            for source_name, alerts in (await self.__run_sources(source_names)).items()
+        }
+
+    @private
+    async def sources_stats(self):
+        """
+        Run statistics of alert sources: number of runs and timeouts, last and 95th percentile run durations
+        (in seconds).
+        """
+        return {
+            source_name: self.source_stats[source_name].to_dict()
+            for source_name in ALERT_SOURCES
+        }
+
     @private
     async def block_source(self, source_name, timeout=3600):
         if source_name not in ALERT_SOURCES:
@@ -702,10 +937,21 @@ class AlertService(Service):
     async def __run_source(self, source_name):
         alert_source = ALERT_SOURCES[source_name]
 
+        start = time.monotonic()
+        timed_out = False
         try:
-            alerts = (await alert_source.check()) or []
+            alerts = (await asyncio.wait_for(alert_source.check(), alert_source.timeout)) or []
         except UnavailableException:
             raise
+        except asyncio.TimeoutError:
+            timed_out = True
+            alerts = [
+                Alert(AlertSourceRunFailedAlertClass,
+                      args={
+                          "source_name": alert_source.name,
+                          "traceback": f"Timed out after {alert_source.timeout} seconds",
+                      })
+            ]
         except Exception as e:
             if isinstance(e, CallError) and e.errno in [errno.ECONNABORTED, errno.ECONNREFUSED, errno.ECONNRESET,
                                                         errno.EHOSTDOWN, errno.ETIMEDOUT]:
@@ -727,6 +973,8 @@ class AlertService(Service):
         else:
             if not isinstance(alerts, list):
                 alerts = [alerts]
+        finally:
+            self.source_stats[source_name].add(time.monotonic() - start, timed_out)
 
         for alert in alerts:
             alert.source = source_name
@@ -743,13 +991,67 @@ class AlertService(Service):
         ):
             return
 
-        await self.middleware.call("datastore.delete", "system.alert", [])
-
+        alerts = {}
         for alert in self.alerts:
             d = alert.__dict__.copy()
             d["klass"] = d["klass"].name
             del d["mail"]
-            await self.middleware.call("datastore.insert", "system.alert", d)
+            alerts[alert.uuid] = d
+
+        # Only write the alerts that have changed since the last flush
+        operations = []
+        flushed = []
+        for id in self.flushed_stale_ids:
+            operations.append({"type": "DELETE", "name": "system.alert", "id_or_filters": id})
+            flushed.append(None)
+        for alert_uuid, (id, data) in self.flushed_alerts.items():
+            if alert_uuid not in alerts:
+                operations.append({"type": "DELETE", "name": "system.alert", "id_or_filters": id})
+                flushed.append(None)
+        for alert_uuid, d in alerts.items():
+            if alert_uuid in self.flushed_alerts:
+                id, data = self.flushed_alerts[alert_uuid]
+                if not self.__alert_changed(data, d):
+                    continue
+
+                operations.append({"type": "UPDATE", "name": "system.alert", "id_or_filters": id, "data": d})
+            else:
+                operations.append({"type": "INSERT", "name": "system.alert", "data": d})
+            flushed.append(alert_uuid)
+
+        if not operations:
+            return
+
+        result = await self.middleware.call("datastore.bulk", operations)
+
+        self.flushed_stale_ids = []
+        self.flushed_alerts = {
+            alert_uuid: flushed_alert
+            for alert_uuid, flushed_alert in self.flushed_alerts.items()
+            if alert_uuid in alerts
+        }
+        for alert_uuid, id in zip(flushed, result):
+            if alert_uuid is not None:
+                self.flushed_alerts[alert_uuid] = (id, copy.deepcopy(alerts[alert_uuid]))
+
+    def __alert_changed(self, old, new):
+        if old == new:
+            return False
+
+        # `last_occurrence` of the alerts that are checked periodically changes on every run, it is not worth
+        # writing the alert every time just because of that. It is only written once it is outdated enough so that
+        # alerts loaded from the database after restart do not come back with the time they were first written.
+        klass = AlertClass.class_by_name.get(new["klass"])
+        if klass is not None and not issubclass(klass, OneShotAlertClass):
+            if dict(old, last_occurrence=None) != dict(new, last_occurrence=None):
+                return True
+
+            if old["last_occurrence"] is None or new["last_occurrence"] is None:
+                return old["last_occurrence"] != new["last_occurrence"]
+
+            return new["last_occurrence"] - old["last_occurrence"] >= ALERT_LAST_OCCURRENCE_FLUSH_INTERVAL
+
+        return True
 
     @private
     @accepts(Str("klass"), Any("args", null=True))
@@ -774,7 +1076,7 @@ class AlertService(Service):
 
         self.__handle_alert(alert)
 
-        self.alerts = [a for a in self.alerts if a.uuid != alert.uuid] + [alert]
+        self.alerts.add(alert)
 
         await self.middleware.call("alert.send_alerts")
 
@@ -790,8 +1092,7 @@ class AlertService(Service):
         if not issubclass(klass, OneShotAlertClass):
             raise CallError(f"Alert class {klass!r} is not a one-shot alert source")
 
-        related_alerts, unrelated_alerts = bisect(lambda a: (a.node, a.klass) == (self.node, klass),
-                                                  self.alerts)
+        related_alerts = self.alerts.get_by_klass(self.node, klass)
         left_alerts = await klass(self.middleware).delete(related_alerts, query)
         deleted = False
         for deleted_alert in related_alerts:
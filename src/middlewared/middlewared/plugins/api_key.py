@@ -126,7 +126,7 @@ class ApiKeyService(CRUDService):
         except MatchNotFound:
             return None
 
-        if not pbkdf2_sha256.verify(key, db_key["key"]):
+        if not await self.middleware.run_in_thread(pbkdf2_sha256.verify, key, db_key["key"]):
             return None
 
         return db_key
@@ -1,11 +1,18 @@
+import base64
+import binascii
+from collections import OrderedDict
 import crypt
 from datetime import datetime, timedelta
+import hashlib
+import hmac
 import pyotp
 import random
 import re
+import secrets
 import socket
 import string
 import subprocess
+import threading
 import time
 
 from middlewared.schema import Dict, Int, Str, accepts, Bool
@@ -59,6 +66,56 @@ class Token:
         self.last_used_at = time.monotonic()
 
 
+class CredentialCache:
+    """
+    Bounded cache of successfully verified credentials which expire after `ttl` seconds.
+
+    Credentials are never stored in plain text, only their HMAC with a random key that only exists in memory.
+    """
+
+    def __init__(self, ttl=60, size=1024):
+        self.ttl = ttl
+        self.size = size
+        self.key = secrets.token_bytes(32)
+        self.entries = OrderedDict()
+        # Incremented on every `clear` so that verifications which started before it are not cached
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def _digest(self, credentials):
+        return hmac.new(self.key, credentials.encode('utf-8', 'surrogateescape'), hashlib.sha256).digest()
+
+    def get(self, credentials):
+        digest = self._digest(credentials)
+        with self.lock:
+            expires_at = self.entries.get(digest)
+            if expires_at is None:
+                return False
+
+            if expires_at <= time.monotonic():
+                del self.entries[digest]
+                return False
+
+            self.entries.move_to_end(digest)
+            return True
+
+    def put(self, credentials, generation):
+        digest = self._digest(credentials)
+        with self.lock:
+            if generation != self.generation:
+                return
+
+            self.entries[digest] = time.monotonic() + self.ttl
+            self.entries.move_to_end(digest)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.generation += 1
+
+
 class SessionManager:
     def __init__(self):
         self.sessions = {}
@@ -215,6 +272,8 @@ class AuthService(Service):
 
     token_manager = TokenManager()
 
+    credential_cache = CredentialCache()
+
     def __init__(self, *args, **kwargs):
         super(AuthService, self).__init__(*args, **kwargs)
         self.session_manager.middleware = self.middleware
@@ -271,7 +330,50 @@ class AuthService(Service):
             return False
         if user['bsdusr_unixhash'] in ('x', '*'):
             return False
-        return crypt.crypt(password, user['bsdusr_unixhash']) == user['bsdusr_unixhash']
+        return await self.middleware.run_in_thread(
+            lambda: crypt.crypt(password, user['bsdusr_unixhash']) == user['bsdusr_unixhash']
+        )
+
+    @private
+    async def check_authorization(self, authorization):
+        """
+        Verify HTTP `Authorization` header value: `Basic` username and password, `Bearer` API key or `Token` generated
+        by `auth.generate_token`.
+
+        Successfully verified username/password and API key credentials are cached for a short period of time
+        so that their (slow) hashes do not need to be verified for every request.
+        """
+        if authorization.startswith('Token '):
+            token = self.token_manager.get(authorization[6:])
+            if token is None:
+                return False
+
+            token.notify_used()
+            return True
+
+        if self.credential_cache.get(authorization):
+            return True
+
+        generation = self.credential_cache.generation
+        if authorization.startswith('Basic '):
+            try:
+                username, password = base64.b64decode(authorization[6:]).decode('utf8').split(':', 1)
+            except (binascii.Error, UnicodeDecodeError, ValueError):
+                return False
+
+            try:
+                valid = await self.middleware.call('auth.check_user', username, password)
+            except Exception:
+                return False
+        elif authorization.startswith('Bearer '):
+            valid = await self.middleware.call('api_key.authenticate', authorization.split(' ', 1)[1]) is not None
+        else:
+            return False
+
+        if valid:
+            self.credential_cache.put(authorization, generation)
+
+        return valid
 
     @accepts(Int('ttl', default=600, null=True), Dict('attrs', additional_attrs=True))
     def generate_token(self, ttl=None, attrs=None):
@@ -525,6 +627,19 @@ async def check_permission(middleware, app):
             break
 
 
+def hook_datastore_execute_write(middleware, sql, binds, replicate=True):
+    # Passwords or API keys might have changed
+    if 'account_bsdusers' in sql or 'account_api_key' in sql:
+        AuthService.credential_cache.clear()
+
+
+def hook_datastore_execute_write_many(middleware, queries, replicate=True):
+    for sql, binds in queries:
+        hook_datastore_execute_write(middleware, sql, binds)
+
+
 def setup(middleware):
     middleware.event_register('auth.sessions', 'Notification of new and removed sessions.')
     middleware.register_hook('core.on_connect', check_permission, sync=True)
+    middleware.register_hook('datastore.post_execute_write', hook_datastore_execute_write, inline=True)
+    middleware.register_hook('datastore.post_execute_write_many', hook_datastore_execute_write_many, inline=True)
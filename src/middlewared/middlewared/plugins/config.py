@@ -52,32 +52,40 @@ class ConfigService(Service):
         If none of these options are set, the bundle is not generated and the database file is provided.
         """
 
-        if all(not options[k] for k in options):
-            bundle = False
-            filename = FREENAS_DATABASE
-        else:
-            bundle = True
-            files = CONFIG_FILES.copy()
-            if not options['secretseed']:
-                files['pwenc_secret'] = None
-            if not options['root_authorized_keys'] or not os.path.exists(files['root_authorized_keys']):
-                files['root_authorized_keys'] = None
-            if not options['pool_keys'] or not os.path.exists(files['geli']) or not os.listdir(files['geli']):
-                files['geli'] = None
-
-            filename = tempfile.mkstemp()[1]
-            os.chmod(filename, 0o600)
-            with tarfile.open(filename, 'w') as tar:
-                tar.add(FREENAS_DATABASE, arcname='freenas-v1.db')
-                for arcname, path in files.items():
-                    if path:
-                        tar.add(path, arcname=arcname)
-
-        with open(filename, 'rb') as f:
-            await self.middleware.run_in_thread(shutil.copyfileobj, f, job.pipes.output.w)
+        # Database file alone may not contain the latest changes which are still in the WAL
+        database = tempfile.mkstemp()[1]
+        os.chmod(database, 0o600)
+        try:
+            await self.middleware.call('datastore.backup', database)
 
-        if bundle:
-            os.remove(filename)
+            if all(not options[k] for k in options):
+                bundle = False
+                filename = database
+            else:
+                bundle = True
+                files = CONFIG_FILES.copy()
+                if not options['secretseed']:
+                    files['pwenc_secret'] = None
+                if not options['root_authorized_keys'] or not os.path.exists(files['root_authorized_keys']):
+                    files['root_authorized_keys'] = None
+                if not options['pool_keys'] or not os.path.exists(files['geli']) or not os.listdir(files['geli']):
+                    files['geli'] = None
+
+                filename = tempfile.mkstemp()[1]
+                os.chmod(filename, 0o600)
+                with tarfile.open(filename, 'w') as tar:
+                    tar.add(database, arcname='freenas-v1.db')
+                    for arcname, path in files.items():
+                        if path:
+                            tar.add(path, arcname=arcname)
+
+            with open(filename, 'rb') as f:
+                await self.middleware.run_in_thread(shutil.copyfileobj, f, job.pipes.output.w)
+
+            if bundle:
+                os.remove(filename)
+        finally:
+            os.remove(database)
 
     @accepts()
     @job(pipes=["input"])
@@ -269,7 +277,7 @@ class ConfigService(Service):
             job.logs_fd.write(cp.stderr)
             raise CallError('Factory reset has failed.')
 
-        shutil.move(factorydb, FREENAS_DATABASE)
+        self.middleware.call_sync('datastore.replace', factorydb)
 
         if options['reboot']:
             self.middleware.run_coroutine(
@@ -304,4 +312,4 @@ class ConfigService(Service):
         if not os.path.exists(dirname):
             os.makedirs(dirname)
 
-        shutil.copy(FREENAS_DATABASE, newfile)
+        self.middleware.call_sync('datastore.backup', newfile)
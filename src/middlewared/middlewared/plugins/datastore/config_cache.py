@@ -0,0 +1,92 @@
+from collections import defaultdict
+import copy
+
+from middlewared.schema import accepts
+from middlewared.service import filterable, Service
+from middlewared.utils import filter_list
+
+from .schema import SchemaMixin
+
+
+class DatastoreService(Service, SchemaMixin):
+
+    class Config:
+        private = True
+
+    # namespace -> (generations of the tables it was built from, config)
+    config_cache = {}
+    # namespace -> names of the tables config is built from
+    config_cache_tables = {}
+    # table name -> number of writes to that table, `None` -> number of writes to unknown tables
+    config_cache_generations = defaultdict(int)
+    config_cache_counters = defaultdict(lambda: {'hits': 0, 'misses': 0})
+
+    async def config_cached(self, namespace, name, options):
+        """
+        `datastore.config` result for `ConfigService` `namespace`, cached until one of the tables it is built from
+        (the datastore itself, tables joined by foreign keys and many-to-many relationship tables) is written to.
+        """
+        tables = self.config_cache_tables.get(namespace)
+        if tables is None:
+            tables = self.config_cache_tables[namespace] = sorted(self._config_cache_tables(self._get_table(name)))
+
+        generations = self._config_cache_generations(tables)
+
+        cached = self.config_cache.get(namespace)
+        if cached is not None and cached[0] == generations:
+            self.config_cache_counters[namespace]['hits'] += 1
+            return copy.deepcopy(cached[1])
+
+        self.config_cache_counters[namespace]['misses'] += 1
+        config = await self.middleware.call('datastore.config', name, options, trusted=True)
+        # Do not cache a value that was built while the underlying tables were being written to
+        if self._config_cache_generations(tables) == generations:
+            self.config_cache[namespace] = (generations, copy.deepcopy(config))
+        return config
+
+    async def config_cache_invalidate(self, name=None):
+        """
+        Invalidate cached configs built from datastore `name` or all cached configs if `name` is not specified.
+        """
+        if name is None:
+            self.config_cache_generations[None] += 1
+        else:
+            self.config_cache_generations[self._get_table(name).name] += 1
+
+    @filterable
+    async def config_cache_stats(self, filters, options):
+        """
+        Get `ConfigService.config` cache hit and miss counters for every namespace.
+        """
+        return filter_list([
+            dict(counters, namespace=namespace, cached=namespace in self.config_cache)
+            for namespace, counters in self.config_cache_counters.items()
+        ], filters, options)
+
+    @accepts()
+    async def config_cache_clear(self):
+        """
+        Drop all cached configs and reset cache counters.
+        """
+        self.config_cache.clear()
+        self.config_cache_counters.clear()
+
+    def _config_cache_generations(self, tables):
+        return (self.config_cache_generations[None],) + tuple(self.config_cache_generations[t] for t in tables)
+
+    def _config_cache_tables(self, table, tables=None):
+        tables = tables if tables is not None else set()
+        if table.name in tables:
+            return tables
+
+        tables.add(table.name)
+        for column in table.c:
+            for foreign_key in column.foreign_keys:
+                self._config_cache_tables(foreign_key.column.table, tables)
+
+        for relationship in self._get_relationships(table).values():
+            if relationship.secondary is not None:
+                tables.add(relationship.secondary.name)
+            self._config_cache_tables(relationship.target, tables)
+
+        return tables
@@ -1,51 +1,218 @@
 from concurrent.futures import ThreadPoolExecutor
+import os
+import queue
 import re
+import sqlite3
+import threading
+import time
 
 from sqlalchemy import create_engine
 
+from middlewared.schema import accepts
 from middlewared.service import private, Service
 
 from middlewared.plugins.config import FREENAS_DATABASE
 
+READERS = 4
+
 
 def regexp(expr, item):
     reg = re.compile(expr, re.I)
     return reg.search(item) is not None
 
 
+class QueueStats:
+    def __init__(self):
+        self.calls = 0
+        self.queued = 0
+        self.wait_time = 0.0
+        self.wait_time_max = 0.0
+        self.lock = threading.Lock()
+
+    def submit(self):
+        with self.lock:
+            self.queued += 1
+        return time.monotonic()
+
+    def start(self, submitted):
+        wait_time = time.monotonic() - submitted
+        with self.lock:
+            self.queued -= 1
+            self.calls += 1
+            self.wait_time += wait_time
+            self.wait_time_max = max(self.wait_time_max, wait_time)
+
+    def dump(self):
+        return {
+            'calls': self.calls,
+            'queued': self.queued,
+            'wait_time': self.wait_time,
+            'wait_time_max': self.wait_time_max,
+            'wait_time_avg': self.wait_time / self.calls if self.calls else 0.0,
+        }
+
+
 class DatastoreService(Service):
+    """
+    Writes go through a single connection in `thread_pool` so they are executed (and `datastore.post_execute_write`
+    hooks are called) in order. Reads are served concurrently by `READERS` read-only connections, database is in WAL
+    mode so they do not block and are not blocked by the writer.
+    """
 
     class Config:
         private = True
 
     thread_pool = ThreadPoolExecutor(1)
+    read_thread_pool = ThreadPoolExecutor(READERS)
 
     engine = None
     connection = None
+    readers = queue.Queue()
+    readers_count = 0
+
+    write_stats = QueueStats()
+    read_stats = QueueStats()
 
     @private
     async def setup(self):
         await self.middleware.run_in_executor(self.thread_pool, self._setup)
+        await self.middleware.call('datastore.config_cache_invalidate')
 
     def _setup(self):
-        if self.engine is not None:
-            self.engine.dispose()
-
-        if self.connection is not None:
-            self.connection.close()
+        self._close()
 
-        self.engine = create_engine(f'sqlite:///{FREENAS_DATABASE}')
+        self.engine = create_engine(f'sqlite:///{FREENAS_DATABASE}', connect_args={'check_same_thread': False})
 
         self.connection = self.engine.connect()
         self.connection.connection.create_function("REGEXP", 2, regexp)
         self.connection.connection.execute("PRAGMA foreign_keys=ON")
 
+        if FREENAS_DATABASE == ':memory:':
+            # In-memory database can't be shared between connections, reads will go through the writer connection
+            return
+
+        self.connection.connection.execute("PRAGMA journal_mode=WAL")
+
+        for i in range(READERS):
+            reader = self.engine.connect()
+            reader.connection.create_function("REGEXP", 2, regexp)
+            reader.connection.execute("PRAGMA query_only=ON")
+            self.readers.put(reader)
+        self.readers_count = READERS
+
+    def _close(self):
+        # Reads submitted meanwhile will wait for the new connections
+        for i in range(self.readers_count):
+            self.readers.get().close()
+        self.readers_count = 0
+
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+        if self.engine is not None:
+            self.engine.dispose()
+            self.engine = None
+
+    @private
+    async def replace(self, path):
+        """
+        Replace database file with `path` and reconnect.
+        """
+        await self.middleware.run_in_executor(self.thread_pool, self._replace, path)
+        await self.middleware.call('datastore.config_cache_invalidate')
+
+    def _replace(self, path):
+        # Closing last connection checkpoints the WAL of the old database and removes it so it can't be applied to
+        # the new one
+        self._close()
+        os.rename(path, FREENAS_DATABASE)
+        self._setup()
+
+    @private
+    def backup(self, path):
+        """
+        Write a consistent copy of the database (including transactions that were not yet checkpointed from the WAL)
+        to `path`.
+        """
+        source = sqlite3.connect(FREENAS_DATABASE)
+        try:
+            dest = sqlite3.connect(path)
+            try:
+                source.backup(dest)
+            finally:
+                dest.close()
+        finally:
+            source.close()
+
     @private
     async def execute(self, *args):
-        return await self.middleware.run_in_executor(self.thread_pool, self.connection.execute, *args)
+        return await self._write(self._execute, *args)
+
+    def _execute(self, sql, *args):
+        result = self.connection.execute(sql, *args)
+        if not result.returns_rows:
+            # Raw SQL (`datastore.sql`) is not replicated to the other controller, only the caches are invalidated
+            binds = args[0] if len(args) == 1 else list(args)
+            self.middleware.call_hook_inline('datastore.post_execute_write', sql, binds, replicate=False)
+        return result
 
     @private
     async def execute_write(self, stmt):
+        return await self._write(self._execute_write, *self._compile(stmt))
+
+    def _execute_write(self, sql, binds):
+        result = self.connection.execute(sql, binds)
+        self.middleware.call_hook_inline('datastore.post_execute_write', sql, binds)
+        return result
+
+    @private
+    async def execute_transaction(self, method, *args):
+        """
+        Run `method(execute, *args)` in a single transaction. `execute(stmt)` executes statement `stmt` and returns
+        its result. Statements that return rows are only read and are not passed to the hooks.
+
+        Instead of calling `datastore.post_execute_write` hook for every statement, `datastore.post_execute_write_many`
+        hook is called once with the list of all executed `(sql, binds)` when the transaction is committed.
+        """
+        return await self._write(self._execute_transaction, method, *args)
+
+    def _execute_transaction(self, method, *args):
+        queries = []
+
+        def execute(stmt):
+            sql, binds = self._compile(stmt)
+            result = self.connection.execute(sql, binds)
+            if not result.returns_rows:
+                queries.append((sql, binds))
+            return result
+
+        with self.connection.begin():
+            result = method(execute, *args)
+
+        if queries:
+            self.middleware.call_hook_inline('datastore.post_execute_write_many', queries)
+
+        return result
+
+    @private
+    async def execute_many(self, queries):
+        """
+        Execute a list of `(sql, binds)` in a single transaction.
+
+        `datastore.post_execute_write_many` hook is called with `replicate=False` as these queries are either raw SQL
+        or the HA journal being replayed from the other controller.
+        """
+        await self._write(self._execute_many, queries)
+
+    def _execute_many(self, queries):
+        with self.connection.begin():
+            for sql, binds in queries:
+                self.connection.execute(sql, binds)
+
+        self.middleware.call_hook_inline('datastore.post_execute_write_many', queries, replicate=False)
+
+    def _compile(self, stmt):
         compiled = stmt.compile(self.engine)
 
         sql = compiled.string
@@ -59,20 +226,48 @@ class DatastoreService(Service):
             else:
                 binds.append(value)
 
-        return await self.middleware.run_in_executor(self.thread_pool, self._execute_write, sql, binds)
-
-    def _execute_write(self, sql, binds):
-        result = self.connection.execute(sql, binds)
-        self.middleware.call_hook_inline('datastore.post_execute_write', sql, binds)
-        return result
+        return sql, binds
 
     @private
     async def fetchall(self, *args):
-        return await self.middleware.run_in_executor(self.thread_pool, self._fetchall, *args)
+        if FREENAS_DATABASE == ':memory:':
+            return await self._write(self._fetchall, self.connection, *args)
 
-    def _fetchall(self, query, params=None):
-        cursor = self.connection.execute(query, params or [])
+        submitted = self.read_stats.submit()
+        return await self.middleware.run_in_executor(self.read_thread_pool, self._read, submitted, *args)
+
+    def _read(self, submitted, *args):
+        reader = self.readers.get()
+        self.read_stats.start(submitted)
+        try:
+            return self._fetchall(reader, *args)
+        finally:
+            self.readers.put(reader)
+
+    def _fetchall(self, connection, query, params=None):
+        cursor = connection.execute(query, params or [])
         try:
             return cursor.fetchall()
         finally:
             cursor.close()
+
+    async def _write(self, method, *args):
+        submitted = self.write_stats.submit()
+        return await self.middleware.run_in_executor(self.thread_pool, self._run_write, submitted, method, *args)
+
+    def _run_write(self, submitted, method, *args):
+        self.write_stats.start(submitted)
+        return method(*args)
+
+    @accepts()
+    async def connection_stats(self):
+        """
+        Get datastore connections statistics.
+
+        `queued` is the number of calls waiting to be executed, `wait_time` is the total time (in seconds) calls spent
+        waiting for the connection.
+        """
+        return {
+            'read': self.read_stats.dump(),
+            'write': self.write_stats.dump(),
+        }
@@ -59,6 +59,38 @@ class DatastoreService(Service):
                 cleared=True,
             )
 
+    async def send_bulk_events(self, datastore, inserted, updated, deleted):
+        """
+        Send events for rows changed by `datastore.bulk`. `inserted` maps primary keys of inserted rows to
+        inserted values, `updated` and `deleted` are sets of primary keys. Only one event is sent for each row.
+        """
+        updated = updated - set(inserted) - deleted
+        inserted = [row for pk, row in inserted.items() if pk not in deleted]
+
+        for options in self.events[datastore]:
+            ids = [row[options["prefix"] + options["id"]] for row in inserted] + list(updated)
+            if ids:
+                fields = {
+                    row[options["id"]]: row
+                    for row in await self.middleware.call(
+                        f"{options['plugin']}.query", [[options["id"], "in", ids]],
+                    )
+                }
+            else:
+                fields = {}
+
+            for row in inserted:
+                id = row[options["prefix"] + options["id"]]
+                if id in fields:
+                    await self._send_event(options, "ADDED", id=id, fields=fields[id])
+
+            for id in updated:
+                if id in fields:
+                    await self._send_event(options, "CHANGED", id=id, fields=fields[id])
+
+            for id in deleted:
+                await self._send_event(options, "CHANGED", id=id, cleared=True)
+
     async def _fields(self, options, row, get=True):
         return await self.middleware.call(
             f"{options['plugin']}.query",
@@ -208,32 +208,34 @@ class DatastoreService(Service, FilterMixin, SchemaMixin):
         else:
             extend_context_value = None
 
-        result = []
-        for i, row in enumerate(qs):
-            result.append(await self._serialize(
-                row, table, aliases, relationships[i],
-                extend, extend_context, extend_context_value, field_prefix, select
-            ))
+        result = [
+            self._serialize(row, table, aliases, relationships[i], field_prefix)
+            for i, row in enumerate(qs)
+        ]
+
+        if extend:
+            if hasattr(self.middleware._method_lookup(extend)[1], '_batch_extend'):
+                if extend_context:
+                    result = await self.middleware.call(extend, result, extend_context_value)
+                else:
+                    result = await self.middleware.call(extend, result)
+            else:
+                for i, data in enumerate(result):
+                    if extend_context:
+                        result[i] = await self.middleware.call(extend, data, extend_context_value)
+                    else:
+                        result[i] = await self.middleware.call(extend, data)
+
+        if select:
+            result = [{k: v for k, v in data.items() if k in select} for data in result]
 
         return result
 
-    async def _serialize(self, obj, table, aliases, relationships, extend, extend_context, extend_context_value,
-                         field_prefix, select):
+    def _serialize(self, obj, table, aliases, relationships, field_prefix):
         data = self._serialize_row(obj, table, aliases)
         data.update(relationships)
 
-        data = {self._strip_prefix(k, field_prefix): v for k, v in data.items()}
-
-        if extend:
-            if extend_context:
-                data = await self.middleware.call(extend, data, extend_context_value)
-            else:
-                data = await self.middleware.call(extend, data)
-
-        if not select:
-            return data
-        else:
-            return {k: v for k, v in data.items() if k in select}
+        return {self._strip_prefix(k, field_prefix): v for k, v in data.items()}
 
     def _strip_prefix(self, k, field_prefix):
         return k[len(field_prefix):] if field_prefix and k.startswith(field_prefix) else k
@@ -39,6 +39,18 @@ class DatastoreService(Service, SchemaMixin):
                 return [dict(row) for row in await self.middleware.call('datastore.fetchall', query, *args)]
             else:
                 await self.middleware.call('datastore.execute', query, *args)
+                await self.middleware.call('datastore.config_cache_invalidate')
+        except Exception as e:
+            raise CallError(e)
+
+    @private
+    async def sql_many(self, queries):
+        """
+        Execute a list of `[query, params]` write queries in a single transaction.
+        """
+        try:
+            await self.middleware.call('datastore.execute_many', queries)
+            await self.middleware.call('datastore.config_cache_invalidate')
         except Exception as e:
             raise CallError(e)
 
@@ -1,7 +1,7 @@
-from sqlalchemy import and_, types
+from sqlalchemy import and_, select, types
 from sqlalchemy.sql import sqltypes
 
-from middlewared.schema import accepts, Any, Dict, Str
+from middlewared.schema import accepts, Any, Dict, List, Str
 from middlewared.service import Service
 
 from .filter import FilterMixin
@@ -19,24 +19,14 @@ class DatastoreService(Service, FilterMixin, SchemaMixin):
         Insert a new entry to `name`.
         """
         table = self._get_table(name)
-        insert, relationships = self._extract_relationships(table, options['prefix'], data)
+        insert, relationships = self._prepare_insert(table, data, options)
 
-        for column in table.c:
-            if column.default is not None:
-                insert.setdefault(column.name, column.default.arg)
-            if not column.nullable:
-                if isinstance(column.type, (types.String, types.Text)):
-                    insert.setdefault(column.name, '')
-
-        await self.middleware.call('datastore.execute_write', table.insert().values(**insert))
-        pk_column = self._get_pk(table)
-        if type(pk_column.type) == sqltypes.Integer:
-            pk = (await self.middleware.call('datastore.fetchall', 'SELECT last_insert_rowid()'))[0][0]
-        else:
-            pk = insert[pk_column.name]
+        result = await self.middleware.call('datastore.execute_write', table.insert().values(**insert))
+        pk = self._inserted_pk(table, insert, result)
 
         await self._handle_relationships(pk, relationships)
 
+        await self.middleware.call('datastore.config_cache_invalidate', name)
         await self.middleware.call('datastore.send_insert_events', name, insert)
 
         return pk
@@ -48,6 +38,46 @@ class DatastoreService(Service, FilterMixin, SchemaMixin):
         Update an entry `id` in `name`.
         """
         table = self._get_table(name)
+        id, update, relationships = await self._prepare_update(name, table, id_or_filters, data, options)
+
+        if update:
+            result = await self.middleware.call(
+                'datastore.execute_write',
+                table.update().values(**update).where(self._where_clause(table, id, options)),
+            )
+            if result.rowcount != 1:
+                raise RuntimeError('No rows were updated')
+
+            await self.middleware.call('datastore.config_cache_invalidate', name)
+            await self.middleware.call('datastore.send_update_events', name, id)
+
+        if relationships:
+            await self._handle_relationships(id, relationships)
+            await self.middleware.call('datastore.config_cache_invalidate', name)
+
+        return id
+
+    def _prepare_insert(self, table, data, options):
+        insert, relationships = self._extract_relationships(table, options['prefix'], data)
+
+        for column in table.c:
+            if column.default is not None:
+                insert.setdefault(column.name, column.default.arg)
+            if not column.nullable:
+                if isinstance(column.type, (types.String, types.Text)):
+                    insert.setdefault(column.name, '')
+
+        return insert, relationships
+
+    def _inserted_pk(self, table, insert, result):
+        pk_column = self._get_pk(table)
+        if type(pk_column.type) == sqltypes.Integer:
+            # `SELECT last_insert_rowid()` would go through one of the read connections
+            return result.lastrowid
+        else:
+            return insert[pk_column.name]
+
+    async def _prepare_update(self, name, table, id_or_filters, data, options):
         data = data.copy()
 
         if isinstance(id_or_filters, list):
@@ -65,20 +95,7 @@ class DatastoreService(Service, FilterMixin, SchemaMixin):
                     data[column.name] = data.pop(column.name[:-3])
 
         update, relationships = self._extract_relationships(table, options['prefix'], data)
-
-        if update:
-            result = await self.middleware.call(
-                'datastore.execute_write',
-                table.update().values(**update).where(self._where_clause(table, id, options)),
-            )
-            if result.rowcount != 1:
-                raise RuntimeError('No rows were updated')
-
-            await self.middleware.call('datastore.send_update_events', name, id)
-
-        await self._handle_relationships(id, relationships)
-
-        return id
+        return id, update, relationships
 
     def _extract_relationships(self, table, prefix, data):
         relationships = self._get_relationships(table)
@@ -95,6 +112,10 @@ class DatastoreService(Service, FilterMixin, SchemaMixin):
         return insert, insert_relationships
 
     async def _handle_relationships(self, pk, relationships):
+        for stmt in self._relationships_statements(pk, relationships):
+            await self.middleware.call('datastore.execute_write', stmt)
+
+    def _relationships_statements(self, pk, relationships):
         for relationship, values in relationships:
             assert len(relationship.synchronize_pairs) == 1
             assert len(relationship.secondary_synchronize_pairs) == 1
@@ -102,19 +123,13 @@ class DatastoreService(Service, FilterMixin, SchemaMixin):
             local_pk, relationship_local_pk = relationship.synchronize_pairs[0]
             remote_pk, relationship_remote_pk = relationship.secondary_synchronize_pairs[0]
 
-            await self.middleware.call(
-                'datastore.execute_write',
-                relationship_local_pk.table.delete().where(relationship_local_pk == pk)
-            )
+            yield relationship_local_pk.table.delete().where(relationship_local_pk == pk)
 
             for value in values:
-                await self.middleware.call(
-                    'datastore.execute_write',
-                    relationship_local_pk.table.insert().values({
-                        relationship_local_pk.name: pk,
-                        relationship_remote_pk.name: value,
-                    })
-                )
+                yield relationship_local_pk.table.insert().values({
+                    relationship_local_pk.name: pk,
+                    relationship_remote_pk.name: value,
+                })
 
     def _where_clause(self, table, id_or_filters, options):
         if isinstance(id_or_filters, list):
@@ -134,8 +149,92 @@ class DatastoreService(Service, FilterMixin, SchemaMixin):
             table.delete().where(self._where_clause(table, id_or_filters, options)),
         )
 
+        await self.middleware.call('datastore.config_cache_invalidate', name)
+
         # FIXME: Sending events for batch deletes not implemented yet
         if not isinstance(id_or_filters, list):
             await self.middleware.call('datastore.send_delete_events', name, id_or_filters)
 
         return True
+
+    @accepts(List('operations', items=[Dict(
+        'operation',
+        Str('type', enum=['INSERT', 'UPDATE', 'DELETE'], required=True),
+        Str('name', required=True),
+        Any('id_or_filters', default=None),
+        Dict('data', additional_attrs=True),
+        Dict('options', Str('prefix', default='')),
+    )]))
+    async def bulk(self, operations):
+        """
+        Apply `operations` (`datastore.insert`, `datastore.update` and `datastore.delete` calls described by their
+        `type` and arguments) in a single transaction. Either all of them are applied or none is.
+
+        Change events are sent once all operations are applied: one per changed row (including every row removed
+        by a delete with filters), rows are queried once per datastore.
+
+        Returns list of primary keys of inserted/updated rows (`null` for deletes).
+        """
+        prepared = []
+        for operation in operations:
+            table = self._get_table(operation['name'])
+            if operation['type'] == 'INSERT':
+                prepared.append((operation, table, None) + self._prepare_insert(
+                    table, operation['data'], operation['options'],
+                ))
+            elif operation['type'] == 'UPDATE':
+                prepared.append((operation, table) + await self._prepare_update(
+                    operation['name'], table, operation['id_or_filters'], operation['data'], operation['options'],
+                ))
+            else:
+                prepared.append((operation, table, operation['id_or_filters'], None, None))
+
+        result, deleted_ids = await self.middleware.call('datastore.execute_transaction', self._bulk, prepared)
+
+        events = {}
+        for (operation, table, id, values, relationships), pk, ids in zip(prepared, result, deleted_ids):
+            inserted, updated, deleted = events.setdefault(operation['name'], ({}, set(), set()))
+            if operation['type'] == 'INSERT':
+                inserted[pk] = values
+            elif operation['type'] == 'UPDATE':
+                if values:
+                    updated.add(pk)
+            else:
+                deleted.update(ids)
+
+        for name, (inserted, updated, deleted) in events.items():
+            await self.middleware.call('datastore.config_cache_invalidate', name)
+            await self.middleware.call('datastore.send_bulk_events', name, inserted, updated, deleted)
+
+        return result
+
+    def _bulk(self, execute, prepared):
+        result = []
+        deleted_ids = []
+        for operation, table, id, values, relationships in prepared:
+            deleted_ids.append(None)
+            if operation['type'] == 'INSERT':
+                id = self._inserted_pk(table, values, execute(table.insert().values(**values)))
+            elif operation['type'] == 'UPDATE':
+                if values:
+                    stmt = table.update().values(**values).where(self._where_clause(table, id, operation['options']))
+                    if execute(stmt).rowcount != 1:
+                        raise RuntimeError('No rows were updated')
+            else:
+                where = self._where_clause(table, id, operation['options'])
+                if isinstance(id, list):
+                    # Collect rows matched by filters inside the transaction so that events can be sent for them
+                    deleted_ids[-1] = [row[0] for row in execute(select([self._get_pk(table)]).where(where))]
+                else:
+                    deleted_ids[-1] = [id]
+
+                execute(table.delete().where(where))
+                result.append(None)
+                continue
+
+            for stmt in self._relationships_statements(id, relationships):
+                execute(stmt)
+
+            result.append(id)
+
+        return result, deleted_ids
@@ -38,7 +38,7 @@ class DeviceInfoBase(ServicePartBase):
         raise NotImplementedError()
 
     @private
-    async def get_disks(self):
+    async def get_disks(self, force_rescan=False):
         raise NotImplementedError()
 
     @private
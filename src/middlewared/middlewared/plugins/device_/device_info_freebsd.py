@@ -13,7 +13,8 @@ RE_DISK_NAME = re.compile(r'^([a-z]+)([0-9]+)$')
 
 class DeviceService(Service, DeviceInfoBase):
 
-    async def get_disks(self):
+    async def get_disks(self, force_rescan=False):
+        # GEOM is re-scanned on every call
         disks = {}
         klass = await self.middleware.call('device.retrieve_geom_class', 'DISK')
         if not klass:
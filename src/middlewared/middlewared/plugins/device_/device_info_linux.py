@@ -3,8 +3,7 @@ import os
 import pyudev
 import re
 import subprocess
-
-from lxml import etree
+import threading
 
 from .device_info_base import DeviceInfoBase
 from middlewared.service import private, Service
@@ -12,6 +11,7 @@ from middlewared.service import private, Service
 RE_DISK_SERIAL = re.compile(r'Unit serial number:\s*(.*)')
 RE_SERIAL = re.compile(r'state.*=\s*(\w*).*io (.*)-(\w*)\n.*', re.S | re.A)
 RE_UART_TYPE = re.compile(r'is a\s*(\w+)')
+RE_UDEV_ENC = re.compile(r'\\x([0-9a-fA-F]{2})')
 
 
 class DeviceService(Service, DeviceInfoBase):
@@ -53,61 +53,102 @@ class DeviceService(Service, DeviceInfoBase):
             devices.append(serial_dev)
         return devices
 
-    def get_disks(self):
-        disks = {}
-        lshw_disks = self.retrieve_lshw_disks_data()
+    # In-memory inventory of disks (name -> disk details). It is built on first use and then kept up to date by
+    # `udev_events` so that callers do not have to re-enumerate all devices.
+    disks_inventory = None
+    disks_inventory_lock = threading.Lock()
 
-        for block_device in pyudev.Context().list_devices(subsystem='block', DEVTYPE='disk'):
-            if block_device.sys_name.startswith(('sr', 'md', 'dm-', 'loop', 'zd')):
-                continue
-            device_type = os.path.join('/sys/block', block_device.sys_name, 'device/type')
-            if os.path.exists(device_type):
-                with open(device_type, 'r') as f:
-                    if f.read().strip() != '0':
-                        continue
-            # nvme drives won't have this
+    def get_disks(self, force_rescan=False):
+        with self.disks_inventory_lock:
+            if force_rescan or self.disks_inventory is None:
+                self.disks_inventory = self.scan_disks()
 
-            try:
-                disks[block_device.sys_name] = self.get_disk_details(block_device, self.disk_default.copy(), lshw_disks)
-            except Exception as e:
-                self.middleware.logger.debug(
-                    'Failed to retrieve disk details for %s : %s', block_device.sys_name, str(e)
-                )
+            return {name: disk.copy() for name, disk in self.disks_inventory.items()}
+
+    @private
+    def scan_disks(self):
+        disks = {}
+        for block_device in pyudev.Context().list_devices(subsystem='block', DEVTYPE='disk'):
+            disk = self.retrieve_disk(block_device)
+            if disk is not None:
+                disks[block_device.sys_name] = disk
 
         return disks
 
     @private
-    def retrieve_lshw_disks_data(self):
-        disks_cp = subprocess.Popen(
-            ['lshw', '-xml', '-class', 'disk'], stdout=subprocess.PIPE, stderr=subprocess.PIPE
-        )
-        output, error = disks_cp.communicate()
-        lshw_disks = {}
-        if output:
-            xml = etree.fromstring(output.decode())
-            for child in filter(lambda c: c.get('class') == 'disk', xml.getchildren()):
-                data = {'rotationrate': None}
-                for c in child.getchildren():
-                    if not len(c.getchildren()):
-                        data[c.tag] = c.text
-                    elif c.tag == 'capabilities':
-                        for capability in filter(lambda d: d.text.endswith('rotations per minute'), c.getchildren()):
-                            data['rotationrate'] = capability.get('id')[:-3]
-                lshw_disks[data['logicalname']] = data
-        return lshw_disks
+    def retrieve_disk(self, block_device):
+        if block_device.sys_name.startswith(('sr', 'md', 'dm-', 'loop', 'zd')):
+            return None
+        device_type = os.path.join('/sys/block', block_device.sys_name, 'device/type')
+        if os.path.exists(device_type):
+            with open(device_type, 'r') as f:
+                if f.read().strip() != '0':
+                    return None
+        # nvme drives won't have this
+
+        try:
+            return self.get_disk_details(block_device, self.disk_default.copy())
+        except Exception as e:
+            self.middleware.logger.debug(
+                'Failed to retrieve disk details for %s : %s', block_device.sys_name, str(e)
+            )
+
+    @private
+    def disks_inventory_event(self, action, name):
+        """
+        Update disks inventory according to udev `action` on block device `name`.
+        """
+        with self.disks_inventory_lock:
+            if self.disks_inventory is None:
+                # Not built yet, it will reflect the current state once it is
+                return
+
+            disk = None
+            if action != 'remove':
+                try:
+                    disk = self.retrieve_disk(pyudev.Devices.from_name(pyudev.Context(), 'block', name))
+                except pyudev.DeviceNotFoundByNameError:
+                    pass
+
+            if disk is None:
+                self.disks_inventory.pop(name, None)
+            else:
+                self.disks_inventory[name] = disk
 
     def get_disk(self, name):
-        disk = self.disk_default.copy()
+        with self.disks_inventory_lock:
+            if self.disks_inventory is not None:
+                disk = self.disks_inventory.get(name)
+                return disk.copy() if disk else None
+
         context = pyudev.Context()
         try:
             block_device = pyudev.Devices.from_name(context, 'block', name)
         except pyudev.DeviceNotFoundByNameError:
             return None
 
-        return self.get_disk_details(block_device, disk, self.retrieve_lshw_disks_data())
+        return self.get_disk_details(block_device, self.disk_default.copy())
 
     @private
-    def get_disk_details(self, block_device, disk, lshw_disks):
+    def rotation_rate(self, block_device):
+        rpm = block_device.get('ID_ATA_ROTATION_RATE_RPM')
+        if rpm and rpm.isdigit() and int(rpm) > 1:
+            return rpm
+
+        # SCSI Block Device Characteristics VPD page: bytes 4-5 are MEDIUM ROTATION RATE
+        vpd_path = os.path.join('/sys/block', block_device.sys_name, 'device/vpd_pgb1')
+        if os.path.exists(vpd_path):
+            with open(vpd_path, 'rb') as f:
+                vpd = f.read()
+            if len(vpd) >= 6:
+                rate = int.from_bytes(vpd[4:6], 'big')
+                if 0x0401 <= rate <= 0xfffe:
+                    return str(rate)
+
+        return None
+
+    @private
+    def get_disk_details(self, block_device, disk):
         device_path = os.path.join('/dev', block_device.sys_name)
         disk_sys_path = os.path.join('/sys/block', block_device.sys_name)
         driver_name = os.path.realpath(os.path.join(disk_sys_path, 'device/driver')).split('/')[-1]
@@ -137,24 +178,20 @@ class DeviceService(Service, DeviceInfoBase):
                 'Unable to retrieve %r disk rotational details at %s', disk['name'], type_path
             )
 
-        if device_path in lshw_disks:
-            disk_data = lshw_disks[device_path]
-            if disk['type'] == 'HDD':
-                disk['rotationrate'] = disk_data['rotationrate']
-
-            disk['ident'] = disk['serial'] = disk_data.get('serial', '')
-            disk['size'] = disk['mediasize'] = int(disk_data['size']) if 'size' in disk_data else None
-            disk['descr'] = disk['model'] = disk_data.get('product')
-            if disk['size'] and disk['sectorsize']:
-                disk['blocks'] = int(disk['size'] / disk['sectorsize'])
+        if disk['type'] == 'HDD':
+            disk['rotationrate'] = self.rotation_rate(block_device)
 
-        if not disk['size'] and os.path.exists(os.path.join(disk_sys_path, 'size')):
+        if os.path.exists(os.path.join(disk_sys_path, 'size')):
+            # Size is always reported in 512 byte sectors
             with open(os.path.join(disk_sys_path, 'size'), 'r') as f:
-                disk['blocks'] = int(f.read().strip())
-            disk['size'] = disk['mediasize'] = disk['blocks'] * disk['sectorsize']
+                disk['size'] = disk['mediasize'] = int(f.read().strip()) * 512
+            if disk['sectorsize']:
+                disk['blocks'] = int(disk['size'] / disk['sectorsize'])
 
-        if not disk['serial'] and (block_device.get('ID_SERIAL_SHORT') or block_device.get('ID_SERIAL')):
-            disk['serial'] = block_device.get('ID_SERIAL_SHORT') or block_device.get('ID_SERIAL')
+        disk['serial'] = (
+            block_device.get('ID_SCSI_SERIAL') or block_device.get('ID_SERIAL_SHORT') or
+            block_device.get('ID_SERIAL') or ''
+        )
 
         if not disk['serial']:
             serial_cp = subprocess.Popen(
@@ -165,10 +202,17 @@ class DeviceService(Service, DeviceInfoBase):
             if not serial_cp.returncode:
                 reg = RE_DISK_SERIAL.search(cp_stdout.decode().strip())
                 if reg:
-                    disk['serial'] = disk['ident'] = reg.group(1)
+                    disk['serial'] = reg.group(1)
+
+        disk['ident'] = disk['serial']
+
+        if block_device.get('ID_MODEL_ENC'):
+            disk['model'] = disk['descr'] = RE_UDEV_ENC.sub(
+                lambda m: chr(int(m.group(1), 16)), block_device.get('ID_MODEL_ENC')
+            ).strip() or None
 
         if not disk['model'] and os.path.exists(os.path.join(disk_sys_path, 'device/model')):
-            # For nvme drives, we are unable to retrieve it via lshw
+            # nvme drives do not have udev model
             with open(os.path.join(disk_sys_path, 'device/model'), 'r') as f:
                 disk['model'] = disk['descr'] = f.read().strip()
 
@@ -20,8 +20,17 @@ def udev_events(middleware):
     monitor.filter_by(subsystem='block')
     monitor.filter_by(subsystem='net')
     for device in iter(monitor.poll, None):
+        if device.subsystem == 'block' and device.get('DEVTYPE') == 'disk':
+            # Disks inventory must be up to date before hooks (i.e. `disk.sync`) query it
+            try:
+                middleware.call_sync('device.disks_inventory_event', device.action, device.sys_name)
+            except Exception:
+                middleware.logger.error('Failed to update disks inventory for %r', device.sys_name, exc_info=True)
+
         middleware.call_hook_sync(f'udev.{device.subsystem}', data={**dict(device), 'SYS_NAME': device.sys_name})
 
 
 def setup(middleware):
     start_daemon_thread(target=udev_events, args=(middleware,))
+    # Build disks inventory in advance so the first `device.get_disks` call does not have to
+    start_daemon_thread(target=middleware.call_sync, args=('device.get_disks',))
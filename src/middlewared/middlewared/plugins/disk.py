@@ -10,7 +10,7 @@ except ImportError:
     geom = None
 
 from middlewared.schema import accepts, Bool, Dict, Int, Str
-from middlewared.service import filterable, private, CallError, CRUDService
+from middlewared.service import batch_extend, filterable, private, CallError, CRUDService
 from middlewared.service_exception import ValidationErrors
 import middlewared.sqlalchemy as sa
 from middlewared.utils import osc, run
@@ -76,26 +76,28 @@ class DiskService(CRUDService):
         return await super().query(filters, options)
 
     @private
-    async def disk_extend(self, disk, context):
-        disk.pop('enabled', None)
-        for key in ['acousticlevel', 'advpowermgmt', 'hddstandby']:
-            disk[key] = disk[key].upper()
-        try:
-            disk['size'] = int(disk['size'])
-        except ValueError:
-            disk['size'] = None
-        if disk['multipath_name']:
-            disk['devname'] = f'multipath/{disk["multipath_name"]}'
-        else:
-            disk['devname'] = disk['name']
-        self._expand_enclosure(disk)
-        if context['passwords']:
-            if not disk['passwd']:
-                disk['passwd'] = context['disks_keys'].get(disk['identifier'], '')
-        else:
-            disk.pop('passwd')
-            disk.pop('kmip_uid')
-        return disk
+    @batch_extend
+    async def disk_extend(self, disks, context):
+        for disk in disks:
+            disk.pop('enabled', None)
+            for key in ['acousticlevel', 'advpowermgmt', 'hddstandby']:
+                disk[key] = disk[key].upper()
+            try:
+                disk['size'] = int(disk['size'])
+            except ValueError:
+                disk['size'] = None
+            if disk['multipath_name']:
+                disk['devname'] = f'multipath/{disk["multipath_name"]}'
+            else:
+                disk['devname'] = disk['name']
+            self._expand_enclosure(disk)
+            if context['passwords']:
+                if not disk['passwd']:
+                    disk['passwd'] = context['disks_keys'].get(disk['identifier'], '')
+            else:
+                disk.pop('passwd')
+                disk.pop('kmip_uid')
+        return disks
 
     @private
     async def disk_extend_context(self, extra):
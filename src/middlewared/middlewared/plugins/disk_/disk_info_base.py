@@ -40,6 +40,13 @@ class DiskInfoBase(ServicePartBase):
     async def label_to_disk(self, label, *args):
         raise NotImplementedError()
 
+    @private
+    async def label_to_dev_disk_map(self, labels):
+        """
+        Returns `(label_to_dev(label), label_to_disk(label))` for all `labels` at once
+        """
+        raise NotImplementedError()
+
     @private
     async def get_disk_from_partition(self, part_name):
         raise NotImplementedError()
@@ -11,6 +11,22 @@ from .disk_info_base import DiskInfoBase
 RE_DISKPART = re.compile(r'^([a-z]+\d+)(p\d+)?')
 
 
+def geom_providers(klass):
+    """
+    Map of provider name to the name of geom it belongs to for geom class `klass`
+    """
+    providers = {}
+    for g in klass.xml.iter('geom'):
+        name = g.find('name')
+        if name is None:
+            continue
+        for provider in g.findall('provider'):
+            provider_name = provider.find('name')
+            if provider_name is not None:
+                providers[provider_name.text] = name.text
+    return providers
+
+
 class DiskService(Service, DiskInfoBase):
 
     async def get_dev_size(self, dev):
@@ -97,5 +113,17 @@ class DiskService(Service, DiskInfoBase):
         if part is not None:
             return part.text
 
+    def label_to_dev_disk_map(self, labels):
+        geom.scan()
+        label_devs = geom_providers(geom.class_by_name('LABEL'))
+        part_disks = geom_providers(geom.class_by_name('PART'))
+
+        result = {}
+        for label in labels:
+            name = label[:-4] if label.endswith(('.nop', '.eli')) else label
+            dev = label_devs.get(name)
+            result[label] = (dev, part_disks.get(dev or label))
+        return result
+
     def get_disk_from_partition(self, part_name):
         return self.label_to_disk(part_name, True)
@@ -119,6 +119,13 @@ class DiskService(Service, DiskInfoBase):
         part_disk = self.label_to_dev(label)
         return self.get_disk_from_partition(part_disk) if part_disk else None
 
+    def label_to_dev_disk_map(self, labels):
+        result = {}
+        for label in labels:
+            dev = self.label_to_dev(label)
+            result[label] = (dev, self.get_disk_from_partition(dev) if dev else None)
+        return result
+
     def get_disk_from_partition(self, part_name):
         if not os.path.exists(os.path.join('/dev', part_name)):
             return None
@@ -90,7 +90,12 @@ class DiskService(Service, ServiceChangeMixin):
 
         seen_disks = {}
         serials = []
-        changed = False
+        # All database changes are applied in a single transaction at the end, until then `updated` and `deleted`
+        # track the pending ones
+        operations = []
+        updated = {}
+        deleted = set()
+        enclosure_sync = []
         for disk in (
             await self.middleware.call('datastore.query', 'storage.disk', [], {'order_by': ['disk_expiretime']})
         ):
@@ -103,8 +108,8 @@ class DiskService(Service, ServiceChangeMixin):
                 # dealing with with multipath here
                 if not disk['disk_expiretime']:
                     disk['disk_expiretime'] = datetime.utcnow() + timedelta(days=self.DISK_EXPIRECACHE_DAYS)
-                    await self.middleware.call('datastore.update', 'storage.disk', disk['disk_identifier'], disk)
-                    changed = True
+                    operations.append(self._disk_update_operation(disk))
+                    updated[disk['disk_identifier']] = disk
                 elif disk['disk_expiretime'] < datetime.utcnow():
                     # Disk expire time has surpassed, go ahead and remove it
                     for extent in await self.middleware.call(
@@ -115,8 +120,10 @@ class DiskService(Service, ServiceChangeMixin):
                         asyncio.ensure_future(self.middleware.call(
                             'kmip.reset_sed_disk_password', disk['disk_identifier'], disk['disk_kmip_uid']
                         ))
-                    await self.middleware.call('datastore.delete', 'storage.disk', disk['disk_identifier'])
-                    changed = True
+                    operations.append({
+                        'type': 'DELETE', 'name': 'storage.disk', 'id_or_filters': disk['disk_identifier'],
+                    })
+                    deleted.add(disk['disk_identifier'])
                 continue
             else:
                 disk['disk_expiretime'] = None
@@ -136,19 +143,24 @@ class DiskService(Service, ServiceChangeMixin):
             # Do not issue unnecessary updates, they are slow on HA systems and cause severe boot delays
             # when lots of drives are present
             if self._disk_changed(disk, original_disk):
-                await self.middleware.call('datastore.update', 'storage.disk', disk['disk_identifier'], disk)
-                changed = True
+                operations.append(self._disk_update_operation(disk))
+                updated[disk['disk_identifier']] = disk
 
-            await self.middleware.call('enclosure.sync_disk', disk['disk_identifier'])
+            enclosure_sync.append(disk['disk_identifier'])
 
             seen_disks[name] = disk
 
         for name in sys_disks:
             if name not in seen_disks:
                 disk_identifier = await self.middleware.call('disk.device_to_identifier', name, sys_disks)
-                qs = await self.middleware.call(
-                    'datastore.query', 'storage.disk', [('disk_identifier', '=', disk_identifier)]
-                )
+                if disk_identifier in updated:
+                    qs = [updated[disk_identifier].copy()]
+                elif disk_identifier in deleted:
+                    qs = []
+                else:
+                    qs = await self.middleware.call(
+                        'datastore.query', 'storage.disk', [('disk_identifier', '=', disk_identifier)]
+                    )
                 if qs:
                     new = False
                     disk = qs[0]
@@ -170,18 +182,28 @@ class DiskService(Service, ServiceChangeMixin):
                     # Do not issue unnecessary updates, they are slow on HA systems and cause severe boot delays
                     # when lots of drives are present
                     if self._disk_changed(disk, original_disk):
-                        await self.middleware.call('datastore.update', 'storage.disk', disk['disk_identifier'], disk)
-                        changed = True
+                        operations.append(self._disk_update_operation(disk))
+                        updated[disk['disk_identifier']] = disk
                 else:
-                    await self.middleware.call('datastore.insert', 'storage.disk', disk)
-                    changed = True
+                    operations.append({'type': 'INSERT', 'name': 'storage.disk', 'data': disk})
+                    deleted.discard(disk_identifier)
+
+                enclosure_sync.append(disk['disk_identifier'])
 
-                await self.middleware.call('enclosure.sync_disk', disk['disk_identifier'])
+        changed = bool(operations)
+        if operations:
+            await self.middleware.call('datastore.bulk', operations)
+
+        for disk_identifier in enclosure_sync:
+            await self.middleware.call('enclosure.sync_disk', disk_identifier)
 
         if changed:
             await self.middleware.call('disk.restart_services_after_sync')
         return 'OK'
 
+    def _disk_update_operation(self, disk):
+        return {'type': 'UPDATE', 'name': 'storage.disk', 'id_or_filters': disk['disk_identifier'], 'data': disk}
+
     def _disk_changed(self, disk, original_disk):
         # storage_disk.disk_size is a string
         return dict(disk, disk_size=None if disk.get('disk_size') is None else str(disk['disk_size'])) != original_disk
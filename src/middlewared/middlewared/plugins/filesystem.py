@@ -6,7 +6,10 @@ except ImportError:
     bsd = acl = None
 import errno
 import enum
+import functools
 import grp
+import itertools
+import json
 import os
 import pwd
 import select
@@ -17,13 +20,43 @@ import stat as pystat
 from middlewared.main import EventSource
 from middlewared.schema import Bool, Dict, Int, Ref, List, Str, UnixPerm, accepts
 from middlewared.service import private, CallError, Service, job
-from middlewared.utils import filter_list, osc
+from middlewared.utils import compile_filter, filter_fields, filter_list, filter_select, osc
 from middlewared.plugins.smb import SMBBuiltin
 
 OS_TYPE_FREEBSD = 0x01
 OS_TYPE_LINUX = 0x02
 OS_FLAG = int(osc.IS_FREEBSD) + (int(osc.IS_LINUX) << 1)
 
+POSIX_ACL_ACCESS_XATTR = 'system.posix_acl_access'
+POSIX_ACL_DEFAULT_XATTR = 'system.posix_acl_default'
+# `posix_acl_xattr_header` (version) followed by `posix_acl_xattr_entry` (tag, perm, id) structures
+POSIX_ACL_XATTR_HEADER_SIZE = 4
+POSIX_ACL_XATTR_ENTRY_SIZE = 8
+
+LISTDIR_STAT_FIELDS = {'size', 'mode', 'acl', 'uid', 'gid'}
+
+
+def posix1e_acl_entries(path, xattr):
+    try:
+        value = os.getxattr(path, xattr)
+    except OSError as e:
+        if e.errno in (errno.ENODATA, errno.EOPNOTSUPP):
+            return 0
+        raise
+
+    return (len(value) - POSIX_ACL_XATTR_HEADER_SIZE) // POSIX_ACL_XATTR_ENTRY_SIZE
+
+
+def posix1e_acl_is_trivial(path):
+    """
+    POSIX1e ACL is trivial if access ACL consists only of the owner, group and other entries (which are
+    stored in the file mode) and there is no default ACL.
+    """
+    return (
+        posix1e_acl_entries(path, POSIX_ACL_ACCESS_XATTR) <= 3 and
+        posix1e_acl_entries(path, POSIX_ACL_DEFAULT_XATTR) == 0
+    )
+
 
 class ACLType(enum.Enum):
     NFS4 = (OS_TYPE_FREEBSD, ['tag', 'id', 'perms', 'flags', 'type'])
@@ -161,43 +194,121 @@ class FilesystemService(Service):
           uid(int): user id of entry owner
           gid(int): group id of entry onwer
           acl(bool): extended ACL is present on file
+
+        Entries are only stat'ed (and their ACL checked) if `filters` or `order_by` use these fields or if they are
+        returned. Without `filters` and `order_by`, `offset` and `limit` are applied while the directory is being read.
+        Use `filesystem.listdir_stream` for directories too big to be returned in one response.
         """
+        filters = filters or []
+        options = options or {}
+        with self._scandir(path) as scandir:
+            entries, list_options = self._listdir(scandir, filters, options)
+            result = filter_list(entries, filters, list_options)
+
+        if options.get('count'):
+            return result
+        if options.get('get'):
+            return self._listdir_complete(result, options.get('select'))
+        return [self._listdir_complete(entry, options.get('select')) for entry in result]
+
+    @accepts(Str('path', required=True), Ref('query-filters'), Ref('query-options'))
+    @job(pipes=['output'])
+    def listdir_stream(self, job, path, filters, options):
+        """
+        Same as `filesystem.listdir` but entries are written to the job output as soon as they are read, one JSON
+        object per line. It is meant to be called using `core.download`.
+        """
+        filters = filters or []
+        options = options or {}
+        with self._scandir(path) as scandir:
+            entries, list_options = self._listdir(scandir, filters, options)
+            if options.get('count'):
+                entries = [filter_list(entries, filters, list_options)]
+            elif options.get('get'):
+                entries = [self._listdir_complete(filter_list(entries, filters, list_options), options.get('select'))]
+            else:
+                if options.get('order_by'):
+                    entries = filter_list(entries, filters, list_options)
+                else:
+                    predicates = [compile_filter(f) for f in filters]
+                    entries = (entry for entry in entries if all(predicate(entry) for predicate in predicates))
+                    offset = list_options.get('offset') or 0
+                    limit = list_options.get('limit') or None
+                    entries = itertools.islice(entries, offset, offset + limit if limit else None)
+
+                entries = (self._listdir_complete(entry, options.get('select')) for entry in entries)
+
+            for entry in entries:
+                job.pipes.output.w.write(json.dumps(entry).encode() + b'\n')
+
+    def _scandir(self, path):
         if not os.path.exists(path):
             raise CallError(f'Directory {path} does not exist', errno.ENOENT)
 
         if not os.path.isdir(path):
             raise CallError(f'Path {path} is not a directory', errno.ENOTDIR)
 
-        rv = []
-        for entry in os.scandir(path):
-            if entry.is_symlink():
-                etype = 'SYMLINK'
-            elif entry.is_dir():
-                etype = 'DIRECTORY'
-            elif entry.is_file():
-                etype = 'FILE'
-            else:
-                etype = 'OTHER'
+        return os.scandir(path)
 
-            data = {
-                'name': entry.name,
-                'path': entry.path,
-                'realpath': os.path.realpath(entry.path) if etype == 'SYMLINK' else entry.path,
-                'type': etype,
-            }
-            try:
-                stat = entry.stat()
-                data.update({
-                    'size': stat.st_size,
-                    'mode': stat.st_mode,
-                    'acl': False if self.acl_is_trivial(data["realpath"]) else True,
-                    'uid': stat.st_uid,
-                    'gid': stat.st_gid,
-                })
-            except FileNotFoundError:
-                data.update({'size': None, 'mode': None, 'acl': None, 'uid': None, 'gid': None})
-            rv.append(data)
-        return filter_list(rv, filters=filters or [], options=options or {})
+    def _listdir(self, scandir, filters, options):
+        """
+        Lazily build `listdir` entries from `scandir` iterator. Only the fields used by `filters` and `order_by` are
+        computed, `_listdir_complete` fills in the rest for the entries that are returned.
+
+        Returns the entries and options for `filter_list` (without `select` and `offset`/`limit` that were already
+        applied).
+        """
+        fields = filter_fields(filters) | {o.lstrip('-').split('.')[0] for o in options.get('order_by') or []}
+        options = {k: v for k, v in options.items() if k != 'select'}
+
+        if not filters and not any(options.get(k) for k in ('order_by', 'count', 'get')):
+            offset = options.get('offset') or 0
+            limit = options.get('limit') or None
+            scandir = itertools.islice(scandir, offset, offset + limit if limit else None)
+            options.update(offset=0, limit=0)
+
+        return (self._listdir_entry(entry, fields) for entry in scandir), options
+
+    def _listdir_entry(self, entry, fields):
+        if entry.is_symlink():
+            etype = 'SYMLINK'
+        elif entry.is_dir():
+            etype = 'DIRECTORY'
+        elif entry.is_file():
+            etype = 'FILE'
+        else:
+            etype = 'OTHER'
+
+        data = {
+            'name': entry.name,
+            'path': entry.path,
+            'realpath': os.path.realpath(entry.path) if etype == 'SYMLINK' else entry.path,
+            'type': etype,
+        }
+        if fields & LISTDIR_STAT_FIELDS:
+            self._listdir_stat(data, entry.stat, 'acl' in fields)
+        return data
+
+    def _listdir_complete(self, data, select):
+        fields = LISTDIR_STAT_FIELDS & {s.split('.')[0] for s in select} if select else LISTDIR_STAT_FIELDS
+        if any(field not in data for field in fields):
+            self._listdir_stat(data, functools.partial(os.stat, data['path']), 'acl' in fields)
+
+        return filter_select(data, select) if select else data
+
+    def _listdir_stat(self, data, stat, acl):
+        try:
+            stat = stat()
+            data.update({
+                'size': stat.st_size,
+                'mode': stat.st_mode,
+                'uid': stat.st_uid,
+                'gid': stat.st_gid,
+            })
+            if acl and 'acl' not in data:
+                data['acl'] = not self._acl_is_trivial(data['realpath'])
+        except FileNotFoundError:
+            data.update({'size': None, 'mode': None, 'acl': None, 'uid': None, 'gid': None})
 
     @accepts(Str('path'))
     def stat(self, path):
@@ -451,9 +562,11 @@ class FilesystemService(Service):
         if not os.path.exists(path):
             raise CallError(f'Path not found [{path}].', errno.ENOENT)
 
+        return self._acl_is_trivial(path)
+
+    def _acl_is_trivial(self, path):
         if osc.IS_LINUX:
-            posix1e_acl = self.getacl_posix1e(path, True)
-            return True if len(posix1e_acl['acl']) == 3 else False
+            return posix1e_acl_is_trivial(path)
 
         if not os.pathconf(path, 64):
             return True
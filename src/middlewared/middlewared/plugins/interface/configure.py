@@ -126,16 +126,26 @@ class InterfaceService(Service):
             os.kill(dhclient_pid, signal.SIGTERM)
 
         # Remove addresses configured and not in database
+        addrs_remove = []
+        addrs_replace = []
         for addr in addrs_configured:
             if has_ipv6 and str(addr.address).startswith('fe80::'):
                 continue
             if addr not in addrs_database:
                 self.logger.debug('{}: removing {}'.format(name, addr))
-                iface.remove_address(addr)
+                addrs_remove.append(addr)
             else:
                 if osc.IS_LINUX and not data['int_dhcp']:
                     self.logger.debug('{}: removing possible valid_lft and preferred_lft on {}'.format(name, addr))
-                    iface.replace_address(addr)
+                    addrs_replace.append(addr)
+
+        if osc.IS_LINUX:
+            # Address changes are applied in a single batch
+            iface.remove_addresses(addrs_remove)
+            iface.replace_addresses(addrs_replace)
+        else:
+            for addr in addrs_remove:
+                iface.remove_address(addr)
 
         # carp must be configured after removing addresses
         # in case removing the address removes the carp
@@ -149,9 +159,14 @@ class InterfaceService(Service):
             iface.carp_config = [netif.CarpConfig(carp_vhid, advskew=advskew, key=carp_pass.encode())]
 
         # Add addresses in database and not configured
-        for addr in (addrs_database - addrs_configured):
+        addrs_add = addrs_database - addrs_configured
+        for addr in addrs_add:
             self.logger.debug('{}: adding {}'.format(name, addr))
-            iface.add_address(addr)
+        if osc.IS_LINUX:
+            iface.add_addresses(addrs_add)
+        else:
+            for addr in addrs_add:
+                iface.add_address(addr)
 
         # Apply interface options specified in GUI
         if data['int_options']:
@@ -209,8 +224,11 @@ class InterfaceService(Service):
         name = iface.name
 
         # Interface not in database lose addresses
-        for address in iface.addresses:
-            iface.remove_address(address)
+        if osc.IS_LINUX:
+            iface.remove_addresses(iface.addresses)
+        else:
+            for address in iface.addresses:
+                iface.remove_address(address)
 
         dhclient_running, dhclient_pid = self.middleware.call_sync('interface.dhclient_status', name)
         # Kill dhclient if its running for this interface
@@ -0,0 +1,280 @@
+# -*- coding=utf-8 -*-
+from collections import namedtuple
+import ipaddress
+import json
+import logging
+import socket
+import struct
+
+import netifaces
+
+from .address.ipv6 import ipv6_netmask_to_prefixlen
+from .address.types import AddressFamily, InterfaceAddress, LinkAddress
+from .bits import InterfaceLinkState
+from .rtnetlink import (
+    IFA_ADDRESS, IFA_LOCAL, IFADDRMSG, IFF_UP, IFINFOMSG, IFLA_ADDRESS, IFLA_BOND_MODE, IFLA_IFNAME,
+    IFLA_INFO_DATA, IFLA_INFO_KIND, IFLA_LINK, IFLA_LINKINFO, IFLA_MASTER, IFLA_MTU, IFLA_OPERSTATE, IFLA_VLAN_ID,
+    NLM_F_CREATE, NLM_F_EXCL, NLM_F_REPLACE, RTM_DELADDR, RTM_DELLINK, RTM_GETADDR, RTM_GETLINK, RTM_NEWADDR,
+    RTM_NEWLINK, RTNetlink, attr, attr_str, attr_u32, ifaddrmsg, ifinfomsg,
+)
+from .utils import run
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["get_backend", "set_backend"]
+
+Link = namedtuple("Link", ["index", "name", "mtu", "flags", "link_state", "address", "master"])
+
+BOND_MODES = {
+    "balance-rr": 0,
+    "active-backup": 1,
+    "balance-xor": 2,
+    "broadcast": 3,
+    "802.3ad": 4,
+    "balance-tlb": 5,
+    "balance-alb": 6,
+}
+
+# include/uapi/linux/if.h IF_OPER_*
+OPERSTATES = {
+    2: InterfaceLinkState.LINK_STATE_DOWN,
+    6: InterfaceLinkState.LINK_STATE_UP,
+}
+
+
+def address_prefixlen(address):
+    netmask = str(address.netmask)
+    if isinstance(address.address, ipaddress.IPv6Address):
+        return ipv6_netmask_to_prefixlen(netmask)
+
+    return netmask
+
+
+class IPBackend:
+    """
+    Configures interfaces by running `ip` and `bridge` utilities.
+    """
+
+    def link_add(self, name, kind, parent=None, vlan_id=None):
+        if kind == "vlan":
+            run(["ip", "link", "add", "link", parent, "name", name, "type", "vlan", "id", str(vlan_id)])
+        else:
+            run(["ip", "link", "add", name, "type", kind])
+
+    def link_delete(self, name):
+        run(["ip", "link", "delete", name])
+
+    def link_set(self, name, **kwargs):
+        if "master" in kwargs:
+            if kwargs["master"] is None:
+                run(["ip", "link", "set", name, "nomaster"])
+            else:
+                run(["ip", "link", "set", name, "master", kwargs["master"]])
+
+        if "mtu" in kwargs:
+            run(["ip", "link", "set", "dev", name, "mtu", str(kwargs["mtu"])])
+
+        if "bond_mode" in kwargs:
+            run(["ip", "link", "set", name, "type", "bond", "mode", kwargs["bond_mode"]])
+
+        if "up" in kwargs:
+            run(["ip", "link", "set", name, "up" if kwargs["up"] else "down"])
+
+    def address_change(self, name, changes):
+        for op, address in changes:
+            run(["ip", "addr", op, f"{address.address}/{address_prefixlen(address)}", "dev", name])
+
+    def dump(self):
+        return None
+
+    def addresses(self, name):
+        addresses = []
+
+        for family, family_addresses in netifaces.ifaddresses(name).items():
+            try:
+                af = AddressFamily(family)
+            except ValueError:
+                logger.warning("Unknown address family %r for interface %r", family, name)
+                continue
+
+            for addr in family_addresses:
+                if af is AddressFamily.LINK:
+                    address = LinkAddress(name, addr["addr"])
+                elif af is AddressFamily.INET:
+                    address = ipaddress.IPv4Interface(f'{addr["addr"]}/{addr["netmask"]}')
+                elif af is AddressFamily.INET6:
+                    try:
+                        if "/" in addr["netmask"]:
+                            prefixlen = int(addr["netmask"].split("/")[1])
+                        else:
+                            prefixlen = ipv6_netmask_to_prefixlen(addr["netmask"])
+                    except ValueError:
+                        logger.warning("Invalid IPv6 netmask %r for interface %r", addr["netmask"], name)
+                        continue
+
+                    address = ipaddress.IPv6Interface(f'{addr["addr"].split("%")[0]}/{prefixlen}')
+                else:
+                    continue
+
+                addresses.append(InterfaceAddress(af, address))
+
+        return addresses
+
+    def bridge_members(self, name):
+        return [
+            link["ifname"]
+            for link in json.loads(run(["bridge", "-json", "link"]).stdout)
+            if link["master"] == name
+        ]
+
+
+class NetlinkBackend:
+    """
+    Configures interfaces over a persistent rtnetlink socket. Address changes of an interface are sent in a single
+    batch and all links and addresses are read with one dump each.
+    """
+
+    def __init__(self):
+        self.netlink = RTNetlink()
+
+    def _index(self, name):
+        try:
+            return socket.if_nametoindex(name)
+        except OSError:
+            raise FileNotFoundError(f"Cannot find device {name!r}")
+
+    def link_add(self, name, kind, parent=None, vlan_id=None):
+        attrs = [attr(IFLA_IFNAME, name)]
+        info = [attr(IFLA_INFO_KIND, kind.encode())]
+        if kind == "vlan":
+            attrs.append(attr(IFLA_LINK, self._index(parent)))
+            info.append(attr(IFLA_INFO_DATA, [attr(IFLA_VLAN_ID, struct.pack("=H", vlan_id))]))
+        attrs.append(attr(IFLA_LINKINFO, info))
+
+        self.netlink.request([
+            (RTM_NEWLINK, NLM_F_CREATE | NLM_F_EXCL, ifinfomsg() + b"".join(attrs), f"Creating {name}"),
+        ])
+
+    def link_delete(self, name):
+        self.netlink.request([(RTM_DELLINK, 0, ifinfomsg(self._index(name)), f"Deleting {name}")])
+
+    def link_set(self, name, **kwargs):
+        index = self._index(name)
+        messages = []
+
+        # Same order as `IPBackend` as ports can only be enslaved and bonding mode changed while the link is down
+        if "master" in kwargs:
+            master = 0 if kwargs["master"] is None else self._index(kwargs["master"])
+            messages.append((RTM_NEWLINK, 0, ifinfomsg(index) + attr(IFLA_MASTER, master),
+                             f"Setting {name} master"))
+
+        if "mtu" in kwargs:
+            messages.append((RTM_NEWLINK, 0, ifinfomsg(index) + attr(IFLA_MTU, kwargs["mtu"]),
+                             f"Setting {name} MTU"))
+
+        if "bond_mode" in kwargs:
+            info = [
+                attr(IFLA_INFO_KIND, b"bond"),
+                attr(IFLA_INFO_DATA, [attr(IFLA_BOND_MODE, bytes([BOND_MODES[kwargs["bond_mode"]]]))]),
+            ]
+            messages.append((RTM_NEWLINK, 0, ifinfomsg(index) + attr(IFLA_LINKINFO, info),
+                             f"Setting {name} bonding mode"))
+
+        if "up" in kwargs:
+            messages.append((RTM_NEWLINK, 0, ifinfomsg(index, IFF_UP if kwargs["up"] else 0, IFF_UP),
+                             f"Setting {name} {'up' if kwargs['up'] else 'down'}"))
+
+        self.netlink.request(messages)
+
+    def address_change(self, name, changes):
+        index = self._index(name)
+        messages = []
+        for op, address in changes:
+            if isinstance(address.address, ipaddress.IPv6Address):
+                family = socket.AF_INET6
+                prefixlen = ipv6_netmask_to_prefixlen(str(address.netmask))
+            else:
+                family = socket.AF_INET
+                prefixlen = ipaddress.IPv4Network(f"0.0.0.0/{address.netmask}").prefixlen
+
+            packed = address.address.packed
+            payload = ifaddrmsg(family, prefixlen, index) + attr(IFA_LOCAL, packed) + attr(IFA_ADDRESS, packed)
+            type, flags = {
+                "add": (RTM_NEWADDR, NLM_F_CREATE | NLM_F_EXCL),
+                "replace": (RTM_NEWADDR, NLM_F_CREATE | NLM_F_REPLACE),
+                "del": (RTM_DELADDR, 0),
+            }[op]
+            messages.append((type, flags, payload, f"{op} {address.address}/{prefixlen} on {name}"))
+
+        self.netlink.request(messages)
+
+    def dump(self):
+        """
+        Returns dictionaries of all links and their addresses by interface name.
+        """
+        links = {}
+        addresses = {}
+        names = {}
+        for header, attrs in self.netlink.dump(RTM_GETLINK, ifinfomsg()):
+            family, type, index, flags, change = IFINFOMSG.unpack(header)
+            name = attr_str(attrs[IFLA_IFNAME])
+            link_address = ":".join(f"{b:02x}" for b in attrs.get(IFLA_ADDRESS, b""))
+            links[name] = Link(
+                index,
+                name,
+                attr_u32(attrs[IFLA_MTU]) if IFLA_MTU in attrs else None,
+                flags,
+                OPERSTATES.get(attrs.get(IFLA_OPERSTATE, b"\0")[0], InterfaceLinkState.LINK_STATE_UNKNOWN),
+                link_address,
+                attr_u32(attrs[IFLA_MASTER]) if IFLA_MASTER in attrs else None,
+            )
+            addresses[name] = [InterfaceAddress(AddressFamily.LINK, LinkAddress(name, link_address))]
+            names[index] = name
+
+        for header, attrs in self.netlink.dump(RTM_GETADDR, ifaddrmsg(socket.AF_UNSPEC, 0, 0)):
+            family, prefixlen, flags, scope, index = IFADDRMSG.unpack(header)
+            name = names.get(index)
+            if name is None:
+                continue
+
+            if family == socket.AF_INET:
+                af = AddressFamily.INET
+                address = ipaddress.IPv4Interface((attrs.get(IFA_LOCAL) or attrs[IFA_ADDRESS], prefixlen))
+            elif family == socket.AF_INET6:
+                af = AddressFamily.INET6
+                address = ipaddress.IPv6Interface((attrs.get(IFA_ADDRESS) or attrs[IFA_LOCAL], prefixlen))
+            else:
+                continue
+
+            addresses[name].append(InterfaceAddress(af, address))
+
+        return links, addresses
+
+    def addresses(self, name):
+        return self.dump()[1][name]
+
+    def bridge_members(self, name):
+        links = self.dump()[0]
+        index = links[name].index
+        return [link.name for link in links.values() if link.master == index]
+
+
+BACKENDS = {
+    "ip": IPBackend,
+    "netlink": NetlinkBackend,
+}
+
+backend = NetlinkBackend()
+
+
+def get_backend():
+    return backend
+
+
+def set_backend(name):
+    """
+    Switch interface configuration backend (`ip` runs `ip` utility for every operation, `netlink` talks to the
+    kernel directly).
+    """
+    global backend
+    backend = BACKENDS[name]()
@@ -1,10 +1,9 @@
 # -*- coding=utf-8 -*-
-import json
 import logging
 
 import middlewared.plugins.interface.netif_linux.interface as interface
 
-from .utils import run
+from .backend import get_backend
 
 logger = logging.getLogger(__name__)
 
@@ -12,21 +11,17 @@ __all__ = ["create_bridge", "BridgeMixin"]
 
 
 def create_bridge(name):
-    run(["ip", "link", "add", name, "type", "bridge"])
+    get_backend().link_add(name, "bridge")
     interface.Interface(name).up()
 
 
 class BridgeMixin:
     def add_member(self, name):
-        run(["ip", "link", "set", name, "master", self.name])
+        get_backend().link_set(name, master=self.name)
 
     def delete_member(self, name):
-        run(["ip", "link", "set", name, "nomaster"])
+        get_backend().link_set(name, master=None)
 
     @property
     def members(self):
-        return [
-            link["ifname"]
-            for link in json.loads(run(["bridge", "-json", "link"]).stdout)
-            if link["master"] == self.name
-        ]
+        return get_backend().bridge_members(self.name)
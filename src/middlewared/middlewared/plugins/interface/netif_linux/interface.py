@@ -2,10 +2,11 @@
 import logging
 
 from .address import AddressFamily, AddressMixin
+from .backend import get_backend
 from .bridge import BridgeMixin
 from .bits import InterfaceFlags, InterfaceLinkState
 from .lagg import LaggMixin
-from .utils import bitmask_to_set, run
+from .utils import bitmask_to_set
 from .vlan import VlanMixin
 
 logger = logging.getLogger(__name__)
@@ -18,8 +19,15 @@ CLONED_PREFIXES = [
 
 
 class Interface(AddressMixin, BridgeMixin, LaggMixin, VlanMixin):
-    def __init__(self, name):
+    def __init__(self, name, link=None, addresses=None):
         self.name = name
+        # Link attributes and addresses read in a single dump by `list_interfaces`
+        self._link = link
+        self._addresses = addresses
+
+    def _invalidate(self):
+        self._link = None
+        self._addresses = None
 
     def _read(self, name, type=str):
         return self._sysfs_read(f"/sys/class/net/{self.name}/{name}", type)
@@ -44,11 +52,15 @@ class Interface(AddressMixin, BridgeMixin, LaggMixin, VlanMixin):
 
     @property
     def mtu(self):
+        if self._link is not None:
+            return self._link.mtu
+
         return self._read("mtu", int)
 
     @mtu.setter
     def mtu(self, mtu):
-        run(["ip", "link", "set", "dev", self.name, "mtu", str(mtu)])
+        self._invalidate()
+        get_backend().link_set(self.name, mtu=mtu)
 
     @property
     def cloned(self):
@@ -60,6 +72,9 @@ class Interface(AddressMixin, BridgeMixin, LaggMixin, VlanMixin):
 
     @property
     def flags(self):
+        if self._link is not None:
+            return bitmask_to_set(self._link.flags, InterfaceFlags)
+
         return bitmask_to_set(self._read("flags", lambda s: int(s, base=16)), InterfaceFlags)
 
     @property
@@ -76,6 +91,9 @@ class Interface(AddressMixin, BridgeMixin, LaggMixin, VlanMixin):
 
     @property
     def link_state(self):
+        if self._link is not None:
+            return self._link.link_state
+
         operstate = self._read("operstate")
 
         return {
@@ -125,7 +143,9 @@ class Interface(AddressMixin, BridgeMixin, LaggMixin, VlanMixin):
         return state
 
     def up(self):
-        run(["ip", "link", "set", self.name, "up"])
+        self._invalidate()
+        get_backend().link_set(self.name, up=True)
 
     def down(self):
-        run(["ip", "link", "set", self.name, "down"])
+        self._invalidate()
+        get_backend().link_set(self.name, up=False)
@@ -4,7 +4,7 @@ import logging
 
 import middlewared.plugins.interface.netif_linux.interface as interface
 
-from .utils import run
+from .backend import get_backend
 
 logger = logging.getLogger(__name__)
 
@@ -18,7 +18,7 @@ class AggregationProtocol(enum.Enum):
 
 
 def create_lagg(name):
-    run(["ip", "link", "add", name, "type", "bond"])
+    get_backend().link_add(name, "bond")
     interface.Interface(name).up()
 
 
@@ -34,11 +34,11 @@ class LaggMixin:
 
     @protocol.setter
     def protocol(self, value):
-        run(["ip", "link", "set", self.name, "down"])
+        self.down()
         for port in self.ports:
             self.delete_port(port[0])
-        run(["ip", "link", "set", self.name, "type", "bond", "mode", value.value])
-        run(["ip", "link", "set", self.name, "up"])
+        get_backend().link_set(self.name, bond_mode=value.value)
+        self.up()
 
     @property
     def ports(self):
@@ -49,7 +49,7 @@ class LaggMixin:
 
     def add_port(self, name):
         interface.Interface(name).down()
-        run(["ip", "link", "set", name, "master", self.name])
+        get_backend().link_set(name, master=self.name)
 
     def delete_port(self, name):
-        run(["ip", "link", "set", name, "nomaster"])
+        get_backend().link_set(name, master=None)
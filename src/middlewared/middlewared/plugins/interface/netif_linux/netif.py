@@ -2,16 +2,16 @@
 import logging
 import os
 
+from .backend import get_backend, set_backend
 from .bridge import create_bridge
 from .interface import Interface
 from .lagg import AggregationProtocol, create_lagg
-from .utils import run
 from .vlan import create_vlan
 
 logger = logging.getLogger(__name__)
 
 __all__ = ["AggregationProtocol", "create_vlan", "create_interface", "destroy_interface", "get_interface",
-           "list_interfaces"]
+           "list_interfaces", "set_backend"]
 
 
 def create_interface(name):
@@ -28,9 +28,9 @@ def create_interface(name):
 
 def destroy_interface(name):
     if name.startswith(("bond", "br", "vlan")):
-        run(["ip", "link", "delete", name])
+        get_backend().link_delete(name)
     else:
-        run(["ip", "link", "set", name, "down"])
+        get_backend().link_set(name, up=False)
 
 
 def get_interface(name):
@@ -38,6 +38,11 @@ def get_interface(name):
 
 
 def list_interfaces():
-    return {name: Interface(name)
-            for name in os.listdir("/sys/class/net")
-            if os.path.isdir(os.path.join("/sys/class/net", name))}
+    dump = get_backend().dump()
+    if dump is None:
+        return {name: Interface(name)
+                for name in os.listdir("/sys/class/net")
+                if os.path.isdir(os.path.join("/sys/class/net", name))}
+
+    links, addresses = dump
+    return {name: Interface(name, link, addresses[name]) for name, link in links.items()}
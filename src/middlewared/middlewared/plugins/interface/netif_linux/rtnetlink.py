@@ -0,0 +1,263 @@
+# -*- coding=utf-8 -*-
+import errno
+import itertools
+import logging
+import os
+import socket
+import struct
+import threading
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["RTNetlink"]
+
+# include/uapi/linux/netlink.h
+NLM_F_REQUEST = 0x01
+NLM_F_MULTI = 0x02
+NLM_F_ACK = 0x04
+NLM_F_DUMP_INTR = 0x10
+NLM_F_DUMP = 0x300
+NLM_F_REPLACE = 0x100
+NLM_F_EXCL = 0x200
+NLM_F_CREATE = 0x400
+
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+
+SOL_NETLINK = 270
+NETLINK_CAP_ACK = 10
+
+# include/uapi/linux/rtnetlink.h
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_GETLINK = 18
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+RTM_GETADDR = 22
+
+# include/uapi/linux/if_link.h
+IFLA_ADDRESS = 1
+IFLA_IFNAME = 3
+IFLA_MTU = 4
+IFLA_LINK = 5
+IFLA_MASTER = 10
+IFLA_OPERSTATE = 16
+IFLA_LINKINFO = 18
+
+IFLA_INFO_KIND = 1
+IFLA_INFO_DATA = 2
+
+IFLA_VLAN_ID = 1
+IFLA_BOND_MODE = 1
+
+# include/uapi/linux/if_addr.h
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+
+IFF_UP = 0x1
+
+NLMSGHDR = struct.Struct("=IHHII")
+NLMSGERR = struct.Struct("=i")
+RTATTR = struct.Struct("=HH")
+IFINFOMSG = struct.Struct("=BxHiII")
+IFADDRMSG = struct.Struct("=BBBBI")
+
+# Keep every batch well below the default socket send buffer size
+BATCH_SIZE = 32768
+
+
+def align(length):
+    return (length + 3) & ~3
+
+
+def attr(type, value):
+    """
+    Encode a single rtattr. `value` can be `bytes`, `str` (NUL-terminated), `int` (u32) or a list of nested
+    attributes.
+    """
+    if isinstance(value, str):
+        value = value.encode() + b"\0"
+    elif isinstance(value, int):
+        value = struct.pack("=I", value)
+    elif isinstance(value, list):
+        value = b"".join(value)
+
+    length = RTATTR.size + len(value)
+    return RTATTR.pack(length, type) + value + b"\0" * (align(length) - length)
+
+
+def parse_attrs(data, offset=0):
+    attrs = {}
+    while offset + RTATTR.size <= len(data):
+        length, type = RTATTR.unpack_from(data, offset)
+        if length < RTATTR.size:
+            break
+
+        # Strip NLA_F_NESTED and NLA_F_NET_BYTEORDER
+        attrs[type & 0x3fff] = data[offset + RTATTR.size:offset + length]
+        offset += align(length)
+
+    return attrs
+
+
+def attr_str(value):
+    return value.split(b"\0", 1)[0].decode("utf-8", "ignore")
+
+
+def attr_u32(value):
+    return struct.unpack("=I", value[:4])[0]
+
+
+def ifinfomsg(index=0, flags=0, change=0, family=socket.AF_UNSPEC):
+    return IFINFOMSG.pack(family, 0, index, flags, change)
+
+
+def ifaddrmsg(family, prefixlen, index):
+    return IFADDRMSG.pack(family, prefixlen, 0, 0, index)
+
+
+def nlmsgerr(code, message):
+    error = OSError(code, f"{message}: {os.strerror(code)}")
+    if code == errno.ENODEV:
+        # Keep the behavior consistent with the callers that expect missing devices to be reported that way
+        error = FileNotFoundError(code, f"{message}: {os.strerror(code)}")
+    return error
+
+
+class RTNetlink:
+    """
+    Minimal rtnetlink client built on `socket.AF_NETLINK`. A single socket is kept open and requests can be sent
+    in batches: all messages of a batch are sent in a single datagram and acknowledged at once.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sock = None
+        self.seq = itertools.count(1)
+
+    def _socket(self):
+        if self.sock is None:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024 * 1024)
+                try:
+                    # Do not echo the whole original request in error messages
+                    sock.setsockopt(SOL_NETLINK, NETLINK_CAP_ACK, 1)
+                except OSError:
+                    pass
+                sock.bind((0, 0))
+            except Exception:
+                sock.close()
+                raise
+
+            self.sock = sock
+
+        return self.sock
+
+    def _messages(self, data):
+        offset = 0
+        while offset + NLMSGHDR.size <= len(data):
+            length, type, flags, seq, pid = NLMSGHDR.unpack_from(data, offset)
+            if length < NLMSGHDR.size:
+                break
+
+            yield type, flags, seq, data[offset + NLMSGHDR.size:offset + length]
+            offset += align(length)
+
+    def request(self, messages):
+        """
+        Send `messages` (a list of `(type, flags, payload, description)`) and wait for all of them to be
+        acknowledged. All messages are processed by the kernel even if some of them fail, the first error is raised
+        afterwards.
+        """
+        errors = []
+        with self.lock:
+            sock = self._socket()
+            batch = []
+            batch_length = 0
+            for message in messages:
+                if batch and batch_length + align(NLMSGHDR.size + len(message[2])) > BATCH_SIZE:
+                    errors.extend(self._request(sock, batch))
+                    batch = []
+                    batch_length = 0
+
+                batch.append(message)
+                batch_length += align(NLMSGHDR.size + len(message[2]))
+
+            if batch:
+                errors.extend(self._request(sock, batch))
+
+        if errors:
+            for error in errors[1:]:
+                logger.debug("%s", error)
+
+            raise errors[0]
+
+    def _request(self, sock, messages):
+        pending = {}
+        data = b""
+        for type, flags, payload, description in messages:
+            seq = next(self.seq)
+            pending[seq] = description
+            length = NLMSGHDR.size + len(payload)
+            data += NLMSGHDR.pack(length, type, flags | NLM_F_REQUEST | NLM_F_ACK, seq, 0) + payload
+            data += b"\0" * (align(length) - length)
+
+        sock.send(data)
+
+        errors = []
+        while pending:
+            for type, flags, seq, payload in self._messages(sock.recv(65536)):
+                if type != NLMSG_ERROR or seq not in pending:
+                    continue
+
+                description = pending.pop(seq)
+                code = -NLMSGERR.unpack_from(payload)[0]
+                if code:
+                    errors.append(nlmsgerr(code, description))
+
+        return errors
+
+    def dump(self, type, payload):
+        """
+        Dump all objects of request `type`. Returns a list of `(payload, attrs)` where `payload` is the fixed
+        header of the message and `attrs` are its parsed attributes.
+        """
+        with self.lock:
+            sock = self._socket()
+            while True:
+                result, interrupted = self._dump(sock, type, payload)
+                if not interrupted:
+                    return result
+
+    def _dump(self, sock, type, payload):
+        seq = next(self.seq)
+        sock.send(NLMSGHDR.pack(NLMSGHDR.size + len(payload), type, NLM_F_REQUEST | NLM_F_DUMP, seq, 0) + payload)
+
+        result = []
+        interrupted = False
+        header_size = len(payload)
+        while True:
+            for msg_type, flags, msg_seq, data in self._messages(sock.recv(1024 * 1024)):
+                if msg_seq != seq:
+                    continue
+
+                if flags & NLM_F_DUMP_INTR:
+                    interrupted = True
+
+                if msg_type == NLMSG_DONE:
+                    return result, interrupted
+
+                if msg_type == NLMSG_ERROR:
+                    code = -NLMSGERR.unpack_from(data)[0]
+                    if code:
+                        raise nlmsgerr(code, f"Dump {type} failed")
+                    continue
+
+                result.append((data[:header_size], parse_attrs(data, align(header_size))))
+
+    def close(self):
+        with self.lock:
+            if self.sock is not None:
+                self.sock.close()
+                self.sock = None
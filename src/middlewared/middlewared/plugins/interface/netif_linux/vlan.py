@@ -7,7 +7,7 @@ import subprocess
 
 import middlewared.plugins.interface.netif_linux.interface as interface
 
-from .utils import run
+from .backend import get_backend
 
 logger = logging.getLogger(__name__)
 
@@ -16,7 +16,7 @@ __all__ = ["create_vlan", "VlanMixin"]
 
 def create_vlan(name, parent, tag):
     try:
-        run(["ip", "link", "add", "link", parent, "name", name, "type", "vlan", "id", str(tag)])
+        get_backend().link_add(name, "vlan", parent=parent, vlan_id=tag)
     except subprocess.CalledProcessError as e:
         if e.stderr.startswith("Cannot find device "):
             raise FileNotFoundError(e.stderr)
@@ -44,4 +44,4 @@ class VlanMixin:
         create_vlan(self.name, parent, tag)
 
     def unconfigure(self):
-        run(["ip", "link", "delete", self.name])
+        get_backend().link_delete(self.name)
@@ -11,6 +11,7 @@ class ISCSIGlobalService(Service, GlobalActionsBase):
 
     class Config:
         datastore_extend = 'iscsi.global.config_extend'
+        datastore_config_cache = False
         datastore_prefix = 'iscsi_'
         service = 'iscsitarget'
         service_model = 'iscsitargetglobalconfiguration'
@@ -23,6 +23,7 @@ class ISCSIGlobalService(SystemServiceService):
 
     class Config:
         datastore_extend = 'iscsi.global.config_extend'
+        datastore_config_cache = False
         datastore_prefix = 'iscsi_'
         service = 'iscsitarget'
         service_model = 'iscsitargetglobalconfiguration'
@@ -63,6 +63,7 @@ class NetworkConfigurationService(ConfigService):
         datastore = 'network.globalconfiguration'
         datastore_prefix = 'gc_'
         datastore_extend = 'network.configuration.network_config_extend'
+        datastore_config_cache = False
 
     @private
     def network_config_extend(self, data):
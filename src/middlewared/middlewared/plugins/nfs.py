@@ -7,7 +7,9 @@ import socket
 from middlewared.common.attachment import FSAttachmentDelegate
 from middlewared.schema import accepts, Bool, Dict, Dir, Int, IPAddr, List, Patch, Str
 from middlewared.validators import Range
-from middlewared.service import private, CRUDService, SystemServiceService, ValidationError, ValidationErrors
+from middlewared.service import (
+    batch_extend, private, CRUDService, SystemServiceService, ValidationError, ValidationErrors
+)
 import middlewared.sqlalchemy as sa
 from middlewared.utils import osc
 from middlewared.utils.asyncio_ import asyncio_map
@@ -41,6 +43,7 @@ class NFSService(SystemServiceService):
         service_verb = "restart"
         datastore_prefix = "nfs_srv_"
         datastore_extend = 'nfs.nfs_extend'
+        datastore_config_cache = False
 
     @private
     async def nfs_extend(self, nfs):
@@ -304,7 +307,7 @@ class SharingNFSService(CRUDService):
                 "prefix": self._config.datastore_prefix
             },
         )
-        await self.extend(data)
+        await self.extend([data])
 
         await self._service_change("nfs", "reload")
 
@@ -340,7 +343,7 @@ class SharingNFSService(CRUDService):
                 "prefix": self._config.datastore_prefix
             }
         )
-        await self.extend(new)
+        await self.extend([new])
 
         await self._service_change("nfs", "reload")
 
@@ -506,11 +509,13 @@ class SharingNFSService(CRUDService):
                 )
 
     @private
-    async def extend(self, data):
-        data["networks"] = data.pop("network").split()
-        data["hosts"] = data["hosts"].split()
-        data["security"] = [s.upper() for s in data["security"]]
-        return data
+    @batch_extend
+    async def extend(self, shares):
+        for data in shares:
+            data["networks"] = data.pop("network").split()
+            data["hosts"] = data["hosts"].split()
+            data["security"] = [s.upper() for s in data["security"]]
+        return shares
 
     @private
     async def compress(self, data):
@@ -18,16 +18,17 @@ from collections import defaultdict
 
 from middlewared.alert.base import AlertCategory, AlertClass, AlertLevel, SimpleOneShotAlertClass
 from middlewared.plugins.disk_.overprovision_base import CanNotBeOverprovisionedException
-from middlewared.plugins.zfs import ZFSSetPropertyError
+from middlewared.plugins.zfs import ZFSSetPropertyError, copy_dataset
 from middlewared.schema import (
     accepts, Attribute, Bool, Cron, Dict, EnumMixin, Int, List, Patch, Str, UnixPerm, Any, Ref,
 )
 from middlewared.service import (
-    ConfigService, filterable, item_method, job, pass_app, private, CallError, CRUDService, ValidationErrors, periodic
+    batch_extend, ConfigService, filterable, item_method, job, pass_app, private, CallError, CRUDService,
+    ValidationErrors, periodic
 )
 from middlewared.service_exception import ValidationError
 import middlewared.sqlalchemy as sa
-from middlewared.utils import osc, Popen, filter_list, run, start_daemon_thread
+from middlewared.utils import osc, Popen, filter_fields, filter_list, run, start_daemon_thread
 from middlewared.utils.asyncio_ import asyncio_map
 from middlewared.utils.shell import join_commandline
 from middlewared.validators import Exact, Match, Or, Range, Time
@@ -106,6 +107,74 @@ def _null(x):
     return x
 
 
+# (zfs property, pool.dataset.query field (if it differs), value transformation)
+DATASET_PROPERTIES = (
+    ('org.freenas:description', 'comments', None),
+    ('org.freenas:quota_warning', 'quota_warning', None),
+    ('org.freenas:quota_critical', 'quota_critical', None),
+    ('org.freenas:refquota_warning', 'refquota_warning', None),
+    ('org.freenas:refquota_critical', 'refquota_critical', None),
+    ('org.truenas:managedby', 'managedby', None),
+    ('dedup', 'deduplication', str.upper),
+    ('aclmode', None, str.upper),
+    ('acltype', None, str.upper),
+    ('xattr', None, str.upper),
+    ('atime', None, str.upper),
+    ('casesensitivity', None, str.upper),
+    ('exec', None, str.upper),
+    ('sync', None, str.upper),
+    ('compression', None, str.upper),
+    ('compressratio', None, None),
+    ('origin', None, None),
+    ('quota', None, _null),
+    ('refquota', None, _null),
+    ('reservation', None, _null),
+    ('refreservation', None, _null),
+    ('copies', None, None),
+    ('snapdir', None, str.upper),
+    ('readonly', None, str.upper),
+    ('recordsize', None, None),
+    ('sparse', None, None),
+    ('volsize', None, None),
+    ('volblocksize', None, None),
+    ('keyformat', 'key_format', lambda o: o.upper() if o != 'none' else None),
+    ('encryption', 'encryption_algorithm', lambda o: o.upper() if o != 'off' else None),
+    ('used', None, None),
+    ('available', None, None),
+    ('special_small_blocks', 'special_small_block_size', None),
+    ('pbkdf2iters', None, None),
+)
+# pool.dataset.query fields that do not come from dataset properties
+DATASET_FIELDS = ('id', 'name', 'pool', 'type', 'encrypted', 'encryption_root', 'key_loaded', 'locked', 'children')
+
+
+def dataset_query_properties(filters, options):
+    """
+    Returns `properties` and `user_properties` arguments of `zfs.dataset.query` that are just enough to satisfy
+    `pool.dataset.query` `filters` and `options` (`None` meaning all properties are needed).
+    """
+    if not options.get('select'):
+        return None, True
+
+    fields = (
+        {s.split('.')[0] for s in options['select']} |
+        filter_fields(filters or []) |
+        {o.lstrip('-').split('.')[0] for o in options.get('order_by') or []}
+    )
+    properties = {new_name or orig_name: orig_name for orig_name, new_name, method in DATASET_PROPERTIES}
+    properties['mountpoint'] = 'mountpoint'
+    if fields - set(properties) - set(DATASET_FIELDS):
+        return None, True
+
+    props = [properties[field] for field in sorted(fields) if field in properties]
+    user_props = [prop for prop in props if ':' in prop]
+    if user_props:
+        # User properties are retrieved all at once
+        return [prop for prop in props if prop not in user_props], True
+
+    return props, False
+
+
 class ScrubError(CallError):
     pass
 
@@ -246,6 +315,7 @@ class PoolService(CRUDService):
     class Config:
         datastore = 'storage.volume'
         datastore_extend = 'pool.pool_extend'
+        datastore_extend_context = 'pool.pool_extend_context'
         datastore_prefix = 'vol_'
 
     @item_method
@@ -390,78 +460,119 @@ class PoolService(CRUDService):
         )
         return True
 
-    def _topology(self, x, options=None):
+    def _topology(self, x, labels):
         """
         Transform topology output from libzfs to add `device` and make `type` uppercase.
+
+        `labels` is a `disk.label_to_dev_disk_map` result for all the devices in the topology.
         """
-        options = options or {}
         if isinstance(x, dict):
             path = x.get('path')
             if path is not None:
                 device = disk = None
                 if path.startswith('/dev/'):
-                    args = [path[5:]] + ([] if osc.IS_LINUX else [options.get('geom_scan', True)])
-                    device = self.middleware.call_sync('disk.label_to_dev', *args)
-                    disk = self.middleware.call_sync('disk.label_to_disk', *args)
+                    device, disk = labels.get(path[5:], (None, None))
                 x['device'] = device
                 x['disk'] = disk
             for key in x:
                 if key == 'type' and isinstance(x[key], str):
                     x[key] = x[key].upper()
                 else:
-                    x[key] = self._topology(x[key], {'geom_scan': False})
+                    x[key] = self._topology(x[key], labels)
         elif isinstance(x, list):
             for i, entry in enumerate(x):
-                x[i] = self._topology(x[i], {'geom_scan': False})
+                x[i] = self._topology(x[i], labels)
         return x
 
+    def _topology_labels(self, x):
+        """
+        Labels of all the devices in topology output from libzfs.
+        """
+        labels = set()
+        if isinstance(x, dict):
+            path = x.get('path')
+            if isinstance(path, str) and path.startswith('/dev/'):
+                labels.add(path[5:])
+            for value in x.values():
+                labels |= self._topology_labels(value)
+        elif isinstance(x, list):
+            for entry in x:
+                labels |= self._topology_labels(entry)
+        return labels
+
+    @private
+    def pool_extend_context(self, extra):
+        """
+        Retrieve the state of all pools and resolve all their device labels at once so that `pool_extend`
+        does not need to do that for every pool/device.
+        """
+        try:
+            zpools = {zpool['name']: zpool for zpool in self.middleware.call_sync('zfs.pool.query')}
+        except Exception:
+            zpools = {}
+
+        labels = set()
+        for zpool in zpools.values():
+            labels |= self._topology_labels(zpool['groups'])
+
+        return {
+            'zpools': zpools,
+            'labels': self.middleware.call_sync('disk.label_to_dev_disk_map', list(labels)) if labels else {},
+        }
+
     @private
-    def pool_extend(self, pool):
+    @batch_extend
+    def pool_extend(self, pools, context=None):
 
         """
         If pool is encrypted we need to check if the pool is imported
         or if all geli providers exist.
         """
-        pool['path'] = f'/mnt/{pool["name"]}'
-        try:
-            zpool = self.middleware.call_sync('zfs.pool.query', [('id', '=', pool['name'])])[0]
-        except Exception:
-            zpool = None
-
-        if zpool:
-            pool.update({
-                'status': zpool['status'],
-                'scan': zpool['scan'],
-                'topology': self._topology(zpool['groups']),
-                'healthy': zpool['healthy'],
-                'status_detail': zpool['status_detail'],
-            })
-        else:
-            pool.update({
-                'status': 'OFFLINE',
-                'scan': None,
-                'topology': None,
-                'healthy': False,
-                'status_detail': None,
-            })
+        if context is None:
+            context = self.pool_extend_context({})
+        zpools = context['zpools']
+
+        encrypted_providers = None
+        for pool in pools:
+            pool['path'] = f'/mnt/{pool["name"]}'
+            zpool = zpools.get(pool['name'])
 
-        if osc.IS_FREEBSD and pool['encrypt'] > 0:
             if zpool:
-                pool['is_decrypted'] = True
+                pool.update({
+                    'status': zpool['status'],
+                    'scan': zpool['scan'],
+                    'topology': self._topology(zpool['groups'], context['labels']),
+                    'healthy': zpool['healthy'],
+                    'status_detail': zpool['status_detail'],
+                })
             else:
-                decrypted = True
-                for ed in self.middleware.call_sync(
-                    'datastore.query', 'storage.encrypteddisk', [('encrypted_volume', '=', pool['id'])]
-                ):
-                    if not os.path.exists(f'/dev/{ed["encrypted_provider"]}.eli'):
-                        decrypted = False
-                        break
-                pool['is_decrypted'] = decrypted
-            pool['encryptkey_path'] = os.path.join(GELI_KEYPATH, f'{pool["encryptkey"]}.key')
-        else:
-            pool['encryptkey_path'] = None
-            pool['is_decrypted'] = True
-        return pool
+                pool.update({
+                    'status': 'OFFLINE',
+                    'scan': None,
+                    'topology': None,
+                    'healthy': False,
+                    'status_detail': None,
+                })
+
+            if osc.IS_FREEBSD and pool['encrypt'] > 0:
+                if zpool:
+                    pool['is_decrypted'] = True
+                else:
+                    if encrypted_providers is None:
+                        encrypted_providers = defaultdict(list)
+                        for ed in self.middleware.call_sync(
+                            'datastore.query', 'storage.encrypteddisk', [], {'relationships': False}
+                        ):
+                            encrypted_providers[ed['encrypted_volume_id']].append(ed['encrypted_provider'])
+
+                    pool['is_decrypted'] = all(
+                        os.path.exists(f'/dev/{provider}.eli') for provider in encrypted_providers[pool['id']]
+                    )
+                pool['encryptkey_path'] = os.path.join(GELI_KEYPATH, f'{pool["encryptkey"]}.key')
+            else:
+                pool['encryptkey_path'] = None
+                pool['is_decrypted'] = True
+        return pools
 
     @accepts(Dict(
         'pool_create',
@@ -2587,6 +2698,9 @@ class PoolDatasetService(CRUDService):
         The second type is hierarchical, where only top level datasets are returned in the list. They contain all the
         children in the `children` key. This retrieval type is slightly faster.
         These options are controlled by the `query-options.extra.flat` attribute (default true).
+
+        When `query-options.select` is specified, only the dataset properties needed for the selected, filtered and
+        ordered fields are retrieved.
         """
         # Optimization for cases in which they can be filtered at zfs.dataset.query
         zfsfilters = []
@@ -2601,54 +2715,32 @@ class PoolDatasetService(CRUDService):
                 if f[0] in ('id', 'name', 'pool', 'type'):
                     zfsfilters.append(f)
 
-        return filter_list(
-            self.__transform(self.middleware.call_sync(
-                'zfs.dataset.query', zfsfilters, {'extra': {'flat': options.get('extra', {}).get('flat', True)}})
-            ), filters, options
-        )
+        flat = options.get('extra', {}).get('flat', True)
+        props, user_props = dataset_query_properties(filters, options)
+        # Flat datasets share their children so each of them is retrieved and transformed only once
+        datasets = self.__transform(self.middleware.call_sync(
+            'zfs.dataset.query', zfsfilters, {'extra': {
+                'flat': flat, 'flat_children': 'SHARED', 'properties': props, 'user_properties': user_props,
+            }}
+        ))
+        result = filter_list(datasets, filters, options)
+        if flat:
+            result = copy_dataset(result)
+        return result
 
     def __transform(self, datasets):
         """
         We need to transform the data zfs gives us to make it consistent/user-friendly,
         making it match whatever pool.dataset.{create,update} uses as input.
         """
+        transformed = set()
+
         def transform(dataset):
-            for orig_name, new_name, method in (
-                ('org.freenas:description', 'comments', None),
-                ('org.freenas:quota_warning', 'quota_warning', None),
-                ('org.freenas:quota_critical', 'quota_critical', None),
-                ('org.freenas:refquota_warning', 'refquota_warning', None),
-                ('org.freenas:refquota_critical', 'refquota_critical', None),
-                ('org.truenas:managedby', 'managedby', None),
-                ('dedup', 'deduplication', str.upper),
-                ('aclmode', None, str.upper),
-                ('acltype', None, str.upper),
-                ('xattr', None, str.upper),
-                ('atime', None, str.upper),
-                ('casesensitivity', None, str.upper),
-                ('exec', None, str.upper),
-                ('sync', None, str.upper),
-                ('compression', None, str.upper),
-                ('compressratio', None, None),
-                ('origin', None, None),
-                ('quota', None, _null),
-                ('refquota', None, _null),
-                ('reservation', None, _null),
-                ('refreservation', None, _null),
-                ('copies', None, None),
-                ('snapdir', None, str.upper),
-                ('readonly', None, str.upper),
-                ('recordsize', None, None),
-                ('sparse', None, None),
-                ('volsize', None, None),
-                ('volblocksize', None, None),
-                ('keyformat', 'key_format', lambda o: o.upper() if o != 'none' else None),
-                ('encryption', 'encryption_algorithm', lambda o: o.upper() if o != 'off' else None),
-                ('used', None, None),
-                ('available', None, None),
-                ('special_small_blocks', 'special_small_block_size', None),
-                ('pbkdf2iters', None, None),
-            ):
+            if id(dataset) in transformed:
+                return dataset
+            transformed.add(id(dataset))
+
+            for orig_name, new_name, method in DATASET_PROPERTIES:
                 if orig_name not in dataset['properties']:
                     continue
                 i = new_name or orig_name
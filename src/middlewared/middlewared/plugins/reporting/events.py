@@ -1,24 +1,56 @@
+import glob
 import itertools
 import json
 import psutil
-import subprocess
+import threading
 import time
 
+from middlewared.client import ejson
 from middlewared.event import EventSource
-from middlewared.utils import osc
+from middlewared.main import event_message
+from middlewared.utils import osc, start_daemon_thread
 
 if osc.IS_FREEBSD:
     import sysctl
     import netif
 
 
-class RealtimeEventSource(EventSource):
+class RealtimeStats:
 
     """
     Retrieve real time statistics for CPU, network,
     virtual memory and zfs arc.
     """
 
+    def __init__(self):
+        self.cp_time_last = None
+        self.cp_times_last = None
+        self.last_interface_stats = {}
+        self.temperature_sensors = self.get_temperature_sensors() if osc.IS_LINUX else {}
+
+    @staticmethod
+    def get_temperature_sensors(hwmon='/sys/class/hwmon'):
+        """
+        Map of CPU core number to its hwmon temperature input file (the same `Core N` sensors `sensors` reports).
+        """
+        sensors = {}
+        for label_path in sorted(glob.glob(f'{hwmon}/hwmon*/temp*_label')):
+            try:
+                with open(label_path) as f:
+                    label = f.read().strip()
+            except OSError:
+                continue
+
+            if not label.startswith('Core '):
+                continue
+            core = label[5:].strip()
+            if not core.isdigit():
+                continue
+
+            sensors[int(core)] = label_path[:-len('label')] + 'input'
+
+        return sensors
+
     @staticmethod
     def get_cpu_usages(cp_diff):
         cp_total = sum(cp_diff)
@@ -43,126 +75,199 @@ class RealtimeEventSource(EventSource):
         data['usage'] = ((cp_total - cp_diff[idle]) / cp_total) * 100
         return data
 
-    def run(self):
+    def get_data(self):
+        data = {}
+
+        # Virtual memory use
+        data['virtual_memory'] = psutil.virtual_memory()._asdict()
 
-        cp_time_last = None
-        cp_times_last = None
-        last_interface_stats = {}
-
-        while not self._cancel.is_set():
-            data = {}
-
-            # Virtual memory use
-            data['virtual_memory'] = psutil.virtual_memory()._asdict()
-
-            # ZFS ARC Size (raw value is in Bytes)
-            data['zfs'] = {}
-            if osc.IS_FREEBSD:
-                data['zfs']['arc_size'] = sysctl.filter('kstat.zfs.misc.arcstats.size')[0].value
-            elif osc.IS_LINUX:
-                with open('/proc/spl/kstat/zfs/arcstats') as f:
-                    rv = f.read()
-                    for line in rv.split('\n'):
-                        if line.startswith('size'):
-                            data['zfs']['arc_size'] = int(line.strip().split()[-1])
-
-            data['cpu'] = {}
-            # Get CPU usage %
-            if osc.IS_FREEBSD:
-                num_times = 5
-                # cp_times has values for all cores
-                cp_times = sysctl.filter('kern.cp_times')[0].value
-                # cp_time is the sum of all cores
-                cp_time = sysctl.filter('kern.cp_time')[0].value
-            elif osc.IS_LINUX:
-                num_times = 10
-                with open('/proc/stat') as f:
-                    stat = f.read()
-                cp_times = []
-                cp_time = []
-                for line in stat.split('\n'):
-                    if line.startswith('cpu'):
-                        line_ints = [int(i) for i in line[5:].strip().split()]
-                        # cpu has a sum of all cpus
-                        if line[3] == ' ':
-                            cp_time = line_ints
-                        # cpuX is for each core
-                        else:
-                            cp_times += line_ints
+        # ZFS ARC Size (raw value is in Bytes)
+        data['zfs'] = {}
+        if osc.IS_FREEBSD:
+            data['zfs']['arc_size'] = sysctl.filter('kstat.zfs.misc.arcstats.size')[0].value
+        elif osc.IS_LINUX:
+            with open('/proc/spl/kstat/zfs/arcstats') as f:
+                rv = f.read()
+                for line in rv.split('\n'):
+                    if line.startswith('size'):
+                        data['zfs']['arc_size'] = int(line.strip().split()[-1])
+
+        data['cpu'] = {}
+        # Get CPU usage %
+        if osc.IS_FREEBSD:
+            num_times = 5
+            # cp_times has values for all cores
+            cp_times = sysctl.filter('kern.cp_times')[0].value
+            # cp_time is the sum of all cores
+            cp_time = sysctl.filter('kern.cp_time')[0].value
+        elif osc.IS_LINUX:
+            num_times = 10
+            with open('/proc/stat') as f:
+                stat = f.read()
+            cp_times = []
+            cp_time = []
+            for line in stat.split('\n'):
+                if line.startswith('cpu'):
+                    line_ints = [int(i) for i in line[5:].strip().split()]
+                    # cpu has a sum of all cpus
+                    if line[3] == ' ':
+                        cp_time = line_ints
+                    # cpuX is for each core
                     else:
-                        break
-            else:
-                cp_time = cp_times = None
-
-            if cp_time and cp_times and cp_times_last:
-                # Get the difference of times between the last check and the current one
-                # cp_time has a list with user, nice, system, interrupt and idle
-                cp_diff = list(map(lambda x: x[0] - x[1], zip(cp_times, cp_times_last)))
-                cp_nums = int(len(cp_times) / num_times)
-                for i in range(cp_nums):
-                    data['cpu'][i] = self.get_cpu_usages(cp_diff[i * num_times:i * num_times + num_times])
-
-                cp_diff = list(map(lambda x: x[0] - x[1], zip(cp_time, cp_time_last)))
-                data['cpu']['average'] = self.get_cpu_usages(cp_diff)
-
-            cp_time_last = cp_time
-            cp_times_last = cp_times
-
-            # CPU temperature
-            data['cpu']['temperature'] = {}
-            if osc.IS_FREEBSD:
-                for i in itertools.count():
-                    v = sysctl.filter(f'dev.cpu.{i}.temperature')
-                    if not v:
-                        break
-                    data['cpu']['temperature'][i] = v[0].value
-            elif osc.IS_LINUX:
-                cp = subprocess.run(['sensors', '-j'], capture_output=True, text=True)
+                        cp_times += line_ints
+                else:
+                    break
+        else:
+            cp_time = cp_times = None
+
+        if cp_time and cp_times and self.cp_times_last:
+            # Get the difference of times between the last check and the current one
+            # cp_time has a list with user, nice, system, interrupt and idle
+            cp_diff = list(map(lambda x: x[0] - x[1], zip(cp_times, self.cp_times_last)))
+            cp_nums = int(len(cp_times) / num_times)
+            for i in range(cp_nums):
+                data['cpu'][i] = self.get_cpu_usages(cp_diff[i * num_times:i * num_times + num_times])
+
+            cp_diff = list(map(lambda x: x[0] - x[1], zip(cp_time, self.cp_time_last)))
+            data['cpu']['average'] = self.get_cpu_usages(cp_diff)
+
+        self.cp_time_last = cp_time
+        self.cp_times_last = cp_times
+
+        # CPU temperature
+        data['cpu']['temperature'] = {}
+        if osc.IS_FREEBSD:
+            for i in itertools.count():
+                v = sysctl.filter(f'dev.cpu.{i}.temperature')
+                if not v:
+                    break
+                data['cpu']['temperature'][i] = v[0].value
+        elif osc.IS_LINUX:
+            for core, path in self.temperature_sensors.items():
                 try:
-                    sensors = json.loads(cp.stdout)
-                except json.decoder.JSONDecodeError:
+                    with open(path) as f:
+                        data['cpu']['temperature'][core] = int(f.read().strip()) / 1000
+                except (OSError, ValueError):
                     pass
+
+        # Interface related statistics
+        data['interfaces'] = {}
+        stats_time = time.monotonic()
+        if osc.IS_FREEBSD:
+            interface_stats = {}
+            for iface in netif.list_interfaces().values():
+                for addr in filter(lambda addr: addr.af.name.lower() == 'link', iface.addresses):
+                    addr_data = addr.__getstate__(stats=True)
+                    interface_stats[iface.name] = {
+                        'received_bytes': addr_data['stats']['received_bytes'],
+                        'sent_bytes': addr_data['stats']['sent_bytes'],
+                    }
+        elif osc.IS_LINUX:
+            interface_stats = {
+                name: {'received_bytes': counters.bytes_recv, 'sent_bytes': counters.bytes_sent}
+                for name, counters in psutil.net_io_counters(pernic=True).items()
+            }
+        else:
+            interface_stats = {}
+
+        for name, stats in interface_stats.items():
+            data['interfaces'][name] = {}
+            last = self.last_interface_stats.get(name)
+            for k, v in stats.items():
+                if last:
+                    rate = int((v - last[k]) / (stats_time - last['stats_time']))
+                else:
+                    rate = v
+                data['interfaces'][name].update({k: v, f'{k}_rate': rate})
+            self.last_interface_stats[name] = {**stats, 'stats_time': stats_time}
+
+        return data
+
+
+class RealtimeSampler:
+
+    """
+    Collects realtime statistics once per `interval` seconds and sends the same encoded event to every subscribed
+    `RealtimeEventSource`. Sampling thread only runs while there are subscribers.
+    """
+
+    interval = 2
+
+    def __init__(self, middleware):
+        self.middleware = middleware
+        self.lock = threading.Lock()
+        # event source -> number of ticks between events it receives
+        self.subscribers = {}
+        self.thread = None
+
+    def subscribe(self, event_source, ticks):
+        with self.lock:
+            self.subscribers[event_source] = ticks
+            if self.thread is None:
+                self.thread = start_daemon_thread(target=self.run, name='reporting_realtime')
+
+    def unsubscribe(self, event_source):
+        with self.lock:
+            self.subscribers.pop(event_source, None)
+
+    def run(self):
+        stats = RealtimeStats()
+        for tick in itertools.count():
+            with self.lock:
+                if not self.subscribers:
+                    self.thread = None
+                    return
+
+                subscribers = [
+                    event_source for event_source, ticks in self.subscribers.items() if tick % ticks == 0
+                ]
+
+            if subscribers:
+                try:
+                    data = stats.get_data()
                 except Exception:
-                    self.middleware.logger.error('Failed to read sensors output', exc_info=True)
+                    self.middleware.logger.error('Failed to collect realtime statistics', exc_info=True)
                 else:
-                    for chip, value in sensors.items():
-                        for name, temps in value.items():
-                            if not name.startswith('Core '):
-                                continue
-                            core = name[5:].strip()
-                            if not core.isdigit():
-                                continue
-                            core = int(core)
-                            for temp, value in temps.items():
-                                if 'input' in temp:
-                                    data['cpu']['temperature'][core] = value
-                                    break
-
-            if osc.IS_FREEBSD:
-                # Interface related statistics
-                data['interfaces'] = {}
-                retrieve_stat_keys = ['received_bytes', 'sent_bytes']
-                for iface in netif.list_interfaces().values():
-                    for addr in filter(lambda addr: addr.af.name.lower() == 'link', iface.addresses):
-                        addr_data = addr.__getstate__(stats=True)
-                        stats_time = time.time()
-                        data['interfaces'][iface.name] = {}
-                        for k in retrieve_stat_keys:
-                            traffic_stats = addr_data['stats'][k]
-                            if last_interface_stats.get(iface.name):
-                                traffic_stats = traffic_stats - last_interface_stats[iface.name][k]
-                                traffic_stats = int(
-                                    traffic_stats / (time.time() - last_interface_stats[iface.name]['stats_time'])
-                                )
-                            details_dict = {
-                                k: addr_data['stats'][k],
-                                f'{k}_rate': traffic_stats,
-                            }
-                            data['interfaces'][iface.name].update(details_dict)
-                        last_interface_stats[iface.name] = {**data['interfaces'][iface.name], 'stats_time': stats_time}
-            self.send_event('ADDED', fields=data)
-            time.sleep(2)
+                    # Subscribers are only different in the collection name (it includes subscription argument)
+                    frames = {}
+                    for event_source in subscribers:
+                        if event_source.name not in frames:
+                            frames[event_source.name] = ejson.dumps(
+                                event_message(event_source.name, 'ADDED', {'fields': data})
+                            )
+
+                        event_source.send_event_data(frames[event_source.name])
+
+            time.sleep(self.interval)
+
+
+class RealtimeEventSource(EventSource):
+
+    """
+    Retrieve real time statistics for CPU, network,
+    virtual memory and zfs arc.
+
+    Statistics are sent every 2 seconds, a different interval (a multiple of 2 seconds) can be requested by
+    subscribing to `reporting.realtime:{"interval": 10}`.
+    """
+
+    sampler = None
+
+    def run(self):
+        interval = RealtimeSampler.interval
+        if self.arg:
+            try:
+                interval = int(json.loads(self.arg)['interval'])
+            except Exception:
+                self.middleware.logger.debug('Invalid reporting.realtime argument: %r', self.arg)
+
+        self.sampler.subscribe(self, max(-(-interval // RealtimeSampler.interval), 1))
+        try:
+            self._cancel.wait()
+        finally:
+            self.sampler.unsubscribe(self)
 
 
 def setup(middleware):
+    RealtimeEventSource.sampler = RealtimeSampler(middleware)
     middleware.register_event_source('reporting.realtime', RealtimeEventSource)
@@ -1,9 +1,11 @@
 import os
 import json
+import math
 import re
-import statistics
 import subprocess
 import textwrap
+import threading
+import time
 
 
 RRD_BASE_PATH = '/var/db/collectd/rrd/localhost'
@@ -12,6 +14,132 @@ RE_NAME = re.compile(r'(%name_(\d+)%)')
 RE_NAME_NUMBER = re.compile(r'(.+?)(\d+)$')
 RE_RRDPLUGIN = re.compile(r'^(?P<name>.+)Plugin$')
 RRD_PLUGINS = {}
+# Exported graphs are cached for one collectd interval
+EXPORT_CACHE_TTL = 10
+
+
+def mean(values):
+    return math.fsum(values) / len(values)
+
+
+def prefix_defs(args, prefix):
+    """
+    Prefix all variable names defined in rrdtool `args` (and references to them) with `prefix` so definitions of many
+    graphs can be exported at once. Returns the new arguments and the number of exported columns.
+    """
+    names = set()
+    result = []
+    columns = 0
+    for arg in args:
+        kind, rest = arg.split(':', 1)
+        if kind in ('DEF', 'CDEF'):
+            name, value = rest.split('=', 1)
+            if kind == 'CDEF':
+                value = ','.join(f'{prefix}{token}' if token in names else token for token in value.split(','))
+            names.add(name)
+            result.append(f'{kind}:{prefix}{name}={value}')
+        elif kind == 'XPORT':
+            name, legend = rest.split(':', 1) if ':' in rest else (rest, rest)
+            result.append(f'XPORT:{prefix}{name}:{legend}')
+            columns += 1
+        else:
+            result.append(arg)
+
+    return result, columns
+
+
+def export(graphs, starttime, endtime, aggregate=True):
+    """
+    Export data of all `graphs` (a list of `(rrd, identifier)`) using a single `rrdtool xport` call.
+    """
+    if len(graphs) == 1:
+        rrd, identifier = graphs[0]
+        args = rrd.get_defs(identifier)
+        columns = [len([arg for arg in args if arg.startswith('XPORT:')])]
+    else:
+        args = []
+        columns = []
+        for i, (rrd, identifier) in enumerate(graphs):
+            graph_args, graph_columns = prefix_defs(rrd.get_defs(identifier), f'g{i}_')
+            args.extend(graph_args)
+            columns.append(graph_columns)
+
+    cp = subprocess.run([
+        'rrdtool',
+        'xport',
+        '--daemon', 'unix:/var/run/rrdcached.sock',
+        '--json',
+        '--end', endtime,
+        '--start', starttime,
+    ] + args, capture_output=True)
+    if cp.returncode != 0:
+        if len(graphs) > 1:
+            # Report the error for the graph that caused it
+            return [export([graph], starttime, endtime, aggregate)[0] for graph in graphs]
+
+        raise RuntimeError(f'Failed to export RRD data: {cp.stderr.decode()}')
+
+    output = json.loads(cp.stdout)
+
+    result = []
+    offset = 0
+    for (rrd, identifier), count in zip(graphs, columns):
+        meta = dict(output['meta'], columns=count, legend=output['meta']['legend'][offset:offset + count])
+        data = dict(
+            name=rrd.name,
+            identifier=identifier,
+            data=[row[offset:offset + count] for row in output['data']],
+            **meta,
+            aggregations=dict(),
+        )
+        offset += count
+
+        if rrd.aggregations and aggregate:
+            rrd.aggregate(data)
+
+        result.append(data)
+
+    return result
+
+
+class ExportCache:
+    """
+    Short lived cache of exported graphs keyed by `(name, identifier, starttime, endtime, aggregate)`.
+    """
+
+    def __init__(self, ttl=EXPORT_CACHE_TTL):
+        self.ttl = ttl
+        self.cache = {}
+        self.lock = threading.Lock()
+
+    def export(self, graphs, starttime, endtime, aggregate=True):
+        now = time.monotonic()
+        keys = [(rrd.name, identifier, starttime, endtime, aggregate) for rrd, identifier in graphs]
+
+        result = {}
+        with self.lock:
+            for key in keys:
+                cached = self.cache.get(key)
+                if cached is not None and cached[0] > now:
+                    result[key] = cached[1]
+
+        missing = [graph for graph, key in zip(graphs, keys) if key not in result]
+        if missing:
+            exported = export(missing, starttime, endtime, aggregate)
+            with self.lock:
+                for (rrd, identifier), data in zip(missing, exported):
+                    key = (rrd.name, identifier, starttime, endtime, aggregate)
+                    self.cache[key] = (now + self.ttl, data)
+                    result[key] = data
+
+                for key in [key for key, (expires, data) in self.cache.items() if expires <= now]:
+                    self.cache.pop(key)
+
+        return [dict(result[key]) for key in keys]
+
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
 
 
 class RRDMeta(type):
@@ -46,7 +174,7 @@ class RRDBase(object, metaclass=RRDMeta):
 
     AGG_MAP = {
         'min': min,
-        'mean': statistics.mean,
+        'mean': mean,
         'max': max,
     }
 
@@ -169,38 +297,16 @@ class RRDBase(object, metaclass=RRDMeta):
         return args
 
     def export(self, identifier, starttime, endtime, aggregate=True):
-        args = [
-            'rrdtool',
-            'xport',
-            '--daemon', 'unix:/var/run/rrdcached.sock',
-            '--json',
-            '--end', endtime,
-            '--start', starttime,
-        ]
-        args.extend(self.get_defs(identifier))
-        cp = subprocess.run(args, capture_output=True)
-        if cp.returncode != 0:
-            raise RuntimeError(f'Failed to export RRD data: {cp.stderr.decode()}')
-
-        data = json.loads(cp.stdout)
-        data = dict(
-            name=self.name,
-            identifier=identifier,
-            data=data['data'],
-            **data['meta'],
-            aggregations=dict(),
-        )
+        return export([(self, identifier)], starttime, endtime, aggregate)[0]
 
-        if self.aggregations and aggregate:
-            # Transpose the data matrix and remove null values
-            transposed = [list(filter(None.__ne__, i)) for i in zip(*data['data'])]
-            for agg in self.aggregations:
-                if agg in self.AGG_MAP:
-                    data['aggregations'][agg] = [
-                        (self.AGG_MAP[agg](i) if i else None)
-                        for i in transposed
-                    ]
-                else:
-                    raise RuntimeError(f'Aggregation {agg!r} is invalid.')
-
-        return data
+    def aggregate(self, data):
+        # Transpose the data matrix and remove null values
+        transposed = [[v for v in column if v is not None] for column in zip(*data['data'])]
+        for agg in self.aggregations:
+            if agg in self.AGG_MAP:
+                data['aggregations'][agg] = [
+                    (self.AGG_MAP[agg](i) if i else None)
+                    for i in transposed
+                ]
+            else:
+                raise RuntimeError(f'Aggregation {agg!r} is invalid.')
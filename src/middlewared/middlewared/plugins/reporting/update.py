@@ -8,7 +8,7 @@ from middlewared.service import CallError, ConfigService, filterable, private, V
 from middlewared.utils import filter_list, run
 from middlewared.validators import Range
 
-from .rrd_utils import RRD_PLUGINS
+from .rrd_utils import ExportCache, RRD_PLUGINS
 
 
 class ReportingModel(sa.Model):
@@ -32,6 +32,7 @@ class ReportingService(ConfigService):
         self.__rrds = {}
         for name, klass in RRD_PLUGINS.items():
             self.__rrds[name] = klass(self.middleware)
+        self.__export_cache = ExportCache()
 
     @accepts(
         Dict(
@@ -130,6 +131,8 @@ class ReportingService(ConfigService):
 
         await self.middleware.call('service.restart', 'collectd')
 
+        self.__export_cache.clear()
+
         return await self.config()
 
     @filterable
@@ -212,26 +215,23 @@ class ReportingService(ConfigService):
 
         """
         starttime, endtime = self.__rquery_to_start_end(query)
-        rv = []
+        rrds = []
         for i in graphs:
             try:
-                rrd = self.__rrds[i['name']]
+                rrds.append((self.__rrds[i['name']], i['identifier']))
             except KeyError:
                 raise CallError(f'Graph {i["name"]!r} not found.', errno.ENOENT)
-            rv.append(
-                rrd.export(i['identifier'], starttime, endtime, aggregate=query['aggregate'])
-            )
-        return rv
+        return self.__export_cache.export(rrds, starttime, endtime, aggregate=query['aggregate'])
 
     @private
     @accepts(Ref('reporting_query'))
     def get_all(self, query):
         starttime, endtime = self.__rquery_to_start_end(query)
-        rv = []
+        rrds = []
         for rrd in self.__rrds.values():
             idents = rrd.get_identifiers()
             if idents is None:
                 idents = [None]
             for ident in idents:
-                rv.append(rrd.export(ident, starttime, endtime, aggregate=query['aggregate']))
-        return rv
+                rrds.append((rrd, ident))
+        return self.__export_cache.export(rrds, starttime, endtime, aggregate=query['aggregate'])
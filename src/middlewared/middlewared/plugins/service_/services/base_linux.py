@@ -5,7 +5,7 @@ import subprocess
 from middlewared.utils import run
 from middlewared.utils.osc import IS_LINUX
 
-from .base_state import ServiceState
+from .systemd_watcher import unit_state, watcher
 
 logger = logging.getLogger(__name__)
 
@@ -30,15 +30,14 @@ class SimpleServiceLinux:
     systemd_extra_units = []
 
     async def _get_state_linux(self):
+        state = watcher.get(f"{self.systemd_unit}.service")
+        if state is not None:
+            return state
+
         return await self.middleware.run_in_thread(self._get_state_linux_sync)
 
     def _get_state_linux_sync(self):
-        unit = self._get_systemd_unit()
-
-        if unit.Unit.ActiveState == b"active":
-            return ServiceState(True, list(filter(None, [unit.MainPID])))
-        else:
-            return ServiceState(False, [])
+        return unit_state(self._get_systemd_unit())
 
     async def _start_linux(self):
         await self._unit_action("Start")
@@ -64,6 +63,13 @@ class SimpleServiceLinux:
         return await self.middleware.run_in_thread(self._unit_action_sync, action, wait, timeout)
 
     def _unit_action_sync(self, action, wait, timeout):
+        try:
+            self._unit_action_wait(action, wait, timeout)
+        finally:
+            # State of the unit must not be served from the cache until the watcher has caught up with it
+            watcher.invalidate(f"{self.systemd_unit}.service")
+
+    def _unit_action_wait(self, action, wait, timeout):
         unit = self._get_systemd_unit()
         job = getattr(unit.Unit, action)(b"replace")
 
@@ -112,6 +118,7 @@ class SimpleServiceLinux:
 
 async def systemd_unit(unit, verb):
     result = await run("systemctl", verb, unit, check=False, encoding="utf-8", stderr=subprocess.STDOUT)
+    watcher.invalidate(unit if "." in unit else f"{unit}.service")
     if result.returncode != 0:
         logger.warning("%s %s failed with code %d: %r", unit, verb, result.returncode, result.stdout)
 
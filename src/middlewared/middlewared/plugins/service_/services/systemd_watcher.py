@@ -0,0 +1,160 @@
+import functools
+import logging
+import os
+import select
+import threading
+import time
+
+from middlewared.utils import start_daemon_thread
+from middlewared.utils.osc import IS_LINUX
+
+from .base_state import ServiceState
+
+logger = logging.getLogger(__name__)
+
+if IS_LINUX:
+    from pystemd.dbuslib import DBus
+    from pystemd.systemd1 import Manager, Unit
+
+
+def unit_state(unit):
+    if unit.Unit.ActiveState == b"active":
+        return ServiceState(True, list(filter(None, [unit.MainPID])))
+    else:
+        return ServiceState(False, [])
+
+
+class SystemdWatcher:
+    """
+    Keeps an in-memory state table of systemd units. A single persistent D-Bus connection subscribes to
+    `PropertiesChanged` signals of every watched unit and only units that have actually changed are re-read.
+
+    Units that are not (yet) in the table (i.e. the watcher is not connected or the unit has just been acted
+    upon) must be queried directly by the caller.
+    """
+
+    reconnect_interval = 10
+    poll_interval = 60
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.units = {}
+        self.states = {}
+        self.dirty = set()
+        self.on_change = None
+        self.wakeup = None
+
+    def start(self, units, on_change=None):
+        """
+        Start watching `units` (a dictionary of unit name to a list of middleware service names).
+        `on_change` is called with the service name every time the state of its unit changes.
+        """
+        self.units = units
+        self.on_change = on_change
+        self.wakeup = os.pipe()
+        os.set_blocking(self.wakeup[1], False)
+        start_daemon_thread(target=self.run, name="systemd_watcher")
+
+    def get(self, unit):
+        with self.lock:
+            return self.states.get(unit)
+
+    def invalidate(self, unit):
+        """
+        Forget the cached state of `unit` and make the watcher re-read it as soon as possible.
+        """
+        with self.lock:
+            self.states.pop(unit, None)
+            self.dirty.add(unit)
+
+        if self.wakeup is not None:
+            try:
+                os.write(self.wakeup[1], b"\0")
+            except BlockingIOError:
+                # Watcher is already going to wake up
+                pass
+
+    def run(self):
+        while True:
+            try:
+                self.watch()
+            except Exception:
+                logger.warning("systemd unit watcher failed", exc_info=True)
+
+            with self.lock:
+                self.states.clear()
+
+            time.sleep(self.reconnect_interval)
+
+    def watch(self):
+        with DBus() as bus:
+            manager = Manager(bus=bus)
+            manager.load()
+            # systemd only emits unit signals when someone is subscribed
+            manager.Manager.Subscribe()
+
+            objects = {}
+            for name in self.units:
+                try:
+                    unit = Unit(name.encode(), bus=bus)
+                    unit.load()
+                except Exception:
+                    logger.warning("Unable to watch systemd unit %r", name, exc_info=True)
+                    continue
+
+                bus.match_signal(
+                    b"org.freedesktop.systemd1",
+                    unit.path,
+                    b"org.freedesktop.DBus.Properties",
+                    b"PropertiesChanged",
+                    functools.partial(self._properties_changed, name),
+                    None,
+                )
+                objects[name] = unit
+
+            self.refresh(objects, objects.keys(), notify=False)
+
+            fd = bus.get_fd()
+            while True:
+                readable, _, _ = select.select([fd, self.wakeup[0]], [], [], self.poll_interval)
+                if self.wakeup[0] in readable:
+                    os.read(self.wakeup[0], 4096)
+
+                while bus.process():
+                    pass
+
+                with self.lock:
+                    dirty, self.dirty = self.dirty, set()
+
+                self.refresh(objects, dirty)
+
+    def refresh(self, objects, names, notify=True):
+        for name in names:
+            unit = objects.get(name)
+            if unit is None:
+                continue
+
+            state = unit_state(unit)
+            with self.lock:
+                if name in self.dirty:
+                    # Unit has changed while we were reading it, it is going to be re-read again
+                    continue
+
+                old = self.states.get(name)
+                self.states[name] = state
+
+            if notify and old is not None and old != state and self.on_change is not None:
+                for service in self.units[name]:
+                    try:
+                        self.on_change(service)
+                    except Exception:
+                        logger.warning("Failed to notify about %r state change", service, exc_info=True)
+
+    def _properties_changed(self, name, msg, error=None, userdata=None):
+        msg.process_reply(True)
+
+        with self.lock:
+            self.dirty.add(name)
+
+
+watcher = SystemdWatcher()
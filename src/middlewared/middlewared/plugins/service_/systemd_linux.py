@@ -1,5 +1,9 @@
 from middlewared.service import private, Service
 
+from .services.all import all_services
+from .services.base_linux import SimpleServiceLinux
+from .services.systemd_watcher import watcher
+
 
 class ServiceService(Service):
 
@@ -10,3 +14,13 @@ class ServiceService(Service):
             return []
         else:
             return [service.systemd_unit] + service.systemd_extra_units
+
+
+async def setup(middleware):
+    units = {}
+    for klass in all_services:
+        service = await middleware.call('service.object', klass.name)
+        if isinstance(service, SimpleServiceLinux) and service.systemd_unit != NotImplemented:
+            units.setdefault(f'{service.systemd_unit}.service', []).append(service.name)
+
+    watcher.start(units, lambda service: middleware.call_sync('service.notify_running', service))
@@ -1,7 +1,7 @@
 from middlewared.common.attachment import FSAttachmentDelegate
 from middlewared.schema import Bool, Dict, IPAddr, List, Str, Int, Patch
 from middlewared.service import (SystemServiceService, ValidationErrors,
-                                 accepts, job, private, CRUDService)
+                                 accepts, batch_extend, job, private, CRUDService)
 from middlewared.async_validators import check_path_resides_within_volume
 from middlewared.service_exception import CallError
 import middlewared.sqlalchemy as sa
@@ -210,6 +210,7 @@ class SMBService(SystemServiceService):
         service_verb = 'restart'
         datastore = 'services.cifs'
         datastore_extend = 'smb.smb_extend'
+        datastore_config_cache = False
         datastore_prefix = 'cifs_srv_'
 
     @private
@@ -672,7 +673,7 @@ class SharingSMBService(CRUDService):
             {'prefix': self._config.datastore_prefix})
 
         await self.middleware.call('sharing.smb.reg_addshare', data)
-        await self.extend(data)  # We should do this in the insert call ?
+        await self.extend([data])  # We should do this in the insert call ?
 
         enable_aapl = await self.check_aapl(data)
 
@@ -750,7 +751,7 @@ class SharingSMBService(CRUDService):
             await self.middleware.call('sharing.smb.apply_conf_diff',
                                        'REGISTRY', share_name, diff)
 
-        await self.extend(new)  # same here ?
+        await self.extend([new])  # same here ?
 
         if enable_aapl:
             await self._service_change('cifs', 'restart')
@@ -901,16 +902,18 @@ class SharingSMBService(CRUDService):
         return name
 
     @private
-    async def extend(self, data):
-        data['hostsallow'] = data['hostsallow'].split()
-        data['hostsdeny'] = data['hostsdeny'].split()
-        if data['fsrvp']:
-            data['shadowcopy'] = True
-
-        if 'share_acl' in data:
-            data.pop('share_acl')
-
-        return data
+    @batch_extend
+    async def extend(self, shares):
+        for data in shares:
+            data['hostsallow'] = data['hostsallow'].split()
+            data['hostsdeny'] = data['hostsdeny'].split()
+            if data['fsrvp']:
+                data['shadowcopy'] = True
+
+            if 'share_acl' in data:
+                data.pop('share_acl')
+
+        return shares
 
     @private
     async def compress(self, data):
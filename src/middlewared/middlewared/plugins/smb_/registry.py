@@ -5,6 +5,55 @@ from middlewared.plugins.smb import SMBCmd, SMBSharePreset
 from middlewared.utils import osc
 
 import errno
+import os
+import tempfile
+
+# Parameters whose values are canonicalized by samba when written to the registry
+BOOLEAN_VALUES = {
+    'yes': 'yes', 'true': 'yes', 'on': 'yes', '1': 'yes',
+    'no': 'no', 'false': 'no', 'off': 'no', '0': 'no',
+}
+
+
+def parse_smbconf(text):
+    """
+    Parse smb.conf formatted `text` (as generated by smb4_share.conf or printed by `net conf list`)
+    into a dictionary of sections. Parameter names and boolean values are normalized the same way
+    samba does when storing them in the registry so that both sides can be compared.
+    """
+    conf = {}
+    section = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line[0] in ('#', ';'):
+            continue
+
+        if line.startswith('[') and line.endswith(']'):
+            section = conf.setdefault(line[1:-1].strip(), {})
+            continue
+
+        if section is None or '=' not in line:
+            continue
+
+        k, v = line.split('=', 1)
+        k = ' '.join(k.split()).lower()
+        v = v.strip()
+        if ':' not in k:
+            v = BOOLEAN_VALUES.get(v.lower(), v)
+        section[k] = v
+
+    return conf
+
+
+def diff_smbconf(new, old):
+    """
+    Compare sections of parsed configurations `new` and `old`. Returns names of sections that have to
+    be removed and names of sections that have to be (re-)imported.
+    """
+    return {
+        'removed': sorted(set(old) - set(new)),
+        'changed': sorted(name for name, params in new.items() if old.get(name) != params),
+    }
 
 
 class SharingSMBService(Service):
@@ -26,7 +75,9 @@ class SharingSMBService(Service):
             'delshare',
             'getparm',
             'setparm',
-            'delparm'
+            'delparm',
+            'list',
+            'import',
         ]:
             raise CallError(f'Action [{action}] is not permitted.', errno.EPERM)
 
@@ -49,6 +100,64 @@ class SharingSMBService(Service):
 
         return netconf.stdout.decode()
 
+    @private
+    async def reg_listconf(self):
+        """
+        Dump the whole share configuration stored in the registry with a single `net conf list`.
+        """
+        return parse_smbconf(await self.netconf(action='list'))
+
+    @private
+    async def reg_import(self, path, share=None):
+        """
+        Import smb.conf formatted file `path` into the registry. If `share` is specified, only this share is
+        replaced (all of its parameters are set in a single transaction), otherwise the whole share
+        configuration is replaced.
+        """
+        return await self.netconf(action='import', args=[path] + ([share] if share else []))
+
+    @private
+    async def sync_registry(self, path):
+        """
+        Bring share configuration stored in the registry in line with smb.conf formatted file `path`
+        touching only shares that were added, removed or changed.
+        """
+        with open(path) as f:
+            new = parse_smbconf(f.read())
+
+        old = await self.reg_listconf()
+        diff = diff_smbconf(new, old)
+        if not diff['removed'] and not diff['changed']:
+            return diff
+
+        if not old or not new or len(diff['removed']) + len(diff['changed']) > len(old) // 2:
+            # Removing or rewriting most of the shares one by one (a `net` process for every one of them) is slower
+            # than a single import (that replaces the whole configuration in one transaction).
+            await self.reg_import(path)
+            return diff
+
+        for share in diff['removed']:
+            await self.reg_delshare(share)
+
+        if diff['changed']:
+            # Only write changed shares so that `net conf import` does not have to parse the whole file
+            # for every one of them.
+            fd, tmp = tempfile.mkstemp(prefix='smb4_share.', suffix='.conf')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    for share in diff['changed']:
+                        f.write(f'[{share}]\n')
+                        for k, v in new[share].items():
+                            f.write(f'\t{k} = {v}\n')
+                        f.write('\n')
+
+                for share in diff['changed']:
+                    await self.reg_import(tmp, share)
+            finally:
+                os.unlink(tmp)
+
+        return diff
+
     @private
     async def reg_listshares(self):
         return (await self.netconf(action='listshares')).splitlines()
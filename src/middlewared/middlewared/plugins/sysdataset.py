@@ -27,6 +27,7 @@ class SystemDatasetService(ConfigService):
     class Config:
         datastore = 'system.systemdataset'
         datastore_extend = 'systemdataset.config_extend'
+        datastore_config_cache = False
         datastore_prefix = 'sys_'
 
     @private
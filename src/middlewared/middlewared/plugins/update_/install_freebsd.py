@@ -26,7 +26,7 @@ class UpdateService(Service):
     @private
     @job(process=True)
     def install_impl_job(self, job, job_id, location):
-        job = FakeJob(job_id, self.middleware.client)
+        job = FakeJob(job_id, self.middleware)
 
         handler = UpdateHandler(self, job)
 
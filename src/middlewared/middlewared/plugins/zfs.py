@@ -3,7 +3,6 @@ import subprocess
 import threading
 import time
 from collections import defaultdict
-from copy import deepcopy
 
 import libzfs
 
@@ -14,6 +13,12 @@ from middlewared.service import (
 from middlewared.utils import filter_list, filter_getattrs, osc
 from middlewared.validators import ReplicationSnapshotNamingSchema
 
+QUOTA_ALERT_PROPERTIES = [
+    'name', 'quota', 'available', 'refquota', 'usedbydataset', 'mounted', 'mountpoint',
+    'org.freenas:quota_warning', 'org.freenas:quota_critical',
+    'org.freenas:refquota_warning', 'org.freenas:refquota_critical',
+]
+
 
 class ZFSSetPropertyError(CallError):
     def __init__(self, property, error):
@@ -67,6 +72,74 @@ def find_vdev(pool, vname):
         children += list(child.children)
 
 
+def copy_dataset(dataset):
+    """
+    Copy serialized dataset. Much faster than `deepcopy` as serialized datasets consist only of dicts, lists and
+    immutable values.
+    """
+    if isinstance(dataset, dict):
+        return {k: copy_dataset(v) for k, v in dataset.items()}
+    if isinstance(dataset, list):
+        return [copy_dataset(v) for v in dataset]
+    return dataset
+
+
+def project_user_properties(datasets, user_properties):
+    """
+    Remove user properties that are not in `user_properties` from `datasets` and all their descendants (in place).
+    Returns `datasets` as a list.
+    """
+    datasets = list(datasets)
+    stack = datasets[:]
+    while stack:
+        dataset = stack.pop()
+        properties = dataset.get('properties') or {}
+        for k in [k for k in properties if ':' in k and k not in user_properties]:
+            del properties[k]
+        stack.extend(dataset['children'])
+    return datasets
+
+
+def dataset_name_matcher(filters):
+    """
+    Returns a predicate which tells if a dataset with the given name or any of its descendants can match equality
+    and prefix `id`, `name` and `pool` `filters` so that whole dataset subtrees can be skipped. Returns `None` if
+    there are no such filters.
+    """
+    def equal(value):
+        return lambda name: name == value or value.startswith(f'{name}/')
+
+    def prefix(value):
+        return lambda name: name.startswith(value) or value.startswith(f'{name}/')
+
+    def pool(value):
+        return lambda name: name.split('/', 1)[0] == value
+
+    predicates = []
+    for f in filters or []:
+        if len(f) != 3 or f[0] not in ('id', 'name', 'pool'):
+            continue
+
+        name, op, value = f
+        if op == '=' and isinstance(value, str):
+            values = [value]
+        elif op == 'in' and isinstance(value, (list, tuple)) and all(isinstance(v, str) for v in value):
+            values = value
+        elif op == '^' and name != 'pool' and isinstance(value, str):
+            predicates.append(prefix(value))
+            continue
+        else:
+            continue
+
+        alternatives = [(pool if name == 'pool' else equal)(v) for v in values]
+        predicates.append(lambda name, alternatives=alternatives: any(p(name) for p in alternatives))
+
+    if not predicates:
+        return None
+
+    return lambda name: all(predicate(name) for predicate in predicates)
+
+
 class ZFSPoolService(CRUDService):
 
     class Config:
@@ -410,8 +483,19 @@ class ZFSDatasetService(CRUDService):
         private = True
         process_pool = True
 
-    def flatten_datasets(self, datasets):
-        return sum([[deepcopy(ds)] + self.flatten_datasets(ds['children']) for ds in datasets], [])
+    def flatten_datasets(self, datasets, match=None):
+        """
+        Returns `datasets` and all their descendants in a single list (skipping the subtrees for which
+        `match(name)` is false). Datasets are not copied so they share their `children` with their parents.
+        """
+        rv = []
+        stack = list(datasets)[::-1]
+        while stack:
+            dataset = stack.pop()
+            if match is None or match(dataset['id']):
+                rv.append(dataset)
+                stack.extend(reversed(dataset['children']))
+        return rv
 
     @filterable
     def query(self, filters=None, options=None):
@@ -436,8 +520,18 @@ class ZFSDatasetService(CRUDService):
         children there are for them in `children` key. This retrieval type is slightly faster.
         These options are controlled by `query-options.extra.flat` attribute which defaults to true.
 
+        `query-options.extra.flat_children` controls what `children` key contains for the flat structure:
+        FULL ( default ) - independent copies of all the children data,
+        NAMES - only names of the children so each dataset is returned exactly once,
+        SHARED - the children are the very same objects which are returned as separate datasets ( this is the
+        cheapest way to retrieve a flat list of datasets along with their hierarchy but the result must not be
+        modified in place ).
+
+        Equality and prefix filters on `id`, `name` and `pool` are used to skip dataset subtrees which can't match
+        them.
+
         `query-options.extra.user_properties` controls if user defined properties of datasets should be retrieved
-        or not.
+        or not. It can also be a list of the user defined properties that should be retrieved.
 
         While we provide a way to exclude all properties from data retrieval, we introduce a single attribute
         `query-options.extra.retrieve_properties` which if set to false will make sure that no property is retrieved
@@ -448,14 +542,23 @@ class ZFSDatasetService(CRUDService):
         top_level_props = None if extra.get('top_level_properties') is None else extra['top_level_properties'].copy()
         props = extra.get('properties', None)
         flat = extra.get('flat', True)
+        flat_children = extra.get('flat_children', 'FULL')
+        if flat_children not in ('FULL', 'NAMES', 'SHARED'):
+            raise CallError(f'Invalid flat_children value: {flat_children!r}', errno.EINVAL)
         user_properties = extra.get('user_properties', True)
+        user_properties_allowlist = None
+        if isinstance(user_properties, list):
+            user_properties_allowlist = set(user_properties)
+            user_properties = bool(user_properties)
         retrieve_properties = extra.get('retrieve_properties', True)
         if not retrieve_properties:
             # This is a short hand version where consumer can specify that they don't want any property to
             # be retrieved
             user_properties = False
+            user_properties_allowlist = None
             props = []
 
+        flattened = False
         with libzfs.ZFS() as zfs:
             # Handle `id` filter specially to avoiding getting all datasets
             if filters and len(filters) == 1 and list(filters[0][:2]) == ['id', '=']:
@@ -472,24 +575,37 @@ class ZFSDatasetService(CRUDService):
                 datasets = zfs.datasets_serialized(
                     props=props, top_level_props=top_level_props, user_props=user_properties
                 )
+                match = dataset_name_matcher(filters)
+                if match is not None:
+                    datasets = [dataset for dataset in datasets if match(dataset['id'])]
+                if user_properties and user_properties_allowlist is not None:
+                    # Drop the user properties that were not asked for before datasets get flattened and returned
+                    datasets = project_user_properties(datasets, user_properties_allowlist)
                 if flat:
-                    datasets = self.flatten_datasets(datasets)
+                    datasets = self.flatten_datasets(datasets, match)
+                    flattened = True
+                    if flat_children == 'NAMES':
+                        datasets = [
+                            dict(dataset, children=[child['id'] for child in dataset['children']])
+                            for dataset in datasets
+                        ]
                 else:
                     datasets = list(datasets)
 
-        return filter_list(datasets, filters, options)
+        result = filter_list(datasets, filters, options)
+        if flattened and flat_children == 'FULL':
+            # Only copy the datasets that are actually returned
+            result = copy_dataset(result)
+        return result
 
     def query_for_quota_alert(self):
         return [
-            {
-                k: v for k, v in dataset['properties'].items()
-                if k in [
-                    "name", "quota", "available", "refquota", "usedbydataset", "mounted", "mountpoint",
-                    "org.freenas:quota_warning", "org.freenas:quota_critical",
-                    "org.freenas:refquota_warning", "org.freenas:refquota_critical"
-                ]
-            }
-            for dataset in self.query()
+            {k: v for k, v in dataset['properties'].items() if k in QUOTA_ALERT_PROPERTIES}
+            for dataset in self.query([], {'extra': {
+                'properties': [k for k in QUOTA_ALERT_PROPERTIES if ':' not in k],
+                'user_properties': [k for k in QUOTA_ALERT_PROPERTIES if ':' in k],
+                'flat_children': 'SHARED',
+            }})
         ]
 
     def common_load_dataset_checks(self, ds):
@@ -948,23 +1064,26 @@ class ZFSSnapshot(CRUDService):
             return snaps
         with libzfs.ZFS() as zfs:
             # Handle `id` filter to avoid getting all snapshots first
-            snapshots = []
             if filters and len(filters) == 1 and list(filters[0][:2]) == ['id', '=']:
+                snapshots = []
                 try:
                     snapshots.append(zfs.get_snapshot(filters[0][2]).__getstate__())
                 except libzfs.ZFSException as e:
                     if e.code != libzfs.Error.NOENT:
                         raise
             else:
-                for i in zfs.snapshots:
-                    try:
-                        snapshots.append(i.__getstate__())
-                    except libzfs.ZFSException as e:
-                        # snapshot may have been deleted while this is running
-                        if e.code != libzfs.Error.NOENT:
-                            raise
-        # FIXME: awful performance with hundreds/thousands of snapshots
-        return filter_list(snapshots, filters, options)
+                snapshots = self.__iter_snapshots(zfs)
+            # Filter while iterating so snapshots not matching `filters` are never kept around
+            return filter_list(snapshots, filters, options)
+
+    def __iter_snapshots(self, zfs):
+        for i in zfs.snapshots:
+            try:
+                yield i.__getstate__()
+            except libzfs.ZFSException as e:
+                # snapshot may have been deleted while this is running
+                if e.code != libzfs.Error.NOENT:
+                    raise
 
     @accepts(Dict(
         'snapshot_create',
@@ -21,7 +21,7 @@ class Middleware(dict):
         resolve_methods(self.__schemas, to_resolve)
         return await method(*args)
 
-    async def call(self, name, *args):
+    async def call(self, name, *args, trusted=False):
         result = self[name](*args)
         if asyncio.iscoroutine(result):
             result = await result
@@ -30,6 +30,9 @@ class Middleware(dict):
     def call_sync(self, name, *args):
         return self[name](*args)
 
+    def _method_lookup(self, name):
+        return None, self[name]
+
     async def run_in_executor(self, executor, method, *args, **kwargs):
         return method(*args, **kwargs)
 
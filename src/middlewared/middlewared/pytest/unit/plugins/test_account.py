@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+from middlewared.plugins.account import UserService
+from middlewared.pytest.unit.plugins.test_datastore import datastore_test
+from middlewared.service import batch_extend
+
+
+async def legacy_user_extend(middleware, user):
+    # What `user.user_extend` used to do for every row: one more `datastore.query` and a blocking file check
+    user['groups'] = [
+        gm['group']['id'] for gm in await middleware.call(
+            'datastore.query', 'account.bsdgroupmembership', [('user', '=', user['id'])], {'prefix': 'bsdgrpmember_'}
+        )
+    ]
+    user['sshpubkey'] = None
+    os.path.exists(f'{user["home"]}/.ssh/authorized_keys')
+    return user
+
+
+@pytest.mark.asyncio
+async def test__user_extend_groups_match_per_row_extend():
+    async with datastore_test() as ds:
+        await ds.execute("INSERT INTO `account_bsdgroups` VALUES (1, 1000)")
+        await ds.execute("INSERT INTO `account_bsdgroups` VALUES (2, 2000)")
+        membership = 0
+        for i in range(1, 21):
+            await ds.execute(f"INSERT INTO `account_bsdusers` VALUES ({i}, {1000 + i}, 1)")
+            # Users are members of no, one or both groups
+            for group in [group for group in (1, 2) if i % (group + 1)]:
+                membership += 1
+                await ds.execute(f"INSERT INTO `account_bsdgroupmembership` VALUES ({membership}, {group}, {i})")
+
+        async def legacy(user):
+            user.update(email='', home='/nonexistent')
+            return await legacy_user_extend(ds.middleware, user)
+
+        @batch_extend
+        async def batched(users):
+            for user in users:
+                user.update(email='', home='/nonexistent')
+            return await UserService(ds.middleware).user_extend(users)
+
+        ds.middleware['user.legacy_extend'] = legacy
+        ds.middleware['user.user_extend'] = batched
+
+        legacy_result = await ds.query('account.bsdusers', [], {'prefix': 'bsdusr_', 'extend': 'user.legacy_extend'})
+        result = await ds.query('account.bsdusers', [], {'prefix': 'bsdusr_', 'extend': 'user.user_extend'})
+
+        assert [user['groups'] for user in result] == [user['groups'] for user in legacy_result]
+        assert {len(user['groups']) for user in result} == {0, 1, 2}
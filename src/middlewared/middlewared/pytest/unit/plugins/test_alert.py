@@ -0,0 +1,165 @@
+import asyncio
+from datetime import datetime
+import time
+from unittest.mock import Mock, patch
+
+from asynctest import CoroutineMock
+import pytest
+
+from middlewared.alert.base import Alert, AlertSource
+from middlewared.plugins.alert import (
+    ALERT_SOURCES, AlertService, AlertSourceRunFailedAlertClass, AlertSourceRunFailedOnBackupNodeAlertClass, AlertStore,
+)
+from middlewared.pytest.unit.middleware import Middleware
+from middlewared.service import CallError
+
+
+@pytest.mark.asyncio
+async def test__alert_cached_call():
+    m = Middleware()
+    m["pool.query"] = CoroutineMock(return_value=[{"name": "tank"}])
+    alert = AlertService(m)
+
+    alert.run_cache = {}
+    first, second = await asyncio.gather(
+        alert.cached_call("pool.query"),
+        alert.cached_call("pool.query"),
+    )
+    assert first == second == [{"name": "tank"}]
+    assert first is not second
+    m["pool.query"].assert_called_once_with()
+
+    alert.run_cache = None
+    await alert.cached_call("pool.query")
+    assert m["pool.query"].call_count == 2
+
+
+@pytest.mark.asyncio
+async def test__alert_run_sources_concurrently_with_timeout():
+    class OneAlertSource(AlertSource):
+        async def check(self):
+            await asyncio.sleep(0.1)
+            return Alert(AlertSourceRunFailedAlertClass, args={"source_name": "One", "traceback": ""})
+
+    class SlowAlertSource(AlertSource):
+        timeout = 0.2
+
+        async def check(self):
+            await asyncio.sleep(10)
+
+    m = Middleware()
+    alert = AlertService(m)
+    sources = {source.name: source for source in [OneAlertSource(m), SlowAlertSource(m)]}
+    with patch.dict(ALERT_SOURCES, sources):
+        start = time.monotonic()
+        result = await alert.run_sources(["One", "Slow"])
+        assert time.monotonic() - start < 1
+
+        assert [a["source"] for a in result["One"]] == ["One"]
+        assert result["Slow"][0]["args"]["traceback"] == "Timed out after 0.2 seconds"
+
+        stats = await alert.sources_stats()
+        assert stats["One"]["runs"] == 1
+        assert stats["One"]["timeouts"] == 0
+        assert stats["Slow"]["timeouts"] == 1
+        assert stats["Slow"]["p95_duration"] >= 0.2
+
+
+@pytest.mark.asyncio
+async def test__alert_run_remote_sources_legacy_backup_node():
+    class OneAlertSource(AlertSource):
+        pass
+
+    class TwoAlertSource(AlertSource):
+        pass
+
+    async def call_remote(method, args, options):
+        if method == "alert.run_sources":
+            raise CallError("Method not found", CallError.ENOMETHOD)
+
+        source_name, = args
+        if source_name == "Two":
+            raise ValueError("Broken")
+
+        return [dict(Alert(AlertSourceRunFailedAlertClass, args={"source_name": "One", "traceback": ""},
+                           _source="One").__dict__, klass="AlertSourceRunFailed")]
+
+    m = Middleware()
+    m["failover.call_remote"] = call_remote
+    alert = AlertService(m)
+    sources = {source.name: source for source in [OneAlertSource(m), TwoAlertSource(m)]}
+    with patch.dict(ALERT_SOURCES, sources):
+        result = await alert._AlertService__run_remote_sources(["One", "Two"])
+
+    assert [(a.klass, a.source) for a in result["One"]] == [(AlertSourceRunFailedAlertClass, "One")]
+    assert result["Two"][0].klass is AlertSourceRunFailedOnBackupNodeAlertClass
+    assert "Broken" in result["Two"][0].args["traceback"]
+
+
+def test__alert_store():
+    store = AlertStore()
+    a1 = Alert(AlertSourceRunFailedAlertClass, args={"source_name": "A", "traceback": ""}, node="A", _uuid="1",
+               _source="A")
+    a2 = Alert(AlertSourceRunFailedAlertClass, args={"source_name": "B", "traceback": ""}, node="A", _uuid="2",
+               _source="B")
+    store.add(a1)
+    store.add(a2)
+
+    a1_again = Alert(AlertSourceRunFailedAlertClass, args={"source_name": "A", "traceback": ""}, node="A", _uuid="1",
+                     _source="A")
+    assert store.get(a1_again) is a1
+    assert store.get_by_uuid("2") is a2
+    assert store.get_by_klass("A", AlertSourceRunFailedAlertClass) == [a1, a2]
+
+    store.replace_source("A", [a1_again])
+    assert list(store) == [a2, a1_again]
+    assert store.get_by_source("A") == [a1_again]
+    assert store.get_by_source("A", "B") == []
+
+    store.remove(a2)
+    assert list(store) == [a1_again]
+    assert store.get_by_uuid("2") is None
+    assert store.get_by_klass("A", AlertSourceRunFailedAlertClass) == [a1_again]
+
+
+@pytest.mark.asyncio
+async def test__alert_flush_alerts_incremental():
+    m = Middleware()
+    m["datastore.query"] = Mock(return_value=[])
+    m["datastore.bulk"] = Mock(side_effect=lambda operations: [
+        100 + i if operation["type"] == "INSERT" else operation.get("id_or_filters")
+        for i, operation in enumerate(operations)
+    ])
+    alert = AlertService(m)
+    await alert.initialize()
+
+    def create(source):
+        a = Alert(AlertSourceRunFailedAlertClass, args={"source_name": source, "traceback": ""}, node="A",
+                  _uuid=source, _source=source, datetime=datetime(2020, 1, 1))
+        alert.alerts.add(a)
+        return a
+
+    create("A")
+    b = create("B")
+    await alert.flush_alerts()
+    assert [operation["type"] for operation in m["datastore.bulk"].call_args[0][0]] == ["INSERT", "INSERT"]
+
+    # Nothing has changed
+    b.last_occurrence = datetime(2020, 1, 1, 0, 30)
+    await alert.flush_alerts()
+    assert m["datastore.bulk"].call_count == 1
+
+    # `last_occurrence` is outdated
+    b.last_occurrence = datetime(2020, 1, 1, 1, 0)
+    await alert.flush_alerts()
+    assert [
+        (operation["type"], operation["id_or_filters"], operation["data"]["last_occurrence"])
+        for operation in m["datastore.bulk"].call_args[0][0]
+    ] == [("UPDATE", 101, datetime(2020, 1, 1, 1, 0))]
+
+    b.dismissed = True
+    alert.alerts.remove(alert.alerts.get_by_uuid("A"))
+    await alert.flush_alerts()
+    assert [
+        (operation["type"], operation["id_or_filters"]) for operation in m["datastore.bulk"].call_args[0][0]
+    ] == [("DELETE", 100), ("UPDATE", 101)]
@@ -0,0 +1,81 @@
+import base64
+from unittest.mock import Mock, patch
+
+from asynctest import CoroutineMock
+import pytest
+
+from middlewared.plugins.auth import (
+    AuthService, CredentialCache, hook_datastore_execute_write, hook_datastore_execute_write_many,
+)
+from middlewared.pytest.unit.middleware import Middleware
+
+
+def test__credential_cache():
+    cache = CredentialCache(size=2)
+    cache.put("a", cache.generation)
+    cache.put("b", cache.generation)
+    assert cache.get("a")
+
+    cache.put("c", cache.generation)
+    assert not cache.get("b")
+    assert cache.get("a")
+    assert cache.get("c")
+
+
+def test__credential_cache_does_not_store_credentials():
+    cache = CredentialCache()
+    cache.put("Basic cm9vdDpzZWNyZXQ=", cache.generation)
+    assert all(b"cm9vdDpzZWNyZXQ=" not in digest for digest in cache.entries)
+
+
+def test__credential_cache_expires():
+    cache = CredentialCache(ttl=60)
+    with patch("middlewared.plugins.auth.time.monotonic", Mock(return_value=1000)):
+        cache.put("a", cache.generation)
+    with patch("middlewared.plugins.auth.time.monotonic", Mock(return_value=1061)):
+        assert not cache.get("a")
+
+
+def test__credential_cache_clear_discards_pending_verifications():
+    cache = CredentialCache()
+    generation = cache.generation
+    cache.clear()
+    cache.put("a", generation)
+    assert not cache.get("a")
+
+
+@pytest.mark.asyncio
+async def test__check_authorization_caches_credentials():
+    m = Middleware()
+    m["auth.check_user"] = CoroutineMock(return_value=True)
+    m["api_key.authenticate"] = CoroutineMock(return_value=None)
+    auth = AuthService(m)
+
+    with patch.object(AuthService, "credential_cache", CredentialCache()):
+        basic = "Basic " + base64.b64encode(b"root:secret").decode()
+        assert await auth.check_authorization(basic)
+        assert await auth.check_authorization(basic)
+        m["auth.check_user"].assert_called_once_with("root", "secret")
+
+        assert not await auth.check_authorization("Bearer 1-invalid")
+        assert not await auth.check_authorization("Bearer 1-invalid")
+        assert m["api_key.authenticate"].call_count == 2
+
+        hook_datastore_execute_write(m, "UPDATE account_bsdusers SET bsdusr_unixhash=? WHERE id = ?", [])
+        assert await auth.check_authorization(basic)
+        assert m["auth.check_user"].call_count == 2
+
+        # HA journal replayed from the other controller
+        hook_datastore_execute_write_many(m, [["UPDATE account_bsdusers SET bsdusr_unixhash=? WHERE id = ?", []]],
+                                          replicate=False)
+        assert await auth.check_authorization(basic)
+        assert m["auth.check_user"].call_count == 3
+
+
+@pytest.mark.asyncio
+async def test__check_authorization_token():
+    auth = AuthService(Middleware())
+
+    token = auth.token_manager.create(600)
+    assert await auth.check_authorization(f"Token {token.token}")
+    assert not await auth.check_authorization("Token invalid")
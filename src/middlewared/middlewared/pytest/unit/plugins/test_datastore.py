@@ -1,6 +1,6 @@
 from contextlib import asynccontextmanager
 import datetime
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 
 import pytest
 import sqlalchemy as sa
@@ -8,6 +8,7 @@ from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
+from middlewared.service import batch_extend
 from middlewared.sqlalchemy import EncryptedText, JSON, Time
 
 import middlewared.plugins.datastore  # noqa
@@ -30,6 +31,7 @@ async def datastore_test():
         with patch("middlewared.plugins.datastore.schema.Model", Model):
             with patch("middlewared.plugins.datastore.util.Model", Model):
                 ds = DatastoreService(m)
+                m["datastore.config_cache_invalidate"] = ds.config_cache_invalidate
                 await ds.setup()
 
                 for part in ds.parts:
@@ -41,12 +43,14 @@ async def datastore_test():
 
                 m["datastore.execute"] = ds.execute
                 m["datastore.execute_write"] = ds.execute_write
+                m["datastore.execute_transaction"] = ds.execute_transaction
                 m["datastore.fetchall"] = ds.fetchall
 
                 m["datastore.query"] = ds.query
                 m["datastore.send_insert_events"] = ds.send_insert_events
                 m["datastore.send_update_events"] = ds.send_update_events
                 m["datastore.send_delete_events"] = ds.send_delete_events
+                m["datastore.send_bulk_events"] = ds.send_bulk_events
 
                 yield ds
 
@@ -206,6 +210,7 @@ async def test__update_fk():
         await ds.execute("INSERT INTO `account_bsdgroups` VALUES (20, 2020)")
         await ds.execute("INSERT INTO `account_bsdgroups` VALUES (30, 3030)")
         await ds.execute("INSERT INTO `account_bsdusers` VALUES (5, 55, 20)")
+        ds.middleware.call_hook_inline.reset_mock()
 
         await ds.update("account_bsdusers", 5, {"bsdusr_uid": 100, "bsdusr_group": 30})
 
@@ -216,6 +221,27 @@ async def test__update_fk():
         )
 
 
+@pytest.mark.asyncio
+async def test__raw_sql_hooks_do_not_replicate():
+    async with datastore_test() as ds:
+        await ds.execute("INSERT INTO `account_bsdgroups` VALUES (?, ?)", [20, 2020])
+        await ds.fetchall("SELECT * FROM `account_bsdgroups`")
+
+        ds.middleware.call_hook_inline.assert_called_once_with(
+            "datastore.post_execute_write", "INSERT INTO `account_bsdgroups` VALUES (?, ?)", [20, 2020],
+            replicate=False,
+        )
+        ds.middleware.call_hook_inline.reset_mock()
+
+        queries = [["UPDATE `account_bsdgroups` SET bsdgrp_gid = ? WHERE id = ?", [2021, 20]]]
+        await ds.execute_many(queries)
+
+        ds.middleware.call_hook_inline.assert_called_once_with(
+            "datastore.post_execute_write_many", queries, replicate=False,
+        )
+        assert (await ds.query("account.bsdgroups", [], {"get": True}))["bsdgrp_gid"] == 2021
+
+
 @pytest.mark.asyncio
 async def test__bad_fk_update():
     async with datastore_test() as ds:
@@ -764,3 +790,133 @@ async def test__null_order_by(order_by, result):
         await ds.insert("test.null", {"value": 1})
 
         assert [row["id"] for row in await ds.query("test.null", [], {"order_by": order_by})] == result
+
+
+@pytest.mark.asyncio
+async def test__extend():
+    async with datastore_test() as ds:
+        await ds.execute("INSERT INTO `account_bsdgroups` VALUES (10, 1010)")
+        await ds.execute("INSERT INTO `account_bsdgroups` VALUES (20, 2020)")
+
+        calls = []
+
+        async def extend(group):
+            calls.append(group["id"])
+            group["extended"] = True
+            return group
+
+        ds.middleware["group.extend"] = extend
+
+        assert await ds.query("account.bsdgroups", [], {"prefix": "bsdgrp_", "extend": "group.extend"}) == [
+            {"id": 10, "gid": 1010, "extended": True},
+            {"id": 20, "gid": 2020, "extended": True},
+        ]
+        assert calls == [10, 20]
+
+
+@pytest.mark.asyncio
+async def test__batch_extend():
+    async with datastore_test() as ds:
+        await ds.execute("INSERT INTO `account_bsdgroups` VALUES (10, 1010)")
+        await ds.execute("INSERT INTO `account_bsdgroups` VALUES (20, 2020)")
+
+        calls = []
+
+        @batch_extend
+        async def extend(groups, context):
+            calls.append([group["id"] for group in groups])
+            for group in groups:
+                group["context"] = context
+            return groups
+
+        ds.middleware["group.extend"] = extend
+        ds.middleware["group.extend_context"] = lambda extra: "context"
+
+        assert await ds.query("account.bsdgroups", [], {
+            "prefix": "bsdgrp_", "extend": "group.extend", "extend_context": "group.extend_context",
+            "select": ["id", "context"],
+        }) == [
+            {"id": 10, "context": "context"},
+            {"id": 20, "context": "context"},
+        ]
+        assert calls == [[10, 20]]
+
+
+@pytest.mark.asyncio
+async def test__config_cache():
+    async with datastore_test() as ds:
+        for method in ["config", "config_cached", "update"]:
+            ds.middleware[f"datastore.{method}"] = getattr(ds, method)
+
+        await ds.config_cache_clear()
+
+        await ds.execute("INSERT INTO `account_bsdgroups` VALUES (10, 1010)")
+        await ds.execute("INSERT INTO `account_bsdusers` VALUES (5, 55, 10)")
+
+        config = await ds.config_cached("user", "account.bsdusers", {"prefix": "bsdusr_"})
+        assert config["uid"] == 55
+
+        config["uid"] = 0
+        assert (await ds.config_cached("user", "account.bsdusers", {"prefix": "bsdusr_"}))["uid"] == 55
+
+        await ds.update("account.bsdusers", 5, {"uid": 56}, {"prefix": "bsdusr_"})
+        assert (await ds.config_cached("user", "account.bsdusers", {"prefix": "bsdusr_"}))["uid"] == 56
+
+        # Joined tables invalidate the cache too
+        await ds.update("account.bsdgroups", 10, {"bsdgrp_gid": 2020})
+        config = await ds.config_cached("user", "account.bsdusers", {"prefix": "bsdusr_"})
+        assert config["group"]["bsdgrp_gid"] == 2020
+
+        assert await ds.config_cache_stats([], {}) == [{"namespace": "user", "hits": 1, "misses": 3, "cached": True}]
+
+
+@pytest.mark.asyncio
+async def test__bulk():
+    async with datastore_test() as ds:
+        await ds.execute("INSERT INTO `account_bsdgroups` VALUES (10, 1010)")
+        await ds.execute("INSERT INTO `account_bsdgroups` VALUES (20, 2020)")
+
+        assert await ds.bulk([
+            {"type": "INSERT", "name": "account.bsdgroups", "data": {"bsdgrp_gid": 3030}},
+            {"type": "UPDATE", "name": "account.bsdgroups", "id_or_filters": 10, "data": {"bsdgrp_gid": 1011}},
+            {"type": "DELETE", "name": "account.bsdgroups", "id_or_filters": 20},
+        ]) == [21, 10, None]
+
+        assert await ds.query("account.bsdgroups", [], {"prefix": "bsdgrp_"}) == [
+            {"id": 10, "gid": 1011},
+            {"id": 21, "gid": 3030},
+        ]
+
+
+@pytest.mark.asyncio
+async def test__bulk_delete_filters_events():
+    async with datastore_test() as ds:
+        await ds.execute("INSERT INTO `account_bsdgroups` VALUES (10, 1010)")
+        await ds.execute("INSERT INTO `account_bsdgroups` VALUES (20, 2020)")
+        await ds.execute("INSERT INTO `account_bsdgroups` VALUES (30, 3030)")
+
+        ds.middleware["datastore.send_bulk_events"] = Mock()
+
+        assert await ds.bulk([
+            {"type": "DELETE", "name": "account.bsdgroups", "id_or_filters": [["bsdgrp_gid", ">", 1500]]},
+        ]) == [None]
+
+        assert await ds.query("account.bsdgroups", [], {"prefix": "bsdgrp_"}) == [{"id": 10, "gid": 1010}]
+        ds.middleware["datastore.send_bulk_events"].assert_called_once_with("account.bsdgroups", {}, set(), {20, 30})
+        # Rows are only read to send events, the statement is not journaled
+        queries = ds.middleware.call_hook_inline.call_args[0][1]
+        assert [sql.split()[0] for sql, binds in queries] == ["DELETE"]
+
+
+@pytest.mark.asyncio
+async def test__bulk_rollback():
+    async with datastore_test() as ds:
+        await ds.execute("INSERT INTO `account_bsdgroups` VALUES (10, 1010)")
+
+        with pytest.raises(RuntimeError):
+            await ds.bulk([
+                {"type": "UPDATE", "name": "account.bsdgroups", "id_or_filters": 10, "data": {"bsdgrp_gid": 1011}},
+                {"type": "UPDATE", "name": "account.bsdgroups", "id_or_filters": 20, "data": {"bsdgrp_gid": 2021}},
+            ])
+
+        assert await ds.query("account.bsdgroups", [], {"prefix": "bsdgrp_"}) == [{"id": 10, "gid": 1010}]
@@ -0,0 +1,53 @@
+from unittest.mock import Mock, patch
+
+from middlewared.plugins.device_.device_info_linux import DeviceService
+
+
+def disk(name, serial):
+    return {**DeviceService.disk_default, 'name': name, 'serial': serial}
+
+
+def device_service(devices):
+    service = DeviceService(Mock())
+    service.retrieve_disk = Mock(side_effect=lambda block_device: devices.get(block_device.sys_name))
+    return service
+
+
+def udev_devices(names):
+    return [Mock(sys_name=name) for name in names]
+
+
+def test__get_disks__inventory_is_built_once():
+    devices = {'sda': disk('sda', 'A'), 'sdb': disk('sdb', 'B')}
+    service = device_service(devices)
+    with patch('middlewared.plugins.device_.device_info_linux.pyudev') as pyudev:
+        pyudev.Context.return_value.list_devices.return_value = udev_devices(['sda', 'sdb', 'sr0'])
+
+        assert service.get_disks() == devices
+        assert service.get_disks() == devices
+        assert pyudev.Context.return_value.list_devices.call_count == 1
+
+        # Callers can not modify the inventory
+        service.get_disks()['sda']['serial'] = 'X'
+        assert service.get_disk('sda') == devices['sda']
+
+        service.get_disks(force_rescan=True)
+        assert pyudev.Context.return_value.list_devices.call_count == 2
+
+
+def test__disks_inventory_event():
+    devices = {'sda': disk('sda', 'A')}
+    service = device_service(devices)
+    with patch('middlewared.plugins.device_.device_info_linux.pyudev') as pyudev:
+        pyudev.Context.return_value.list_devices.return_value = udev_devices(['sda'])
+        service.get_disks()
+
+        devices['sdb'] = disk('sdb', 'B')
+        pyudev.Devices.from_name.side_effect = lambda context, subsystem, name: Mock(sys_name=name)
+        service.disks_inventory_event('add', 'sdb')
+        assert service.get_disk('sdb') == devices['sdb']
+
+        service.disks_inventory_event('remove', 'sda')
+        assert set(service.get_disks()) == {'sdb'}
+        assert service.get_disk('sda') is None
+        assert pyudev.Context.return_value.list_devices.call_count == 1
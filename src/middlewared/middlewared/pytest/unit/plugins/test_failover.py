@@ -1,6 +1,10 @@
 import errno
+import pickle
+import sqlite3
 from unittest.mock import MagicMock, Mock, patch
 
+import pytest
+
 import middlewared
 from middlewared.service import CallError
 from middlewared.pytest.unit.middleware import Middleware
@@ -74,6 +78,74 @@ def test__journal_write__append_shift_append__write():
     journal._write.assert_called_once()
 
 
+def test__journal__reopen(tmp_path):
+    path = str(tmp_path / "ha-journal")
+    journal = failover.Journal(path)
+    for i in range(5):
+        journal.append((f"INSERT {i}", [i]))
+    journal.write()
+    journal.shift(2)
+    journal.write()
+    journal.append(("INSERT 5", [5]))
+    journal.write()
+
+    assert list(failover.Journal(path)) == [(f"INSERT {i}", [i]) for i in range(2, 6)]
+
+
+def test__journal__reopen_flushed(tmp_path):
+    path = str(tmp_path / "ha-journal")
+    journal = failover.Journal(path)
+    journal.append(("INSERT 0", [0]))
+    journal.write()
+    journal.shift()
+    journal.write()
+
+    journal = failover.Journal(path)
+    assert not journal
+    journal.append(("INSERT 1", [1]))
+    journal.write()
+
+    assert list(failover.Journal(path)) == [("INSERT 1", [1])]
+
+
+def test__journal__compact(tmp_path):
+    path = str(tmp_path / "ha-journal")
+    journal = failover.Journal(path)
+    journal.compact_threshold = 2
+    for i in range(5):
+        journal.append((f"INSERT {i}", [i]))
+    journal.write()
+    journal.shift(4)
+    journal.write()
+
+    assert journal.log_records == 1
+    assert list(failover.Journal(path)) == [("INSERT 4", [4])]
+
+
+def test__journal__legacy_format(tmp_path):
+    path = str(tmp_path / "ha-journal")
+    with open(path, "wb") as f:
+        pickle.dump([("INSERT 0", [0]), ("INSERT 1", [1])], f)
+
+    journal = failover.Journal(path)
+    journal.shift()
+    journal.write()
+
+    assert list(failover.Journal(path)) == [("INSERT 1", [1])]
+
+
+def test__journal__peek_many():
+    with patch("middlewared.plugins.failover.os.path.exists", Mock(return_value=False)):
+        journal = failover.Journal()
+
+    journal.append(("INSERT 0", [0]))
+    journal.append((["INSERT 1", "INSERT 2"], None))
+    journal.append(("INSERT 3", [3]))
+
+    assert journal.peek_many(1) == [("INSERT 0", [0])]
+    assert journal.peek_many(3) == [("INSERT 0", [0]), (["INSERT 1", "INSERT 2"], None)]
+
+
 def test__journal_sync__flush_journal():
     middleware = Middleware()
     middleware['failover.status'] = Mock(return_value='MASTER')
@@ -81,15 +153,17 @@ def test__journal_sync__flush_journal():
     middleware['alert.oneshot_delete'] = Mock()
     journal = MagicMock()
     journal.__bool__.side_effect = [True, False]
-    journal.peek.return_value = [Mock(), Mock()]
+    journal.peek_many.return_value = [('INSERT 1', [1]), (['INSERT 2', 'INSERT 3'], None)]
     journal_sync = failover.JournalSync(middleware, Mock(), journal)
 
     assert journal_sync._flush_journal()
 
-    middleware['failover.call_remote'].assert_called_once_with('datastore.sql', journal.peek.return_value)
+    middleware['failover.call_remote'].assert_called_once_with(
+        'datastore.sql_many', [[('INSERT 1', [1]), 'INSERT 2', 'INSERT 3']]
+    )
     assert not journal_sync.last_query_failed
     middleware['alert.oneshot_delete'].assert_called_once_with('FailoverSyncFailed', None)
-    journal.shift.assert_called_once()
+    journal.shift.assert_called_once_with(2)
 
 
 def test__journal_sync__flush_journal__error():
@@ -99,7 +173,7 @@ def test__journal_sync__flush_journal__error():
     middleware['alert.oneshot_create'] = Mock()
     journal = MagicMock()
     journal.__bool__.side_effect = [True, False]
-    journal.peek.return_value = [Mock(), Mock()]
+    journal.peek_many.return_value = [(Mock(), Mock())]
     journal_sync = failover.JournalSync(middleware, Mock(), journal)
 
     assert not journal_sync._flush_journal()
@@ -115,10 +189,107 @@ def test__journal_sync__flush_journal__network_error():
     middleware['failover.call_remote'] = Mock(side_effect=CallError('Connection refused', errno.ECONNREFUSED))
     journal = MagicMock()
     journal.__bool__.side_effect = [True, False]
-    journal.peek.return_value = [Mock(), Mock()]
+    journal.peek_many.return_value = [(Mock(), Mock())]
     journal_sync = failover.JournalSync(middleware, Mock(), journal)
 
     assert not journal_sync._flush_journal()
 
     assert not journal_sync.last_query_failed
     journal.shift.assert_not_called()
+
+
+class JournalPeer:
+    """
+    Stand-in for the other controller: applies replicated queries to its own database.
+    """
+
+    def __init__(self, legacy=False):
+        self.connection = sqlite3.connect(':memory:', isolation_level=None)
+        self.connection.execute('CREATE TABLE system_keyvalue (id INTEGER PRIMARY KEY, value INTEGER)')
+        self.legacy = legacy
+        self.round_trips = 0
+
+    def call_remote(self, method, args):
+        self.round_trips += 1
+        if self.legacy:
+            # Older versions only have `datastore.sql`
+            if method == 'datastore.sql_many':
+                raise CallError('Method not found', CallError.ENOMETHOD)
+
+            assert method == 'datastore.sql'
+            self.connection.execute(*args)
+            return
+
+        assert method == 'datastore.sql_many'
+        queries, = args
+        self.connection.execute('BEGIN')
+        for query, params in queries:
+            self.connection.execute(query, params)
+        self.connection.execute('COMMIT')
+
+    def count(self):
+        return self.connection.execute('SELECT COUNT(*) FROM system_keyvalue').fetchone()[0]
+
+
+@pytest.mark.parametrize('batch_size,round_trips', [(1, 2500), (1000, 3)])
+def test__journal_drain__batches(tmp_path, batch_size, round_trips):
+    journal = failover.Journal(str(tmp_path / 'ha-journal'))
+    for i in range(2500):
+        journal.append(('INSERT INTO system_keyvalue (id, value) VALUES (?, ?)', [i, i]))
+    journal.write()
+
+    peer = JournalPeer()
+    middleware = Middleware()
+    middleware['failover.status'] = Mock(return_value='MASTER')
+    middleware['failover.call_remote'] = peer.call_remote
+    middleware['alert.oneshot_delete'] = Mock()
+    journal_sync = failover.JournalSync(middleware, Mock(), journal)
+    journal_sync.batch_size = batch_size
+
+    assert journal_sync._flush_journal()
+
+    assert peer.count() == 2500
+    assert peer.round_trips == round_trips
+    assert not failover.Journal(str(tmp_path / 'ha-journal'))
+
+
+def test__journal_drain__legacy_peer(tmp_path):
+    journal = failover.Journal(str(tmp_path / 'ha-journal'))
+    for i in range(10):
+        journal.append(('INSERT INTO system_keyvalue (id, value) VALUES (?, ?)', [i, i]))
+    journal.append(([('INSERT INTO system_keyvalue (id, value) VALUES (?, ?)', [i, i]) for i in range(10, 15)], None))
+    journal.write()
+
+    peer = JournalPeer(legacy=True)
+    middleware = Middleware()
+    middleware['failover.status'] = Mock(return_value='MASTER')
+    middleware['failover.call_remote'] = peer.call_remote
+    middleware['alert.oneshot_delete'] = Mock()
+    middleware['alert.oneshot_create'] = Mock()
+    journal_sync = failover.JournalSync(middleware, Mock(), journal)
+
+    assert journal_sync._flush_journal()
+
+    assert peer.count() == 15
+    # One failed `datastore.sql_many` call and a `datastore.sql` call for every query
+    assert peer.round_trips == 16
+    middleware['alert.oneshot_create'].assert_not_called()
+    assert not failover.Journal(str(tmp_path / 'ha-journal'))
+
+
+def test__send_small_file__legacy_peer(tmp_path):
+    (tmp_path / 'file').write_bytes(b'contents')
+
+    def call_remote(method, args):
+        if method == 'failover.file_checksum':
+            raise CallError('Method not found', CallError.ENOMETHOD)
+
+    middleware = Middleware()
+    middleware['failover.call_remote'] = Mock(side_effect=call_remote)
+    middleware['failover.sendfile'] = Mock()
+
+    failover.FailoverService(middleware).send_small_file(str(tmp_path / 'file'), '/data/file')
+
+    middleware['failover.sendfile'].assert_not_called()
+    method, (dest, data, options) = middleware['failover.call_remote'].call_args[0]
+    assert (method, dest, data, options['append']) == ('filesystem.file_receive', '/data/file', 'Y29udGVudHM=', False)
@@ -0,0 +1,73 @@
+import os
+from unittest.mock import patch
+
+import pytest
+
+from middlewared.plugins.filesystem import FilesystemService, posix1e_acl_is_trivial
+from middlewared.pytest.unit.middleware import Middleware
+from middlewared.utils import filter_list
+
+# Unresolved `query-filters`/`query-options` schemas are not validated in unit tests
+listdir = FilesystemService.listdir.wraps
+
+
+def populate(path, count):
+    for i in range(count):
+        with open(os.path.join(path, f"file{i}"), "w"):
+            pass
+
+
+def test__posix1e_acl_is_trivial(tmp_path):
+    populate(str(tmp_path), 1)
+
+    assert posix1e_acl_is_trivial(str(tmp_path / "file0"))
+
+
+def test__listdir__limit_offset(tmp_path):
+    populate(str(tmp_path), 10)
+    names = sorted(os.listdir(tmp_path))
+
+    result = listdir(FilesystemService(Middleware()), str(tmp_path), [], {
+        "order_by": ["name"], "offset": 2, "limit": 3,
+    })
+
+    assert [entry["name"] for entry in result] == names[2:5]
+
+
+def test__listdir__unordered_limit_does_not_stat_everything(tmp_path):
+    populate(str(tmp_path), 10)
+    service = FilesystemService(Middleware())
+
+    with patch.object(service, "_acl_is_trivial", wraps=service._acl_is_trivial) as acl_is_trivial:
+        result = listdir(service, str(tmp_path), [], {"offset": 4, "limit": 3})
+
+    assert len(result) == 3
+    assert acl_is_trivial.call_count == 3
+
+
+def test__listdir__select_skips_stat(tmp_path):
+    populate(str(tmp_path), 10)
+    service = FilesystemService(Middleware())
+
+    with patch.object(service, "_acl_is_trivial") as acl_is_trivial:
+        result = listdir(service, str(tmp_path), [["name", "^", "file1"]], {"select": ["name", "size"]})
+
+    assert result == [{"name": "file1", "size": 0}]
+    acl_is_trivial.assert_not_called()
+
+
+@pytest.mark.parametrize("filters,options", [
+    ([], {}),
+    ([], {"select": ["name", "type"]}),
+    ([], {"offset": 500, "limit": 100}),
+    ([], {"order_by": ["name"], "offset": 500, "limit": 100}),
+    ([["name", "$", "7"]], {"count": True}),
+    ([["name", "$", "7"]], {"order_by": ["-name"], "get": True}),
+])
+def test__listdir__matches_filter_list(tmp_path, filters, options):
+    populate(str(tmp_path), 1000)
+    service = FilesystemService(Middleware())
+
+    assert listdir(service, str(tmp_path), filters, options) == filter_list(
+        listdir(service, str(tmp_path), [], {}), filters, options,
+    )
@@ -0,0 +1,86 @@
+import ipaddress
+import subprocess
+import sys
+import uuid
+
+import pytest
+
+from middlewared.plugins.interface.netif_linux import backend as netif_backend
+from middlewared.plugins.interface.netif_linux.address.types import AddressFamily, InterfaceAddress
+from middlewared.plugins.interface.netif_linux.interface import Interface
+from middlewared.plugins.interface.netif_linux.netif import list_interfaces
+from middlewared.plugins.interface.netif_linux.rtnetlink import attr, parse_attrs
+
+
+@pytest.fixture()
+def veth():
+    name = f"vt{uuid.uuid4().hex[:8]}"
+    try:
+        subprocess.run(["ip", "link", "add", name, "type", "veth", "peer", "name", f"{name}p"],
+                       check=True, capture_output=True)
+    except (OSError, subprocess.CalledProcessError):
+        pytest.skip("Unable to create veth interfaces")
+
+    try:
+        yield name
+    finally:
+        subprocess.run(["ip", "link", "delete", name], capture_output=True)
+
+
+def address(value):
+    interface = ipaddress.ip_interface(value)
+    return InterfaceAddress(AddressFamily.INET6 if interface.version == 6 else AddressFamily.INET, interface)
+
+
+def test__rtnetlink_attrs():
+    data = attr(3, "eth0") + attr(4, 1500) + attr(18, [attr(1, b"bond")])
+
+    attrs = parse_attrs(data)
+
+    assert attrs[3] == b"eth0\0"
+    assert attrs[4] == (1500).to_bytes(4, sys.byteorder)
+    assert parse_attrs(attrs[18]) == {1: b"bond"}
+    # Attributes are padded to 4 bytes
+    assert len(attr(1, b"bond0")) == 12
+
+
+def test__netlink_backend(veth):
+    backend = netif_backend.NetlinkBackend()
+    iface = Interface(veth)
+    addresses = [address(f"10.255.{i // 200}.{i % 200 + 1}/32") for i in range(400)] + [address("fd00:ffff::1/64")]
+
+    iface.add_addresses(addresses)
+    iface.mtu = 1400
+    iface.up()
+
+    links, dump = backend.dump()
+    assert links[veth].mtu == 1400
+    assert {str(a.address) for a in dump[veth]} >= {str(a.address) for a in addresses}
+    assert list_interfaces()[veth].mtu == 1400
+
+    with pytest.raises(FileExistsError):
+        iface.add_addresses(addresses[:1])
+
+    iface.remove_addresses(addresses)
+    assert [a.af for a in backend.addresses(veth) if a.af != AddressFamily.INET6] == [AddressFamily.LINK]
+
+
+@pytest.mark.parametrize("name", ["ip", "netlink"])
+def test__backends_configure_same_state(veth, name):
+    backend = netif_backend.BACKENDS[name]()
+    addresses = [address(f"10.254.0.{i}/32") for i in range(1, 51)]
+
+    backend.address_change(veth, [("add", a) for a in addresses])
+    backend.link_set(veth, mtu=1400)
+
+    links, dump = netif_backend.NetlinkBackend().dump()
+    assert links[veth].mtu == 1400
+    assert {a.address for a in dump[veth] if a.af == AddressFamily.INET} == {a.address for a in addresses}
+
+    backend.address_change(veth, [("del", a) for a in addresses])
+    assert not [a for a in backend.addresses(veth) if a.af == AddressFamily.INET]
+
+
+def test__netlink_backend__missing_device():
+    with pytest.raises(FileNotFoundError):
+        netif_backend.NetlinkBackend().link_set("nonexistent0", up=True)
@@ -1,8 +1,10 @@
 import textwrap
+from unittest.mock import Mock
 
 import pytest
 
-from middlewared.plugins.pool import parse_lsof
+from middlewared.plugins.pool import PoolService, dataset_query_properties, parse_lsof
+from middlewared.pytest.unit.middleware import Middleware
 
 
 @pytest.mark.parametrize("lsof,dirs,result", [
@@ -41,3 +43,55 @@ from middlewared.plugins.pool import parse_lsof
 ])
 def test__parse_lsof(lsof, dirs, result):
     assert parse_lsof(lsof, dirs) == result
+
+
+@pytest.mark.parametrize("filters,options,result", [
+    ([], {}, (None, True)),
+    ([], {"select": ["id", "locked", "children"]}, ([], False)),
+    ([["compression.value", "=", "LZ4"]], {"select": ["name", "key_format"]}, (["compression", "keyformat"], False)),
+    ([], {"select": ["name", "used"], "order_by": ["-available"]}, (["available", "used"], False)),
+    ([], {"select": ["name", "comments", "used"]}, (["used"], True)),
+    ([], {"select": ["name", "unknown"]}, (None, True)),
+])
+def test__dataset_query_properties(filters, options, result):
+    assert dataset_query_properties(filters, options) == result
+
+
+def test__pool_extend_resolves_labels_once():
+    def zpool(name, *labels):
+        return {
+            "name": name,
+            "status": "ONLINE",
+            "scan": None,
+            "healthy": True,
+            "status_detail": None,
+            "groups": {
+                "data": [{
+                    "type": "mirror",
+                    "path": None,
+                    "children": [{"type": "disk", "path": f"/dev/{label}", "children": []} for label in labels],
+                }],
+            },
+        }
+
+    m = Middleware()
+    m["zfs.pool.query"] = Mock(return_value=[zpool("tank", "gptid/a", "gptid/b"), zpool("backup", "gptid/c")])
+    m["disk.label_to_dev_disk_map"] = Mock(side_effect=lambda labels: {
+        label: (f"{label[-1]}p2", f"{label[-1]}") for label in labels
+    })
+
+    pools = PoolService(m).pool_extend([
+        {"id": 1, "name": "tank", "encrypt": 0},
+        {"id": 2, "name": "backup", "encrypt": 0},
+        {"id": 3, "name": "offline", "encrypt": 0},
+    ])
+
+    m["zfs.pool.query"].assert_called_once_with()
+    m["disk.label_to_dev_disk_map"].assert_called_once()
+    assert sorted(m["disk.label_to_dev_disk_map"].call_args[0][0]) == ["gptid/a", "gptid/b", "gptid/c"]
+
+    mirror = pools[0]["topology"]["data"][0]
+    assert mirror["type"] == "MIRROR"
+    assert [(disk["device"], disk["disk"]) for disk in mirror["children"]] == [("ap2", "a"), ("bp2", "b")]
+    assert pools[1]["topology"]["data"][0]["children"][0]["disk"] == "c"
+    assert pools[2]["status"] == "OFFLINE"
@@ -0,0 +1,68 @@
+import json
+from unittest.mock import Mock, patch
+
+from middlewared.plugins.reporting.events import RealtimeStats
+from middlewared.plugins.reporting.plugins import DiskPlugin, LoadPlugin
+from middlewared.plugins.reporting.rrd_utils import export, prefix_defs
+
+
+def test__get_temperature_sensors(tmp_path):
+    coretemp = tmp_path / "hwmon1"
+    coretemp.mkdir()
+    (coretemp / "name").write_text("coretemp\n")
+    (coretemp / "temp1_label").write_text("Package id 0\n")
+    (coretemp / "temp1_input").write_text("52000\n")
+    (coretemp / "temp2_label").write_text("Core 0\n")
+    (coretemp / "temp2_input").write_text("48000\n")
+    (coretemp / "temp3_label").write_text("Core 1\n")
+    (coretemp / "temp3_input").write_text("50000\n")
+    acpi = tmp_path / "hwmon0"
+    acpi.mkdir()
+    (acpi / "name").write_text("acpitz\n")
+    (acpi / "temp1_input").write_text("27800\n")
+
+    assert RealtimeStats.get_temperature_sensors(str(tmp_path)) == {
+        0: str(coretemp / "temp2_input"),
+        1: str(coretemp / "temp3_input"),
+    }
+
+
+def test__prefix_defs():
+    assert prefix_defs([
+        "DEF:if_octets_rx=/rrd/interface-em0/if_octets.rrd:rx:AVERAGE",
+        "DEF:if_octets_tx=/rrd/interface-em0/if_octets.rrd:tx:AVERAGE",
+        "CDEF:cif_octets_rx=if_octets_rx,8,*",
+        "CDEF:overlap=cif_octets_rx,if_octets_tx,LT,cif_octets_rx,if_octets_tx,IF",
+        "XPORT:cif_octets_rx:if_octets_rx",
+        "XPORT:overlap:overlap",
+    ], "g1_") == ([
+        "DEF:g1_if_octets_rx=/rrd/interface-em0/if_octets.rrd:rx:AVERAGE",
+        "DEF:g1_if_octets_tx=/rrd/interface-em0/if_octets.rrd:tx:AVERAGE",
+        "CDEF:g1_cif_octets_rx=g1_if_octets_rx,8,*",
+        "CDEF:g1_overlap=g1_cif_octets_rx,g1_if_octets_tx,LT,g1_cif_octets_rx,g1_if_octets_tx,IF",
+        "XPORT:g1_cif_octets_rx:if_octets_rx",
+        "XPORT:g1_overlap:overlap",
+    ], 2)
+
+
+def test__export_many():
+    disk = DiskPlugin(Mock())
+    load = LoadPlugin(Mock())
+    output = {
+        "meta": {"start": 0, "end": 20, "step": 10, "rows": 2, "columns": 5,
+                 "legend": ["disk_octets_read", "disk_octets_write", "load_shortterm", "load_midterm",
+                            "load_longterm"]},
+        "data": [[1.0, 2.0, 0.5, 0.25, 0.125], [3.0, None, 1.5, 0.75, None]],
+    }
+    with patch("middlewared.plugins.reporting.rrd_utils.subprocess.run") as run:
+        run.return_value = Mock(returncode=0, stdout=json.dumps(output))
+
+        disk_data, load_data = export([(disk, "ada0"), (load, None)], "end-1h", "now")
+
+    run.assert_called_once()
+    assert disk_data["data"] == [[1.0, 2.0], [3.0, None]]
+    assert disk_data["legend"] == ["disk_octets_read", "disk_octets_write"]
+    assert disk_data["aggregations"] == {"min": [1.0, 2.0], "mean": [2.0, 2.0], "max": [3.0, 2.0]}
+    assert load_data["identifier"] is None
+    assert load_data["columns"] == 3
+    assert load_data["aggregations"]["mean"] == [1.0, 0.5, 0.125]
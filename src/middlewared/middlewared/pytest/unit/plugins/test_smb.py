@@ -0,0 +1,116 @@
+from asynctest import CoroutineMock, Mock
+import pytest
+
+from middlewared.plugins.smb_.registry import diff_smbconf, parse_smbconf, SharingSMBService
+
+SHARECONF = """
+[homes]
+    path = /mnt/tank/homes/%U
+    read only = no
+    vfs objects = zfs_space noacl
+
+[share1]
+    path = /mnt/tank/share1
+    browseable = No
+    fruit:time machine = yes
+
+[share2]
+    path = /mnt/tank/share2
+    comment = Share 2
+"""
+
+REGISTRY = """[homes]
+\tpath = /mnt/tank/homes/%U
+\tread only = No
+\tvfs objects = zfs_space noacl
+
+[share1]
+\tpath = /mnt/tank/share1
+\tbrowseable = No
+\tfruit:time machine = yes
+
+[share2]
+\tpath = /mnt/tank/share2
+\tcomment = Old comment
+
+[share3]
+\tpath = /mnt/tank/share3
+"""
+
+
+def test__parse_smbconf():
+    assert parse_smbconf(SHARECONF)["homes"] == {
+        "path": "/mnt/tank/homes/%U",
+        "read only": "no",
+        "vfs objects": "zfs_space noacl",
+    }
+
+
+def test__diff_smbconf():
+    assert diff_smbconf(parse_smbconf(SHARECONF), parse_smbconf(REGISTRY)) == {
+        "removed": ["share3"],
+        "changed": ["share2"],
+    }
+
+
+def sync_registry_service(registry):
+    imported = []
+
+    async def netconf(action, share=None, args=None):
+        if action == "list":
+            return registry
+        if action == "import":
+            with open(args[0]) as f:
+                imported.append((args[1:], parse_smbconf(f.read())))
+        return ""
+
+    service = SharingSMBService(Mock())
+    service.netconf = CoroutineMock(side_effect=netconf)
+    return service, imported
+
+
+@pytest.mark.asyncio
+async def test__sync_registry__changed_shares_only(tmp_path):
+    path = tmp_path / "smb4_share.conf"
+    path.write_text(SHARECONF)
+    service, imported = sync_registry_service(REGISTRY)
+
+    await service.sync_registry(str(path))
+
+    service.netconf.assert_any_call(action="delshare", share="share3")
+    assert imported == [
+        (["share2"], {"share2": {"path": "/mnt/tank/share2", "comment": "Share 2"}}),
+    ]
+
+
+@pytest.mark.asyncio
+async def test__sync_registry__unchanged(tmp_path):
+    path = tmp_path / "smb4_share.conf"
+    path.write_text(REGISTRY)
+    service, imported = sync_registry_service(REGISTRY)
+
+    assert await service.sync_registry(str(path)) == {"removed": [], "changed": []}
+    assert service.netconf.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test__sync_registry__empty_registry(tmp_path):
+    path = tmp_path / "smb4_share.conf"
+    path.write_text(SHARECONF)
+    service, imported = sync_registry_service("")
+
+    await service.sync_registry(str(path))
+
+    assert imported == [([], parse_smbconf(SHARECONF))]
+
+
+@pytest.mark.asyncio
+async def test__sync_registry__all_removed(tmp_path):
+    path = tmp_path / "smb4_share.conf"
+    path.write_text("")
+    service, imported = sync_registry_service(REGISTRY)
+
+    await service.sync_registry(str(path))
+
+    assert imported == [([], {})]
+    assert [c for c in service.netconf.call_args_list if c[1]["action"] == "delshare"] == []
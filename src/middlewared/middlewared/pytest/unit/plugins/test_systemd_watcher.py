@@ -0,0 +1,53 @@
+from unittest.mock import Mock
+
+from middlewared.plugins.service_.services.base_state import ServiceState
+from middlewared.plugins.service_.services.systemd_watcher import SystemdWatcher
+
+
+def unit(active_state, main_pid=0):
+    return Mock(Unit=Mock(ActiveState=active_state), MainPID=main_pid)
+
+
+def test__systemd_watcher__refresh():
+    on_change = Mock()
+    watcher = SystemdWatcher()
+    watcher.units = {"smbd.service": ["cifs"], "ssh.service": ["ssh"]}
+    watcher.on_change = on_change
+    objects = {"smbd.service": unit(b"active", 100), "ssh.service": unit(b"inactive")}
+
+    watcher.refresh(objects, objects.keys(), notify=False)
+
+    assert watcher.get("smbd.service") == ServiceState(True, [100])
+    assert watcher.get("ssh.service") == ServiceState(False, [])
+    assert watcher.get("nginx.service") is None
+
+    objects["ssh.service"] = unit(b"active", 200)
+    watcher.refresh(objects, ["smbd.service", "ssh.service"])
+
+    assert watcher.get("ssh.service") == ServiceState(True, [200])
+    on_change.assert_called_once_with("ssh")
+
+
+def test__systemd_watcher__invalidate():
+    on_change = Mock()
+    watcher = SystemdWatcher()
+    watcher.units = {"smbd.service": ["cifs"]}
+    watcher.on_change = on_change
+    objects = {"smbd.service": unit(b"inactive")}
+    watcher.refresh(objects, objects.keys(), notify=False)
+
+    watcher.invalidate("smbd.service")
+
+    # Must not be served from the cache until re-read by the watcher
+    assert watcher.get("smbd.service") is None
+    watcher.refresh(objects, objects.keys())
+    assert watcher.get("smbd.service") is None
+
+    with watcher.lock:
+        dirty, watcher.dirty = watcher.dirty, set()
+    objects["smbd.service"] = unit(b"active", 100)
+    watcher.refresh(objects, dirty)
+
+    assert watcher.get("smbd.service") == ServiceState(True, [100])
+    # State change caused by an explicit action is already reported by the action itself
+    on_change.assert_not_called()
@@ -0,0 +1,118 @@
+from unittest.mock import patch
+
+import pytest
+
+from middlewared.plugins.zfs import ZFSDatasetService, copy_dataset, dataset_name_matcher, project_user_properties
+
+
+def dataset(name, *children):
+    return {
+        'id': name,
+        'name': name,
+        'pool': name.split('/')[0],
+        'properties': {'used': {'value': '1M', 'rawvalue': '1048576'}},
+        'children': list(children),
+    }
+
+
+TREE = [
+    dataset('tank', dataset('tank/a', dataset('tank/a/b')), dataset('tank/ab')),
+    dataset('backup', dataset('backup/a')),
+]
+
+
+def test__flatten_datasets():
+    flat = ZFSDatasetService.flatten_datasets(None, TREE)
+
+    assert [ds['id'] for ds in flat] == ['tank', 'tank/a', 'tank/a/b', 'tank/ab', 'backup', 'backup/a']
+    # Children are shared, not copied
+    assert flat[0]['children'][0] is flat[1]
+
+
+def test__flatten_datasets_generator():
+    flat = ZFSDatasetService.flatten_datasets(None, (ds for ds in TREE))
+
+    assert [ds['id'] for ds in flat] == ['tank', 'tank/a', 'tank/a/b', 'tank/ab', 'backup', 'backup/a']
+
+
+def test__query_datasets_generator():
+    with patch('middlewared.plugins.zfs.libzfs.ZFS') as ZFS:
+        ZFS.return_value.__enter__.return_value.datasets_serialized.side_effect = lambda **kwargs: (
+            copy_dataset(ds) for ds in TREE
+        )
+
+        result = ZFSDatasetService.query.wraps(
+            ZFSDatasetService(None), [['pool', '=', 'backup']], {'extra': {'flat_children': 'NAMES'}},
+        )
+
+    assert [(ds['id'], ds['children']) for ds in result] == [('backup', ['backup/a']), ('backup/a', [])]
+
+
+@pytest.mark.parametrize('filters,result', [
+    ([['id', '=', 'tank/a']], ['tank', 'tank/a']),
+    ([['name', 'in', ['tank/ab', 'backup']]], ['tank', 'tank/ab', 'backup']),
+    ([['id', '^', 'tank/a']], ['tank', 'tank/a', 'tank/a/b', 'tank/ab']),
+    ([['id', '^', 'tank/a/']], ['tank', 'tank/a', 'tank/a/b']),
+    ([['pool', '=', 'backup']], ['backup', 'backup/a']),
+    ([['pool', '=', 'tank'], ['id', '!=', 'tank/a']], ['tank', 'tank/a', 'tank/a/b', 'tank/ab']),
+])
+def test__flatten_datasets_match(filters, result):
+    flat = ZFSDatasetService.flatten_datasets(None, TREE, dataset_name_matcher(filters))
+
+    assert [ds['id'] for ds in flat] == result
+
+
+@pytest.mark.parametrize('filters', [
+    None,
+    [],
+    [['id', '!=', 'tank']],
+    [['id', '~', 'tank']],
+    [['OR', [['id', '=', 'tank'], ['id', '=', 'backup']]]],
+])
+def test__dataset_name_matcher_not_applicable(filters):
+    assert dataset_name_matcher(filters) is None
+
+
+def test__copy_dataset():
+    copy = copy_dataset(TREE[0])
+
+    assert copy == TREE[0]
+    assert copy['children'][0] is not TREE[0]['children'][0]
+    assert copy['properties']['used'] is not TREE[0]['properties']['used']
+
+
+def test__project_user_properties():
+    datasets = [dataset('tank', dataset('tank/a'))]
+    for ds in (datasets[0], datasets[0]['children'][0]):
+        ds['properties'].update({
+            'org.freenas:description': {'value': 'a'},
+            'org.freenas:quota_warning': {'value': '80'},
+        })
+
+    project_user_properties(datasets, {'org.freenas:quota_warning'})
+
+    for ds in (datasets[0], datasets[0]['children'][0]):
+        assert set(ds['properties']) == {'used', 'org.freenas:quota_warning'}
+
+
+def test__project_user_properties_generator():
+    datasets = [dataset('tank', dataset('tank/a'))]
+    datasets[0]['properties']['org.freenas:description'] = {'value': 'a'}
+
+    result = project_user_properties((ds for ds in datasets), set())
+
+    assert result == datasets
+    assert set(result[0]['properties']) == {'used'}
+
+
+def test__query_user_properties_generator():
+    with patch('middlewared.plugins.zfs.libzfs.ZFS') as ZFS:
+        ZFS.return_value.__enter__.return_value.datasets_serialized.side_effect = lambda **kwargs: (
+            copy_dataset(ds) for ds in TREE
+        )
+
+        result = ZFSDatasetService.query.wraps(
+            ZFSDatasetService(None), [], {'extra': {'user_properties': ['org.freenas:quota_warning']}},
+        )
+
+    assert [ds['id'] for ds in result] == ['tank', 'tank/a', 'tank/a/b', 'tank/ab', 'backup', 'backup/a']
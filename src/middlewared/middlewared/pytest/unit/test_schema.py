@@ -6,6 +6,7 @@ from middlewared.service_exception import ValidationErrors
 from middlewared.schema import (
     accepts, Bool, Cron, Dict, Dir, Error, File, Float, Int, IPAddr, List, Str, UnixPerm,
 )
+from middlewared.validators import Range
 
 
 def test__nonhidden_after_hidden():
@@ -631,3 +632,57 @@ def test__schema_str_job_default():
     jobm = Mock()
 
     assert strdef(self, jobm, 'foo') == 'BAR'
+
+
+def test__schema_clean_does_not_modify_arguments():
+
+    @accepts(Dict('data', Dict('nested', Int('foo', default=1)), List('items', items=[Int('item')]), Dict(
+        'extra', additional_attrs=True,
+    )))
+    def dictv(self, data):
+        data['nested']['bar'] = 2
+        data['items'].append(4)
+        data['extra']['options']['baz'] = 3
+        return data
+
+    self = Mock()
+    data = {'nested': {}, 'items': ['1', 2], 'extra': {'options': {}}}
+
+    assert dictv(self, data) == {
+        'nested': {'foo': 1, 'bar': 2}, 'items': [1, 2, 4], 'extra': {'options': {'baz': 3}},
+    }
+    assert data == {'nested': {}, 'items': ['1', 2], 'extra': {'options': {}}}
+
+
+def test__schema_trusted_skips_validation():
+
+    @accepts(Str('foo', max_length=2), Int('bar', default=1))
+    def strv(self, foo, bar):
+        return foo, bar
+
+    self = Mock()
+
+    with pytest.raises(ValidationErrors):
+        strv(self, 'foobar')
+
+    assert strv.trusted(self, 'foobar') == ('foobar', 1)
+
+
+def test__schema_list_needs_validation():
+    assert not List('items', items=[Int('item')]).needs_validation()
+    assert List('items', items=[Int('item')], unique=True).needs_validation()
+    assert List('items', items=[Int('item', validators=[Range(min=1)])]).needs_validation()
+    assert List('items', items=[Str('item')]).needs_validation()
+
+
+def test__schema_list_validation_skipped_only_when_unneeded():
+
+    @accepts(List('numbers', items=[Int('number')]), List('unique', items=[Int('number')], unique=True))
+    def listv(self, numbers, unique):
+        return numbers, unique
+
+    self = Mock()
+
+    assert listv(self, ['1', 2], [1, 2]) == ([1, 2], [1, 2])
+    with pytest.raises(ValidationErrors):
+        listv(self, [1], [1, 1])
@@ -0,0 +1,22 @@
+# -*- coding=utf-8 -*-
+import os
+from unittest.mock import patch
+
+from middlewared.worker import dump_result, load_result, ResultFile, RESULTS_CHUNK_SIZE
+
+
+def test__dump_result_small_inline(tmpdir):
+    with patch("middlewared.worker.RESULTS_DIR", str(tmpdir)):
+        assert dump_result(iter([{"id": 1}, {"id": 2}])) == [{"id": 1}, {"id": 2}]
+
+    assert os.listdir(str(tmpdir)) == []
+
+
+def test__dump_result_spooled(tmpdir):
+    data = [{"id": i} for i in range(RESULTS_CHUNK_SIZE * 2 + 1)]
+    with patch("middlewared.worker.RESULTS_DIR", str(tmpdir)):
+        result = dump_result(i for i in data)
+
+    assert isinstance(result, ResultFile)
+    assert load_result(result) == data
+    assert os.listdir(str(tmpdir)) == []
@@ -1,3 +1,8 @@
+import random
+import re
+
+import pytest
+
 from middlewared.utils import filter_list
 
 
@@ -84,3 +89,94 @@ def test__filter_list_OR_eq2():
         ['number', '=', 1],
         ['number', '=', 2],
     ]]])) == 2
+
+
+def test__filter_list_generator():
+    assert filter_list(iter(DATA), [], {'count': True}) == 3
+    assert filter_list(iter(DATA), [['number', '>', 1]], {'get': True})['foo'] == 'foo2'
+
+
+def test__filter_list_order_by():
+    assert [i['number'] for i in filter_list(DATA, [], {'order_by': ['-number']})] == [3, 2, 1]
+    assert [i['number'] for i in filter_list(DATA, [], {'order_by': ['foo']})] == [3, 1, 2]
+
+
+def test__filter_list_order_by_multiple():
+    data = [{'a': 1, 'b': 2}, {'a': 2, 'b': 1}, {'a': 1, 'b': 1}]
+    # Last `order_by` entry is the primary key
+    assert filter_list(data, [], {'order_by': ['a', 'b']}) == [{'a': 1, 'b': 1}, {'a': 2, 'b': 1}, {'a': 1, 'b': 2}]
+    assert filter_list(data, [], {'order_by': ['-a', 'b']}) == [{'a': 2, 'b': 1}, {'a': 1, 'b': 1}, {'a': 1, 'b': 2}]
+
+
+def test__filter_list_order_by_limit():
+    assert filter_list(DATA, [], {'order_by': ['-number'], 'offset': 1, 'limit': 1}) == [DATA[1]]
+    assert filter_list(DATA, [], {'order_by': ['number'], 'get': True}) == DATA[0]
+
+
+def test__filter_list_select():
+    assert filter_list(DATA, [['number', '=', 1]], {'select': ['foo', 'missing']}) == [{'foo': 'foo1'}]
+
+
+def test__filter_list_nested():
+    assert filter_list([{'a': {'b': 1}}, {'a': {'b': 2}}], [['a.b', '=', 2]]) == [{'a': {'b': 2}}]
+
+
+def dataset(i):
+    pool = f'pool{i % 4}'
+    return {
+        'id': f'{pool}/dataset{i}',
+        'name': f'{pool}/dataset{i}',
+        'pool': pool,
+        'type': 'VOLUME' if i % 10 == 0 else 'FILESYSTEM',
+        'encrypted': i % 3 == 0,
+        'used': {'parsed': random.randint(0, 1024 ** 4), 'source': 'NONE'},
+        'quota': {'parsed': None if i % 2 else 1024 ** 3, 'source': 'LOCAL'},
+        'properties': {'compression': {'value': 'lz4' if i % 5 else 'off'}},
+    }
+
+
+def reference_get(row, name):
+    for key in name.split('.'):
+        row = row[key]
+    return row
+
+
+def reference_match(row, f):
+    if f[0] == 'OR':
+        return any(reference_match(row, child) for child in f[1])
+
+    name, op, value = f
+    actual = reference_get(row, name)
+    return {
+        '=': lambda: actual == value,
+        '!=': lambda: actual != value,
+        '~': lambda: re.match(value, actual) is not None,
+    }[op]()
+
+
+@pytest.mark.parametrize('filters,options', [
+    ([['pool', '=', 'pool1']], {}),
+    ([['properties.compression.value', '=', 'off'], ['type', '=', 'FILESYSTEM']], {}),
+    ([['name', '~', r'^pool2/dataset1\d*5$']], {}),
+    ([['OR', [['encrypted', '=', True], ['quota.parsed', '!=', None]]]], {}),
+    ([], {'order_by': ['-type', 'name']}),
+    ([], {'order_by': ['name'], 'limit': 50}),
+    ([['id', '=', 'pool0/dataset100']], {'get': True}),
+    ([['type', '=', 'VOLUME']], {'count': True}),
+])
+def test__filter_list_matches_reference(filters, options):
+    random.seed(0)
+    datasets = [dataset(i) for i in range(2000)]
+
+    expected = [row for row in datasets if all(reference_match(row, f) for f in filters)]
+    # `order_by` is a series of stable sorts
+    for o in options.get('order_by') or []:
+        expected.sort(key=lambda row: reference_get(row, o.lstrip('-')), reverse=o.startswith('-'))
+    if options.get('limit'):
+        expected = expected[:options['limit']]
+    if options.get('count'):
+        expected = len(expected)
+    elif options.get('get'):
+        expected = expected[0]
+
+    assert filter_list(datasets, filters, options) == expected
@@ -0,0 +1,16 @@
+from middlewared.utils.procpool import MethodStats
+
+
+def test__method_stats_histogram():
+    stats = MethodStats()
+    stats.add(0.005, 0.1)
+    stats.add(0.3, 0.2)
+    stats.add(120, 0)
+
+    dump = stats.dump()
+    assert dump['calls'] == 3
+    assert dump['runtime_max'] == 120
+    assert dump['wait_time_max'] == 0.2
+    assert [i['count'] for i in dump['runtime_histogram'] if i['count']] == [1, 1, 1]
+    assert dump['runtime_histogram'][0] == {'le': 0.01, 'count': 1}
+    assert dump['runtime_histogram'][-1] == {'le': None, 'count': 1}
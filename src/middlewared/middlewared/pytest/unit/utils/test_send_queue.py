@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from middlewared.utils.send_queue import SendQueue
+
+
+async def drain(queue):
+    await asyncio.sleep(0)
+    while queue.sender is not None:
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test__send_queue_order():
+    sent = []
+
+    async def send(data):
+        sent.append(data)
+
+    queue = SendQueue(asyncio.get_event_loop(), send)
+    queue.put('a')
+    queue.put_event('b')
+    queue.put('c')
+    await drain(queue)
+
+    assert sent == ['a', 'b', 'c']
+
+
+@pytest.mark.asyncio
+async def test__send_queue_coalesce():
+    sent = []
+
+    async def send(data):
+        sent.append(data)
+
+    queue = SendQueue(asyncio.get_event_loop(), send)
+    queue.put_event('changed 1', ('job', 1))
+    queue.put_event('removed 2')
+    queue.put_event('changed 1 again', ('job', 1))
+    await drain(queue)
+
+    assert sent == ['removed 2', 'changed 1 again']
+    assert queue.stats()['coalesced'] == 1
+
+
+@pytest.mark.asyncio
+async def test__send_queue_drops_oldest_events():
+    sent = []
+
+    async def send(data):
+        sent.append(data)
+
+    queue = SendQueue(asyncio.get_event_loop(), send, max_events=2)
+    queue.put_event('event 1')
+    queue.put('result')
+    queue.put_event('event 2')
+    queue.put_event('event 3')
+    await drain(queue)
+
+    assert sent == ['result', 'event 2', 'event 3']
+    assert queue.stats()['dropped'] == 1
@@ -2,8 +2,6 @@ from aiohttp import web
 from collections import defaultdict
 
 import asyncio
-import base64
-import binascii
 import copy
 import traceback
 import types
@@ -21,25 +19,7 @@ async def authenticate(middleware, req):
     if auth is None:
         raise web.HTTPUnauthorized()
 
-    if auth.startswith('Basic '):
-        try:
-            username, password = base64.b64decode(auth[6:]).decode('utf8').split(':', 1)
-        except binascii.Error:
-            raise web.HTTPUnauthorized()
-
-        try:
-            if not await middleware.call('auth.check_user', username, password):
-                raise web.HTTPUnauthorized()
-        except web.HTTPUnauthorized:
-            raise
-        except Exception:
-            raise web.HTTPUnauthorized()
-    elif auth.startswith('Bearer '):
-        key = auth.split(' ', 1)[1]
-
-        if await middleware.call('api_key.authenticate', key) is None:
-            raise web.HTTPUnauthorized()
-    else:
+    if not await middleware.call('auth.check_authorization', auth):
         raise web.HTTPUnauthorized()
 
 
@@ -12,6 +12,19 @@ from middlewared.service_exception import ValidationErrors
 NOT_PROVIDED = object()
 
 
+def copy_value(value):
+    """
+    Faster `copy.deepcopy` for JSON-like arguments (only containers are copied, values are immutable).
+    """
+    if isinstance(value, dict):
+        return {k: copy_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [copy_value(v) for v in value]
+    if isinstance(value, tuple):
+        return tuple(copy_value(v) for v in value)
+    return value
+
+
 class Schemas(dict):
 
     def add(self, schema):
@@ -76,7 +89,7 @@ class Attribute(object):
             raise Error(self.name, 'null not allowed')
         if value is NOT_PROVIDED:
             if self.has_default:
-                return copy.deepcopy(self.default)
+                return copy_value(self.default)
             else:
                 raise Error(self.name, 'attribute required')
         return value
@@ -102,6 +115,12 @@ class Attribute(object):
         if verrors:
             raise verrors
 
+    def needs_validation(self):
+        """
+        Whether `validate` can ever raise for this attribute, so compiled validators can skip it otherwise.
+        """
+        return bool(self.validators) or type(self).validate is not Attribute.validate
+
     def to_json_schema(self, parent=None):
         """This method should return the json-schema v4 equivalent for the
         given attribute.
@@ -135,6 +154,9 @@ class Attribute(object):
 
 class Any(Attribute):
 
+    def clean(self, value):
+        return copy_value(super().clean(value))
+
     def to_json_schema(self, parent=None):
         schema = {
             'anyOf': [
@@ -452,27 +474,36 @@ class List(EnumMixin, Attribute):
     def clean(self, value):
         value = super(List, self).clean(value)
         if value is None:
-            return copy.deepcopy(self.default)
+            return copy_value(self.default)
         if not isinstance(value, list):
             raise Error(self.name, 'Not a list')
         if not self.empty and not value:
             raise Error(self.name, 'Empty value not allowed')
-        if self.items:
-            for index, v in enumerate(value):
-                for i in self.items:
-                    try:
-                        value[index] = i.clean(v)
-                        found = True
-                        break
-                    except Error as e:
-                        found = e
-                if self.items and found is not True:
-                    raise Error(self.name, 'Item#{0} is not valid per list types: {1}'.format(index, found))
+        # Never modify caller's list, only items that are not cleaned by a schema need to be deep copied
+        if not self.items:
+            return copy_value(value)
+        value = list(value)
+        for index, v in enumerate(value):
+            for i in self.items:
+                try:
+                    value[index] = i.clean(v)
+                    found = True
+                    break
+                except Error as e:
+                    found = e
+            if found is not True:
+                raise Error(self.name, 'Item#{0} is not valid per list types: {1}'.format(index, found))
         return value
 
     def has_private(self):
         return self.private or any(item.has_private() for item in self.items)
 
+    def needs_validation(self):
+        return (
+            self.unique or bool(self.validators) or type(self).validate is not List.validate or
+            any(item.needs_validation() for item in self.items)
+        )
+
     def dump(self, value):
         if self.has_private():
             return '********'
@@ -582,6 +613,9 @@ class Dict(Attribute):
     def has_private(self):
         return self.private or any(i.has_private() for i in self.attrs.values())
 
+    def needs_validation(self):
+        return type(self).validate is not Dict.validate or any(i.needs_validation() for i in self.attrs.values())
+
     def clean(self, data):
         data = super().clean(data)
 
@@ -589,19 +623,21 @@ class Dict(Attribute):
             if self.null:
                 return None
 
-            return copy.deepcopy(self.default)
+            return copy_value(self.default)
 
         self.errors = []
         if not isinstance(data, dict):
             raise Error(self.name, 'A dict was expected')
 
+        # Never modify caller's dict, only values that are not cleaned by a schema need to be deep copied
+        data = data.copy()
         for key, value in list(data.items()):
-            if not self.additional_attrs:
-                if key not in self.attrs:
-                    raise Error(key, 'Field was not expected')
-
             attr = self.attrs.get(key)
             if not attr:
+                if not self.additional_attrs:
+                    raise Error(key, 'Field was not expected')
+
+                data[key] = copy_value(value)
                 continue
 
             data[key] = attr.clean(value)
@@ -915,52 +951,39 @@ def accepts(*schema):
             args_index += f._skip_arg
         assert len(schema) == f.__code__.co_argcount - args_index  # -1 for self
 
-        def clean_and_validate_args(args, kwargs):
+        def compile_args():
+            # Schemas are resolved once all plugins are loaded so we compile them on first call.
+            # Attributes are mapped to their positional/keyword argument and those which can never fail
+            # validation are not walked again on every call.
+            compiled = []
+            for i, attr in enumerate(nf.accepts):
+                if not isinstance(attr, Attribute):
+                    raise ResolverError(f'{f.__name__} arguments schema is not resolved')
+
+                compiled.append((attr, f.__code__.co_varnames[args_index + i], attr.needs_validation()))
+            nf.compiled = compiled
+            return compiled
+
+        def clean_and_validate_args(args, kwargs, trusted=False):
+            # `clean` never modifies data it was passed so caller's arguments do not need to be copied
+            compiled = nf.compiled or compile_args()
             args = list(args)
-            args = args[:args_index] + copy.deepcopy(args[args_index:])
-            kwargs = copy.deepcopy(kwargs)
+            kwargs = kwargs.copy()
 
             verrors = ValidationErrors()
 
-            # Iterate over positional args first, excluding self
-            i = 0
-            for _ in args[args_index:]:
-                attr = nf.accepts[i]
-
-                value = attr.clean(args[args_index + i])
-                args[args_index + i] = value
-
-                try:
-                    attr.validate(value)
-                except ValidationErrors as e:
-                    verrors.extend(e)
-
-                i += 1
-
-            # Use i counter to map keyword argument to rpc positional
-            for x in list(range(i + args_index, f.__code__.co_argcount)):
-                kwarg = f.__code__.co_varnames[x]
-
-                if kwarg in kwargs:
-                    attr = nf.accepts[i]
-                    i += 1
-
-                    value = kwargs[kwarg]
-                elif len(nf.accepts) >= i + 1:
-                    attr = nf.accepts[i]
-                    i += 1
-                    value = NOT_PROVIDED
+            # Iterate over positional args first, excluding self, then map keyword arguments to rpc positional
+            for i, (attr, kwarg, needs_validation) in enumerate(compiled):
+                if args_index + i < len(args):
+                    value = args[args_index + i] = attr.clean(args[args_index + i])
                 else:
-                    i += 1
-                    continue
+                    value = kwargs[kwarg] = attr.clean(kwargs.get(kwarg, NOT_PROVIDED))
 
-                value = attr.clean(value)
-                kwargs[kwarg] = value
-
-                try:
-                    attr.validate(value)
-                except ValidationErrors as e:
-                    verrors.extend(e)
+                if needs_validation and not trusted:
+                    try:
+                        attr.validate(value)
+                    except ValidationErrors as e:
+                        verrors.extend(e)
 
             if verrors:
                 raise verrors
@@ -971,16 +994,28 @@ def accepts(*schema):
             async def nf(*args, **kwargs):
                 args, kwargs = clean_and_validate_args(args, kwargs)
                 return await f(*args, **kwargs)
+
+            async def trusted_nf(*args, **kwargs):
+                args, kwargs = clean_and_validate_args(args, kwargs, trusted=True)
+                return await f(*args, **kwargs)
         else:
             def nf(*args, **kwargs):
                 args, kwargs = clean_and_validate_args(args, kwargs)
                 return f(*args, **kwargs)
 
+            def trusted_nf(*args, **kwargs):
+                args, kwargs = clean_and_validate_args(args, kwargs, trusted=True)
+                return f(*args, **kwargs)
+
         from middlewared.utils.type import copy_function_metadata
         copy_function_metadata(f, nf)
         nf.accepts = list(schema)
+        nf.compiled = None
         nf.wraps = f
         nf.wrap = wrap
+        # Used by internal calls which arguments are known to be valid, see `Middleware.call(..., trusted=True)`
+        nf.trusted = trusted_nf
+        trusted_nf.nf = nf
 
         return nf
 
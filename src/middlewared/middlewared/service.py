@@ -193,6 +193,15 @@ def filterable(fn):
     return accepts(Ref('query-filters'), Ref('query-options'))(fn)
 
 
+def batch_extend(fn):
+    """
+    `datastore.query` will call this `extend` method once with the list of all rows (and the `extend_context`
+    value, if any) instead of calling it for every row. Method must return the list of extended rows.
+    """
+    fn._batch_extend = True
+    return fn
+
+
 class ServiceBase(type):
     """
     Metaclass of all services
@@ -208,8 +217,10 @@ class ServiceBase(type):
 
     Currently the following options are allowed:
       - datastore: name of the datastore mainly used in the service
-      - datastore_extend: datastore `extend` option used in common `query` method
+      - datastore_extend: datastore `extend` option used in common `query` method (see `batch_extend`)
       - datastore_prefix: datastore `prefix` option used in helper methods
+      - datastore_config_cache: cache `ConfigService.config` result until its datastore is written to (set to False
+        if `datastore_extend` reads system state or other datastores)
       - service: system service `name` option used by `SystemServiceService`
       - service_model: system service datastore model option used by `SystemServiceService` (`service` if used if not provided)
       - service_verb: verb to be used on update (default to `reload`)
@@ -220,6 +231,8 @@ class ServiceBase(type):
       - verbose_name: human-friendly singular name for the service
       - thread_pool: thread pool to use for threaded methods
       - process_pool: process pool to run service methods
+      - process_pool_max_concurrency: maximum number of process pool workers that can run service methods
+                                      at the same time (defaults to all workers but one)
 
     """
 
@@ -241,6 +254,7 @@ class ServiceBase(type):
             'datastore_prefix': '',
             'datastore_extend': None,
             'datastore_extend_context': None,
+            'datastore_config_cache': True,
             'service': None,
             'service_model': None,
             'service_verb': 'reload',
@@ -250,6 +264,7 @@ class ServiceBase(type):
             'private': False,
             'thread_pool': None,
             'process_pool': None,
+            'process_pool_max_concurrency': None,
             'verbose_name': klass.__name__.replace('Service', ''),
         }
 
@@ -361,14 +376,20 @@ class ConfigService(ServiceChangeMixin, Service):
     @private
     async def _get_or_insert(self, datastore, options):
         try:
-            return await self.middleware.call('datastore.config', datastore, options)
+            return await self._datastore_config(datastore, options)
         except IndexError:
             async with get_or_insert_lock:
                 try:
-                    return await self.middleware.call('datastore.config', datastore, options)
+                    return await self._datastore_config(datastore, options)
                 except IndexError:
                     await self.middleware.call('datastore.insert', datastore, {})
-                    return await self.middleware.call('datastore.config', datastore, options)
+                    return await self._datastore_config(datastore, options)
+
+    async def _datastore_config(self, datastore, options):
+        if self._config.datastore_config_cache:
+            return await self.middleware.call('datastore.config_cached', self._config.namespace, datastore, options)
+
+        return await self.middleware.call('datastore.config', datastore, options, trusted=True)
 
 
 class SystemServiceService(ConfigService):
@@ -434,14 +455,14 @@ class CRUDService(ServiceChangeMixin, Service):
             datastore_options.pop('count', None)
             datastore_options.pop('get', None)
             result = await self.middleware.call(
-                'datastore.query', self._config.datastore, [], datastore_options
+                'datastore.query', self._config.datastore, [], datastore_options, trusted=True,
             )
             return await self.middleware.run_in_thread(
                 filter_list, result, filters, options
             )
         else:
             return await self.middleware.call(
-                'datastore.query', self._config.datastore, filters, options,
+                'datastore.query', self._config.datastore, filters, options, trusted=True,
             )
 
     @pass_app(rest=True)
@@ -639,6 +660,7 @@ class CoreService(Service):
                 ),
                 'authenticated': i.authenticated,
                 'call_count': i._softhardsemaphore.counter,
+                'send_queue': i._send_queue.stats(),
             }
             for i in self.middleware.get_wsclients().values()
         ], filters, options)
@@ -669,6 +691,34 @@ class CoreService(Service):
         ], filters, options)
         return jobs
 
+    @filterable
+    def procpool_workers(self, filters=None, options=None):
+        """
+        Get statistics of process pool workers.
+
+        `connects` and `reconnects` count connections each worker established back to middlewared,
+        `calls` and `call_time` (seconds) account for the calls it made through that connection and
+        `executed` is the number of methods it has run.
+        """
+        return filter_list([
+            dict(
+                stats,
+                call_time_avg=stats['call_time'] / stats['calls'] if stats['calls'] else 0.0,
+            )
+            for stats in list(self.middleware.get_procpool_workers_stats().values())
+        ], filters, options)
+
+    @accepts()
+    def procpool_stats(self):
+        """
+        Get process pool statistics.
+
+        `queued` is the number of calls waiting for a free worker. `methods` contains, for every method run in the
+        process pool, the number of calls, total and maximum time spent waiting for a worker and running (seconds)
+        and a runtime histogram (`le` is the upper bound of the bucket in seconds, `null` for the last one).
+        """
+        return self.middleware.get_procpool_stats()
+
     @accepts(Int('id'))
     @job()
     def job_wait(self, job, id):
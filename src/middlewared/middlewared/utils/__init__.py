@@ -1,8 +1,10 @@
 import asyncio
+import heapq
 import importlib
 import inspect
 import itertools
 import logging
+import operator
 import os
 import sys
 import re
@@ -99,114 +101,170 @@ def get(obj, path):
     return cur
 
 
-def filter_list(_list, filters=None, options=None):
+FILTER_OPMAP = {
+    '=': operator.eq,
+    '!=': operator.ne,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    # `y` is a regular expression compiled by `compile_filter`
+    '~': lambda x, y: y.match(x),
+    'in': lambda x, y: x in y,
+    'nin': lambda x, y: x not in y,
+    'rin': lambda x, y: x is not None and y in x,
+    'rnin': lambda x, y: x is not None and y not in x,
+    '^': lambda x, y: x is not None and x.startswith(y),
+    '!^': lambda x, y: x is not None and not x.startswith(y),
+    '$': lambda x, y: x is not None and x.endswith(y),
+    '!$': lambda x, y: x is not None and not x.endswith(y),
+}
+
+
+def filter_getter(name):
+    """
+    Build a function returning `name` (in `get` dot notation) of a dict or attribute `name` of any other object.
+    """
+    if '.' not in name:
+        def getter(i):
+            if isinstance(i, dict):
+                return i.get(name)
+            return getattr(i, name)
+
+        return getter
+
+    path = []
+    right = name
+    while right:
+        left, right = partition(right)
+        path.append(left)
+
+    def getter(i):
+        if not isinstance(i, dict):
+            return getattr(i, name)
+        cur = i
+        for left in path:
+            if isinstance(cur, dict):
+                cur = cur.get(left)
+            elif isinstance(cur, (list, tuple)):
+                left = int(left)
+                cur = cur[left] if left < len(cur) else None
+        return cur
+
+    return getter
+
+
+def compile_filter(f):
+    """
+    Compile a single filter (`[name, op, value]` or `['OR', [filter, ...]]`) into a predicate.
+    """
+    if len(f) == 2:
+        op, value = f
+        if op != 'OR':
+            raise ValueError(f'Invalid operation: {op}')
+        predicates = [compile_filter(f) for f in value]
+        return lambda i: any(predicate(i) for predicate in predicates)
+
+    if len(f) != 3:
+        raise ValueError(f'Invalid filter {f}')
+    name, op, value = f
+    if op not in FILTER_OPMAP:
+        raise ValueError('Invalid operation: {}'.format(op))
+    if op == '~':
+        value = re.compile(value)
+
+    getter = filter_getter(name)
+    opfunc = FILTER_OPMAP[op]
+    return lambda i: bool(opfunc(getter(i), value))
+
+
+def filter_fields(filters):
+    """
+    Top level field names referenced by `filters`.
+    """
+    fields = set()
+    for f in filters:
+        if len(f) == 2:
+            fields |= filter_fields(f[1])
+        else:
+            fields.add(f[0].split('.')[0])
+    return fields
+
+
+def filter_select(i, select):
+    return {s: i[s] for s in select if s in i}
+
 
-    opmap = {
-        '=': lambda x, y: x == y,
-        '!=': lambda x, y: x != y,
-        '>': lambda x, y: x > y,
-        '>=': lambda x, y: x >= y,
-        '<': lambda x, y: x < y,
-        '<=': lambda x, y: x <= y,
-        '~': lambda x, y: re.match(y, x),
-        'in': lambda x, y: x in y,
-        'nin': lambda x, y: x not in y,
-        'rin': lambda x, y: x is not None and y in x,
-        'rnin': lambda x, y: x is not None and y not in x,
-        '^': lambda x, y: x is not None and x.startswith(y),
-        '!^': lambda x, y: x is not None and not x.startswith(y),
-        '$': lambda x, y: x is not None and x.endswith(y),
-        '!$': lambda x, y: x is not None and not x.endswith(y),
-    }
-
-    if filters is None:
-        filters = {}
+def filter_order(rows, order_by, n=None):
+    """
+    Sort `rows` according to `order_by` returning at most `n` first rows (if given).
+
+    `order_by` entries are applied as a series of stable sorts would be, so the last entry is the primary
+    sort key. When all entries share the same direction this is a single sort by a tuple key (or a heap
+    selection if only `n` first rows are needed).
+    """
+    keys = []
+    for o in reversed(order_by):
+        if o.startswith('-'):
+            keys.append((o[1:], True))
+        else:
+            keys.append((o, False))
+
+    directions = {reverse for name, reverse in keys}
+    if len(directions) == 1:
+        reverse = directions.pop()
+        key = operator.itemgetter(*[name for name, reverse in keys])
+        if n is not None:
+            return (heapq.nlargest if reverse else heapq.nsmallest)(n, rows, key=key)
+        return sorted(rows, key=key, reverse=reverse)
+
+    for name, reverse in reversed(keys):
+        rows = sorted(rows, key=operator.itemgetter(name), reverse=reverse)
+    return rows if n is None else rows[:n]
+
+
+def filter_list(_list, filters=None, options=None):
     if options is None:
         options = {}
 
+    predicates = [compile_filter(f) for f in filters or []]
     select = options.get('select')
+    order_by = options.get('order_by')
+    offset = options.get('offset') or 0
+    limit = options.get('limit') or None
 
-    rv = []
-    if filters:
-
-        def filterop(f):
-            if len(f) != 3:
-                raise ValueError(f'Invalid filter {f}')
-            name, op, value = f
-            if op not in opmap:
-                raise ValueError('Invalid operation: {}'.format(op))
-            if isinstance(i, dict):
-                source = get(i, name)
-            else:
-                source = getattr(i, name)
-            if opmap[op](source, value):
-                return True
-            return False
-
-        for i in _list:
-            valid = True
-            for f in filters:
-                if len(f) == 2:
-                    op, value = f
-                    if op == 'OR':
-                        for f in value:
-                            if filterop(f):
-                                break
-                        else:
-                            valid = False
-                            break
-                    else:
-                        raise ValueError(f'Invalid operation: {op}')
-                elif not filterop(f):
-                    valid = False
-                    break
-
-            if not valid:
-                continue
-            if select:
-                entry = {}
-                for s in select:
-                    if s in i:
-                        entry[s] = i[s]
-            else:
-                entry = i
-            rv.append(entry)
-            if options.get('get') is True:
-                return entry
-    elif select:
-        rv = []
-        for i in _list:
-            entry = {}
-            for s in select:
-                if s in i:
-                    entry[s] = i[s]
-            rv.append(entry)
-    else:
-        rv = _list
+    rv = _list
+    if len(predicates) == 1:
+        rv = filter(predicates[0], rv)
+    elif predicates:
+        rv = (i for i in rv if all(predicate(i) for predicate in predicates))
 
     if options.get('count') is True:
-        return len(rv)
-
-    if options.get('order_by'):
-        for o in options.get('order_by'):
-            if o.startswith('-'):
-                o = o[1:]
-                reverse = True
-            else:
-                reverse = False
-            rv = sorted(rv, key=lambda x: x[o], reverse=reverse)
+        if isinstance(rv, list):
+            return len(rv)
+        return sum(1 for i in rv)
+
+    if order_by:
+        if options.get('get') is True:
+            n = 1
+        elif limit:
+            n = offset + limit
+        else:
+            n = None
+        rv = filter_order(rv, order_by, n)
 
     if options.get('get') is True:
-        try:
-            return rv[0]
-        except IndexError:
-            raise MatchNotFound()
+        for i in rv:
+            return filter_select(i, select) if select else i
+        raise MatchNotFound()
 
-    if options.get('offset'):
-        rv = rv[options['offset']:]
+    if not isinstance(rv, list):
+        rv = list(itertools.islice(rv, offset, offset + limit if limit else None))
+    elif offset or limit:
+        rv = rv[offset:offset + limit if limit else None]
 
-    if options.get('limit'):
-        return rv[:options['limit']]
+    if select:
+        return [filter_select(i, select) for i in rv]
 
     return rv
 
@@ -0,0 +1,190 @@
+import asyncio
+import bisect
+import concurrent.futures
+import concurrent.futures.process
+import functools
+import logging
+import os
+import time
+
+from middlewared.utils import start_daemon_thread
+
+logger = logging.getLogger(__name__)
+
+RUNTIME_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class MethodStats:
+    def __init__(self):
+        self.calls = 0
+        self.runtime = 0.0
+        self.runtime_max = 0.0
+        self.wait_time = 0.0
+        self.wait_time_max = 0.0
+        self.histogram = [0] * (len(RUNTIME_BUCKETS) + 1)
+
+    def add(self, runtime, wait_time):
+        self.calls += 1
+        self.runtime += runtime
+        self.runtime_max = max(self.runtime_max, runtime)
+        self.wait_time += wait_time
+        self.wait_time_max = max(self.wait_time_max, wait_time)
+        self.histogram[bisect.bisect_left(RUNTIME_BUCKETS, runtime)] += 1
+
+    def dump(self):
+        return {
+            'calls': self.calls,
+            'runtime': self.runtime,
+            'runtime_max': self.runtime_max,
+            'wait_time': self.wait_time,
+            'wait_time_max': self.wait_time_max,
+            'runtime_histogram': [
+                {'le': le, 'count': count}
+                for le, count in zip(RUNTIME_BUCKETS + (None,), self.histogram)
+            ],
+        }
+
+
+class ProcessPool:
+    """
+    Wraps `ProcessPoolExecutor` used to run `process_pool` services.
+
+    The number of workers is chosen from the CPU count and is re-evaluated (taking into account system
+    load and whether calls had to wait for a free worker) every time the executor is recycled. Executor
+    is recycled once it has run `max_calls` calls or one of its workers has grown past `max_rss` bytes:
+    new calls go to a fresh executor while the old one finishes the calls it was given.
+
+    Calls of a single service can occupy at most `workers - 1` workers (or `max_concurrency` if given)
+    so that e.g. a burst of `zfs.snapshot.query` can't starve `zfs.pool.query`.
+    """
+
+    def __init__(self, initializer, min_workers=3, max_workers=None, max_calls=1000, max_rss=1024 ** 3):
+        self.initializer = initializer
+        self.cpu_count = os.cpu_count() or 1
+        self.min_workers = min_workers
+        self.max_workers = max_workers or max(min_workers, min(self.cpu_count * 2, 16))
+        self.max_calls = max_calls
+        self.max_rss = max_rss
+        self.workers = max(self.min_workers, min(5, self.max_workers))
+
+        self.executor = None
+        self.generation = 0
+        self.generation_calls = 0
+        self.peak_queued = 0
+        self.peak_running = 0
+        self.waiting = 0
+        self.running = 0
+        self.semaphores = {}
+        self.methods_stats = {}
+        self.workers_stats = {}
+
+        self._create_executor()
+
+    def _create_executor(self):
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=self.initializer,
+        )
+        self.generation += 1
+        self.generation_calls = 0
+        self.peak_queued = 0
+        self.peak_running = 0
+        self.semaphores = {}
+        self.workers_stats = {}
+
+    def start(self):
+        self.executor._start_queue_management_thread()
+
+    def recycle(self, reason):
+        try:
+            load = os.getloadavg()[0]
+        except OSError:
+            load = 0.0
+
+        if self.peak_queued > 0 and load < self.cpu_count and self.workers < self.max_workers:
+            self.workers += 1
+        elif self.peak_running < self.workers - 1 and self.workers > self.min_workers:
+            self.workers -= 1
+
+        logger.debug('Recycling process pool (%s), new pool will have %d workers', reason, self.workers)
+
+        executor = self.executor
+        self._create_executor()
+        # Calls already submitted to the old executor are still run, its workers exit afterwards.
+        # `shutdown(wait=False)` can't be used as it closes the call queue before workers are told to exit.
+        start_daemon_thread(target=executor.shutdown)
+        self.start()
+
+    @property
+    def queued(self):
+        return self.waiting + max(0, self.running - self.workers)
+
+    def _semaphore(self, service, max_concurrency):
+        if service not in self.semaphores:
+            self.semaphores[service] = asyncio.Semaphore(max_concurrency or max(1, self.workers - 1))
+        return self.semaphores[service]
+
+    async def run(self, method, *args, **kwargs):
+        loop = asyncio.get_event_loop()
+        retries = 2
+        for i in range(retries):
+            executor = self.executor
+            try:
+                return await loop.run_in_executor(executor, functools.partial(method, *args, **kwargs))
+            except concurrent.futures.process.BrokenProcessPool:
+                if i == retries - 1:
+                    raise
+                if executor is self.executor:
+                    self.recycle('broken process pool')
+
+    async def call(self, name, method, *args, max_concurrency=None):
+        """
+        Run `method` (which is expected to return a `(result, worker_stats)` tuple) on behalf of
+        middleware method `name` and account for it.
+        """
+        submitted = time.monotonic()
+        semaphore = self._semaphore(name.rsplit('.', 1)[0], max_concurrency)
+
+        self.waiting += 1
+        self.peak_queued = max(self.peak_queued, self.queued)
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        generation = self.generation
+        self.running += 1
+        self.peak_running = max(self.peak_running, self.running)
+        self.peak_queued = max(self.peak_queued, self.queued)
+        try:
+            result, stats = await self.run(method, *args)
+        finally:
+            self.running -= 1
+            semaphore.release()
+
+        started = stats.pop('started')
+        runtime = stats.pop('runtime')
+        self.methods_stats.setdefault(name, MethodStats()).add(runtime, max(0.0, started - submitted))
+
+        if generation == self.generation:
+            self.workers_stats[stats['pid']] = stats
+            self.generation_calls += 1
+            if stats['max_rss'] > self.max_rss:
+                self.recycle(f'worker {stats["pid"]} RSS is {stats["max_rss"]} bytes')
+            elif self.generation_calls >= self.max_calls:
+                self.recycle(f'{self.generation_calls} calls were run')
+
+        return result
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'min_workers': self.min_workers,
+            'max_workers': self.max_workers,
+            'generation': self.generation,
+            'generation_calls': self.generation_calls,
+            'running': self.running,
+            'queued': self.queued,
+            'peak_queued': self.peak_queued,
+            'methods': {name: stats.dump() for name, stats in self.methods_stats.items()},
+        }
@@ -0,0 +1,98 @@
+import asyncio
+from collections import OrderedDict
+import itertools
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SendQueue:
+    """
+    Queue of messages waiting to be sent to a websocket client by a single sender task.
+
+    Regular messages (call results, errors, etc) are always delivered. Event messages are best-effort:
+    a pending event with the same `coalesce_key` is superseded by the newer one (which is queued after everything
+    that was put before it, so the order of events is preserved) and, once more than `max_events` events are
+    pending, the oldest pending events are dropped so a slow client can't make middleware accumulate an unbounded
+    amount of data.
+
+    `put` and `put_event` are thread-safe.
+    """
+
+    def __init__(self, loop, send, max_events=1000):
+        self.loop = loop
+        self.send = send
+        self.max_events = max_events
+
+        self.queue = OrderedDict()
+        self.counter = itertools.count()
+        self.events = 0
+        self.sender = None
+        self.closed = False
+
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    def put(self, data):
+        self.loop.call_soon_threadsafe(self._put, (next(self.counter),), data, False)
+
+    def put_event(self, data, coalesce_key=None):
+        key = ('event',) + coalesce_key if coalesce_key is not None else (next(self.counter),)
+        self.loop.call_soon_threadsafe(self._put, key, data, True)
+
+    def close(self):
+        self.closed = True
+        self.queue.clear()
+        self.events = 0
+
+    def stats(self):
+        return {
+            'queued': len(self.queue),
+            'queued_events': self.events,
+            'sent': self.sent,
+            'coalesced': self.coalesced,
+            'dropped': self.dropped,
+        }
+
+    def _put(self, key, data, is_event):
+        if self.closed:
+            return
+
+        if self.queue.pop(key, None) is not None:
+            self.coalesced += 1
+        elif is_event:
+            self.events += 1
+            if self.events > self.max_events:
+                self._drop_oldest_event()
+
+        self.queue[key] = (data, is_event)
+
+        if self.sender is None:
+            self.sender = asyncio.ensure_future(self._send_loop())
+
+    def _drop_oldest_event(self):
+        for key, (data, is_event) in self.queue.items():
+            if is_event:
+                self.queue.pop(key)
+                self.events -= 1
+                self.dropped += 1
+                return
+
+    async def _send_loop(self):
+        try:
+            while self.queue:
+                key, (data, is_event) = self.queue.popitem(last=False)
+                if is_event:
+                    self.events -= 1
+
+                try:
+                    await self.send(data)
+                except Exception as e:
+                    logger.debug('Failed to send message, closing send queue: %r', e)
+                    self.close()
+                    break
+
+                self.sent += 1
+        finally:
+            self.sender = None
@@ -3,8 +3,15 @@ from middlewared.client import Client
 
 import asyncio
 import inspect
+import itertools
 import os
+import pickle
+import resource
 import setproctitle
+import shutil
+import tempfile
+import threading
+import time
 
 from . import logger
 from .common.environ import environ_update
@@ -13,6 +20,60 @@ import middlewared.utils.osc as osc
 from .utils.service.call import ServiceCallMixin
 
 MIDDLEWARE = None
+INTERNAL_SOCKET = 'ws+unix:///var/run/middlewared-internal.sock'
+RESULTS_DIR = '/tmp/middlewared/procpool'
+RESULTS_CHUNK_SIZE = 1000
+
+
+class ResultFile(object):
+    """
+    Placeholder returned through the process pool pipe for results which were spooled to a file
+    in `RESULTS_DIR` as a sequence of pickled chunks.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+
+def dump_result(iterable):
+    """
+    Results with up to `RESULTS_CHUNK_SIZE` items are returned as a list to be sent inline.
+    Bigger ones (including generators, which are consumed lazily) are written to a temporary
+    file chunk by chunk so neither process has to keep a pickled copy of the whole result in memory.
+    """
+    iterator = iter(iterable)
+    chunk = list(itertools.islice(iterator, RESULTS_CHUNK_SIZE))
+    if len(chunk) < RESULTS_CHUNK_SIZE:
+        return chunk
+
+    fd, path = tempfile.mkstemp(prefix='result-', dir=RESULTS_DIR)
+    try:
+        with open(fd, 'wb') as f:
+            while chunk:
+                pickle.dump(chunk, f, protocol=pickle.HIGHEST_PROTOCOL)
+                chunk = list(itertools.islice(iterator, RESULTS_CHUNK_SIZE))
+    except Exception:
+        os.unlink(path)
+        raise
+    return ResultFile(path)
+
+
+def load_result(result):
+    rv = []
+    try:
+        with open(result.path, 'rb') as f:
+            while True:
+                try:
+                    rv.extend(pickle.load(f))
+                except EOFError:
+                    break
+    finally:
+        os.unlink(result.path)
+    return rv
+
+
+def cleanup_results():
+    shutil.rmtree(RESULTS_DIR, ignore_errors=True)
 
 
 class FakeMiddleware(LoadPluginsMixin, ServiceCallMixin):
@@ -22,23 +83,64 @@ class FakeMiddleware(LoadPluginsMixin, ServiceCallMixin):
 
     def __init__(self, overlay_dirs):
         super().__init__(overlay_dirs)
-        self.client = None
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._subscriptions = {}
+        self.stats = {
+            'pid': os.getpid(),
+            'connects': 0,
+            'reconnects': 0,
+            'executed': 0,
+            'calls': 0,
+            'call_time': 0.0,
+            'call_time_max': 0.0,
+        }
         _logger = logger.Logger('worker')
         self.logger = _logger.getLogger()
         _logger.configure_logging('console')
         self.loop = asyncio.get_event_loop()
 
-    def _call(self, name, serviceobj, methodobj, params=None, app=None, pipes=None, io_thread=False, job=None):
+    @property
+    def client(self):
+        """
+        Long-lived connection to middlewared shared by every call executed in this worker.
+
+        It is established on first use and transparently re-established (along with the event
+        subscriptions) if middlewared closes it.
+        """
+        with self._client_lock:
+            if self._client is None or self._client._closed.is_set():
+                if self._client is not None:
+                    self.stats['reconnects'] += 1
+                    self.logger.debug('Connection to middlewared was lost, reconnecting')
+                self._client = Client(INTERNAL_SOCKET, py_exceptions=True)
+                self.stats['connects'] += 1
+                for name, callback in self._subscriptions.items():
+                    self._client.subscribe(name, callback)
+            return self._client
+
+    def subscribe(self, name, callback):
+        self._subscriptions[name] = callback
+        self.client.subscribe(name, callback)
+
+    def client_call(self, method, *params, **kwargs):
+        client = self.client
+        start = time.monotonic()
         try:
-            with Client('ws+unix:///var/run/middlewared-internal.sock', py_exceptions=True) as c:
-                self.client = c
-                job_options = getattr(methodobj, '_job', None)
-                if job and job_options:
-                    params = list(params) if params else []
-                    params.insert(0, FakeJob(job['id'], self.client))
-                return methodobj(*params)
+            return client.call(method, *params, **kwargs)
         finally:
-            self.client = None
+            elapsed = time.monotonic() - start
+            self.stats['calls'] += 1
+            self.stats['call_time'] += elapsed
+            self.stats['call_time_max'] = max(self.stats['call_time_max'], elapsed)
+
+    def _call(self, name, serviceobj, methodobj, params=None, app=None, pipes=None, io_thread=False, job=None):
+        self.stats['executed'] += 1
+        job_options = getattr(methodobj, '_job', None)
+        if job and job_options:
+            params = list(params) if params else []
+            params.insert(0, FakeJob(job['id'], self))
+        return methodobj(*params)
 
     def _run(self, name, args, job):
         serviceobj, methodobj = self._method_lookup(name)
@@ -58,18 +160,17 @@ class FakeMiddleware(LoadPluginsMixin, ServiceCallMixin):
             self.logger.trace('Calling %r in current process', method)
             return methodobj(*params)
 
-        return self.client.call(method, *params, timeout=timeout, **kwargs)
+        return self.client_call(method, *params, timeout=timeout, **kwargs)
 
     def send_event(self, name, event_type, **kwargs):
-        with Client(py_exceptions=True) as c:
-            return c.call('core.event_send', name, event_type, kwargs)
+        return self.client_call('core.event_send', name, event_type, kwargs)
 
 
 class FakeJob(object):
 
-    def __init__(self, id, client):
+    def __init__(self, id, middleware):
         self.id = id
-        self.client = client
+        self.middleware = middleware
         self.progress = {
             'percent': None,
             'description': None,
@@ -82,33 +183,37 @@ class FakeJob(object):
             self.progress['description'] = description
         if extra:
             self.progress['extra'] = extra
-        self.client.call('core.job_update', self.id, {'progress': self.progress})
+        self.middleware.client_call('core.job_update', self.id, {'progress': self.progress})
 
 
 def main_worker(*call_args):
     global MIDDLEWARE
+    started = time.monotonic()
     try:
         res = MIDDLEWARE._run(*call_args)
     except SystemExit:
         raise RuntimeError('Worker call raised SystemExit exception')
-    # TODO: python cant pickle generator for obvious reasons, we should implement
-    # it using Pipe.
-    if inspect.isgenerator(res):
-        res = list(res)
-    return res
+    if inspect.isgenerator(res) or (isinstance(res, list) and len(res) >= RESULTS_CHUNK_SIZE):
+        res = dump_result(res)
+    return res, dict(
+        MIDDLEWARE.stats,
+        max_rss=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        started=started,
+        runtime=time.monotonic() - started,
+    )
 
 
 def receive_events():
-    c = Client('ws+unix:///var/run/middlewared-internal.sock', py_exceptions=True)
-    c.subscribe('core.environ', lambda *args, **kwargs: environ_update(kwargs['fields']))
-    c.subscribe('core.reconfigure_logging', lambda *args, **kwargs: logger.reconfigure_logging())
+    MIDDLEWARE.subscribe('core.environ', lambda *args, **kwargs: environ_update(kwargs['fields']))
+    MIDDLEWARE.subscribe('core.reconfigure_logging', lambda *args, **kwargs: logger.reconfigure_logging())
 
-    environ_update(c.call('core.environ'))
+    environ_update(MIDDLEWARE.client_call('core.environ'))
 
 
 def worker_init(overlay_dirs, debug_level, log_handler):
     global MIDDLEWARE
     MIDDLEWARE = FakeMiddleware(overlay_dirs)
+    os.makedirs(RESULTS_DIR, mode=0o700, exist_ok=True)
     os.environ['MIDDLEWARED_LOADING'] = 'True'
     MIDDLEWARE._load_plugins()
     os.environ['MIDDLEWARED_LOADING'] = 'False'